@@ -5,6 +5,16 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Deployment profile: run one event loop per CPU core, e.g.
+
+    uvicorn church_website.asgi:application --workers 4
+    gunicorn church_website.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+The defaults below switch the AJAX endpoints to their native async views
+and turn off persistent database connections, which Django doesn't
+support for async code; both can still be overridden from the environment.
+`manage.py benchmark_asgi` compares this profile with the WSGI one.
 """
 
 import os
@@ -12,5 +22,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'church_website.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
@@ -1,4 +1,5 @@
 import os
+from email.utils import getaddresses
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -29,7 +30,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainapp.instrumentation.InstrumentationMiddleware',  # Only with INSTRUMENTATION_ENABLED=1
+    'mainapp.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'mainapp.db_routers.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -57,14 +61,76 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'church_website.wsgi.application'
 
+# Serve the AJAX endpoints from mainapp.async_views; asgi.py turns this on
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql (or mysql) switches to a server database configured
+# by DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT.
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                'timeout': 20,
+                # Take the write lock when a transaction starts; a deferred
+                # transaction that later tries to upgrade fails immediately with
+                # "database is locked" instead of waiting for the timeout.
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # A file-backed test database lets the concurrency tests open one
+            # connection per thread.
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': f'django.db.backends.{DB_ENGINE}',
+            'NAME': os.environ.get('DB_NAME', 'church_website'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+        }
+    }
+
+# Reuse connections (and their pragmas) across requests
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Read replicas: a comma-separated list of hosts, or of database files with
+# SQLite (kept up to date by `manage.py sync_replicas`). Reads go to the
+# replicas, writes to the primary (mainapp.db_routers).
+for i, location in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'HOST' if DB_ENGINE != 'sqlite3' else 'NAME': location.strip(),
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['mainapp.db_routers.PrimaryReplicaRouter']
+DATABASE_ROUTING = {
+    'PRIMARY': 'default',
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': int(os.environ.get('DB_STICKY_SECONDS', '15')),
+}
+
+# Applied to every new SQLite connection (mainapp.sqlite_tuning)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
 }
 
 # Password validation
@@ -106,19 +172,211 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# CSS/JS bundles written by "manage.py build_assets" (mainapp.assets); they
+# are picked up from STATICFILES_DIRS and served under STATIC_URL + 'bundles/'
+ASSET_BUILD_DIR = BASE_DIR / 'static' / 'bundles'
+ASSET_BUILD_PREFIX = 'bundles'
+STATIC_IMAGE_WIDTHS = (480, 960, 1600)
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # collectstatic also writes AVIF/WebP/JPEG widths of static/images
+    # (mainapp.static_images) for {% picture %}
+    'staticfiles': {'BACKEND': 'mainapp.static_images.OptimizedStaticFilesStorage'},
+    # Gallery uploads are stored once per distinct content (mainapp.storage);
+    # unreferenced files are swept with "manage.py gc_media"
+    'media': {'BACKEND': 'mainapp.storage.ContentAddressedStorage'},
+}
+MEDIA_RELEASE_GRACE_SECONDS = 60
+
+# Media serving (mainapp.media_serving). Behind nginx set
+# MEDIA_SENDFILE_BACKEND=x-accel-redirect and an internal location aliasing
+# MEDIA_ROOT at INTERNAL_URL; Apache/lighttpd use x-sendfile.
+MEDIA_SENDFILE = {
+    'BACKEND': os.environ.get('MEDIA_SENDFILE_BACKEND') or None,
+    'INTERNAL_URL': os.environ.get('MEDIA_SENDFILE_INTERNAL_URL', '/protected-media/'),
+}
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60
+
+# Gallery pagination
+GALLERY_PAGE_SIZE = 24
+GALLERY_MAX_PAGE_SIZE = 60
+
+# Prayer moderation queue (mainapp.moderation); the max also caps one bulk action
+MODERATION_PAGE_SIZE = 50
+MODERATION_MAX_PAGE_SIZE = 200
+
+# Prayer JSON API (mainapp.api)
+PRAYER_API_PAGE_SIZE = 20
+PRAYER_API_MAX_PAGE_SIZE = 100
+
+# Chunked, resumable uploads (mainapp.uploads); parts are kept under MEDIA_ROOT
+CHUNKED_UPLOAD_DIR = 'chunked'
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3  # 2 GB per file
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 ** 2
+CHUNKED_UPLOAD_CHUNK_SIZE = 4 * 1024 ** 2  # what the gallery uploader sends
+
+# Background jobs (mainapp.jobqueue): durable, in the Job table. Each web
+# process runs JOB_QUEUE_WORKERS threads; set it to 0 when jobs are run by
+# `manage.py runworker` instead.
+JOB_QUEUE = {
+    'BACKEND': os.environ.get('JOB_QUEUE_BACKEND', 'mainapp.jobqueue.DatabaseJobQueue'),
+    'OPTIONS': {
+        'workers': int(os.environ.get('JOB_QUEUE_WORKERS', '2')),
+        'poll_interval': float(os.environ.get('JOB_QUEUE_POLL_INTERVAL', '5')),
+        'max_attempts': 3,
+        'backoff': 10,
+    },
+    'LANES': {'high': 0, 'default': 10, 'low': 20},
+    'EAGER': False,
+}
+
+# Request timings, query counts/N+1 warnings and sampled cProfile dumps
+# (mainapp.instrumentation); off unless INSTRUMENTATION_ENABLED=1
+INSTRUMENTATION = {
+    'ENABLED': os.environ.get('INSTRUMENTATION_ENABLED', '') == '1',
+    'SAMPLE_RATE': float(os.environ.get('INSTRUMENTATION_SAMPLE_RATE', '0')),
+    'SLOW_REQUEST_MS': int(os.environ.get('INSTRUMENTATION_SLOW_REQUEST_MS', '500')),
+    'PROFILE_DIR': os.environ.get('INSTRUMENTATION_PROFILE_DIR', BASE_DIR / 'profiles'),
+    'DUPLICATE_QUERY_THRESHOLD': 5,
+    'SERVER_TIMING': DEBUG,
+}
+
+# Prometheus metrics at /metrics (mainapp.metrics). With several worker
+# processes set METRICS_DIR to a directory they share, so every scrape
+# sees all of them; without it each process only reports its own numbers
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'BACKEND': (
+        'mainapp.metrics.FileMetricsStore' if os.environ.get('METRICS_DIR') else 'mainapp.metrics.LocalMetricsStore'
+    ),
+    'OPTIONS': {'directory': os.environ['METRICS_DIR']} if os.environ.get('METRICS_DIR') else {},
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+}
+
+# Token-bucket limits on the write endpoints, per client (mainapp.ratelimit).
+# With several worker processes use the SQLite (or a shared cache) store so
+# the workers share the buckets; behind nginx set RATE_LIMIT_PROXY_COUNT=1
+RATE_LIMITS = {
+    'ENABLED': os.environ.get('RATE_LIMITS_ENABLED', '1') == '1',
+    'BACKEND': os.environ.get('RATE_LIMIT_BACKEND', 'mainapp.ratelimit.LocalRateLimitStore'),
+    'OPTIONS': {'location': BASE_DIR / 'ratelimit.sqlite3'},  # For SQLiteRateLimitStore
+    'PROXY_COUNT': int(os.environ.get('RATE_LIMIT_PROXY_COUNT', '0')),
+    'KEY': os.environ.get('RATE_LIMIT_KEY', 'ip'),  # 'user' or 'session' to split shared addresses
+    'RATES': {
+        'prayer_submit': '20/h',      # home, services and the AJAX form together
+        'prayer_increment': '60/m',
+        'contact': '10/h',
+        'upload': '30/h',
+        'delete': '30/m',
+    },
+}
+
+# Double submissions and repeats of a prayer (mainapp.submissions): the same
+# name with the same or a nearly same message within WINDOW is merged into
+# the earlier prayer, or refused with POLICY 'reject'
+DUPLICATE_PRAYERS = {
+    'WINDOW': 24 * 60 * 60,
+    'MAX_DISTANCE': 10,
+    'MIN_SHINGLES': 16,
+    'POLICY': os.environ.get('DUPLICATE_PRAYER_POLICY', 'merge'),
+    'KEY_TTL': 24 * 60 * 60,
+}
+
+# New contact-form messages and prayers awaiting approval are emailed to
+# these addresses ("Name <address>, ...") in digests (mainapp.notifications)
+MANAGERS = [address for address in getaddresses([os.environ.get('CONTACT_NOTIFY_EMAILS', '')]) if address[1]]
+NOTIFICATION_DIGEST = {
+    'INTERVAL': int(os.environ.get('NOTIFICATION_DIGEST_INTERVAL', '600')),
+    'MAX_ITEMS': 100,
+    'SITE_URL': os.environ.get('SITE_URL', ''),
+}
+
+# Email: printed to the console while developing; set EMAIL_BACKEND to
+# django.core.mail.backends.filebased.EmailBackend to keep messages in
+# EMAIL_FILE_PATH instead, or to the SMTP backend in production.
+EMAIL_BACKEND = os.environ.get(
+    'EMAIL_BACKEND',
+    'django.core.mail.backends.console.EmailBackend' if DEBUG else 'django.core.mail.backends.smtp.EmailBackend',
+)
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+EMAIL_TIMEOUT = 10
+SERVER_EMAIL = os.environ.get('SERVER_EMAIL', 'root@localhost')
+# ffprobe/ffmpeg are optional; without them videos are shown without posters
+FFPROBE_BINARY = os.environ.get('FFPROBE_BINARY', 'ffprobe')
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+
+# Prayer counter
+# DirectPrayerCounter writes each click as an atomic UPDATE. Switch to
+# BufferedPrayerCounter (per process) or CachePrayerCounter (shared cache)
+# to coalesce bursts of clicks into periodic batched UPDATEs.
+PRAYER_COUNTER = {
+    'BACKEND': os.environ.get('PRAYER_COUNTER_BACKEND', 'mainapp.counters.DirectPrayerCounter'),
+    'OPTIONS': {},
+}
+if PRAYER_COUNTER['BACKEND'] != 'mainapp.counters.DirectPrayerCounter':
+    PRAYER_COUNTER['OPTIONS'] = {
+        'flush_interval': float(os.environ.get('PRAYER_COUNTER_FLUSH_INTERVAL', '1.0')),
+        'max_pending': int(os.environ.get('PRAYER_COUNTER_MAX_PENDING', '500')),
+    }
+
+# Live prayer wall (mainapp.events). LocalBroker only reaches visitors
+# connected to the same process; use CacheBroker with several workers.
+PRAYER_EVENTS = {
+    'BACKEND': os.environ.get('PRAYER_EVENTS_BACKEND', 'mainapp.events.LocalBroker'),
+    'OPTIONS': {
+        'coalesce_interval': float(os.environ.get('PRAYER_EVENTS_COALESCE_INTERVAL', '1.0')),
+    },
+}
+
+# Full-text search (mainapp.search): FTS5 on SQLite, icontains elsewhere
+SEARCH_BACKEND = {
+    'BACKEND': os.environ.get('SEARCH_BACKEND') or (
+        'mainapp.search.SQLiteFTSBackend' if DB_ENGINE == 'sqlite3' else 'mainapp.search.DatabaseSearchBackend'
+    ),
+    'OPTIONS': {},
+}
+
+# Caching. CACHE_BACKEND picks local memory (per process), files, or a
+# SQLite file shared by every worker on the host (mainapp.cache_backends).
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'church-website',
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+        },
+        'sqlite': {
+            'BACKEND': 'mainapp.cache_backends.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }[CACHE_BACKEND],
+}
+
+# Whole-page and prayer-list caching (mainapp.caching)
+PAGE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+    'PRAYER_LIST_TIMEOUT': 10 * 60,
+    'PRAYER_LIST_SIZE': 10,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
-
-# Serving static files in development
-from django.conf import settings
-from django.conf.urls.static import static
-
-urlpatterns = []  # Define urlpatterns if not already defined
-urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
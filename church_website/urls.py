@@ -1,11 +1,14 @@
+import re
+
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from mainapp import views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('mainapp.urls')),  # This makes 'index' the default page
+    # Media (uploads, variants, posters); see mainapp.media_serving
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), views.serve_media, name='media'),
 ]
-from django.conf import settings
-from django.conf.urls.static import static
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -2,14 +2,25 @@ from django.contrib import admin
 from django.apps import apps
 from django.utils.html import format_html
 from .models import PrayerRequest, MediaFile, ContactMessage
+from .search import get_search_backend
+
+
+class FullTextSearchMixin:
+    """Answer changelist searches from the full-text index (mainapp.search)"""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return get_search_backend().filter(queryset, search_term), False
+
 
 # ===== Custom ModelAdmin classes =====
 
 @admin.register(PrayerRequest)
-class PrayerRequestAdmin(admin.ModelAdmin):
+class PrayerRequestAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'short_message', 'status', 'prayer_count', 'submitted_at', 'updated_at', 'approve_button')
     list_filter = ('approved', 'submitted_at')
-    search_fields = ('name', 'message')
+    search_fields = ('name', 'message')  # shows the search box; see FullTextSearchMixin
     readonly_fields = ('prayer_count', 'submitted_at', 'updated_at')
 
     def short_message(self, obj):
@@ -28,10 +39,16 @@ class PrayerRequestAdmin(admin.ModelAdmin):
 
 @admin.register(MediaFile)
 class MediaFileAdmin(admin.ModelAdmin):
-    list_display = ('filename', 'file_link', 'file_extension', 'is_image', 'is_video', 'uploaded_at')
-    list_filter = ('uploaded_at',)
+    list_display = ('filename', 'file_link', 'kind', 'mime_type', 'size_bytes', 'dimensions', 'uploaded_at')
+    list_filter = ('kind', 'uploaded_at')
     search_fields = ('file',)
-    readonly_fields = ('uploaded_at',)
+    readonly_fields = ('uploaded_at', 'kind', 'mime_type', 'size_bytes', 'width', 'height', 'content_hash')
+
+    def dimensions(self, obj):
+        if obj.width and obj.height:
+            return f'{obj.width}×{obj.height}'
+        return '-'
+    dimensions.short_description = 'Dimensions'
 
     def file_link(self, obj):
         if obj.file:
@@ -40,7 +57,7 @@ class MediaFileAdmin(admin.ModelAdmin):
     file_link.short_description = 'File Link'
 
 @admin.register(ContactMessage)
-class ContactMessageAdmin(admin.ModelAdmin):
+class ContactMessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'subject', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
     search_fields = ('name', 'email', 'subject', 'message')
@@ -0,0 +1,253 @@
+"""
+Read-only JSON API for approved prayers.
+
+    GET /api/prayers/                    newest first, keyset-paginated
+    GET /api/prayers/?cursor=...         the next page (from "next")
+    GET /api/prayers/?fields=id,message  only these fields
+    GET /api/prayers/<id>/
+
+Every response carries an ``ETag`` and ``Last-Modified``. Polling clients
+send them back (``If-None-Match`` / ``If-Modified-Since``) and, while
+nothing changed, get a ``304 Not Modified`` before DRF, the serializer or
+any renderer runs.
+
+For the list that takes one cache read. The cache holds a list version,
+replaced by ``touch_prayer_list`` once any change a page could show
+commits: a prayer saved or deleted, a bulk moderation action, or new
+prayer counts (see ``mainapp.signals``). Writes that bypass all of those,
+like a bare ``QuerySet.update()``, must call it themselves. When the
+version isn't cached it is rebuilt from one aggregate query over the
+approved prayers: their number, the newest id, the latest ``updated_at``
+and the sum of the prayer counts. ``Last-Modified`` is when the version
+last changed, so clients that only use ``If-Modified-Since`` see new
+counts too, though the counters don't touch ``updated_at``. A detail
+response is checked against its row, moved forward by
+``touch_prayer_counts`` for the same reason.
+
+Page sizes come from settings:
+
+    PRAYER_API_PAGE_SIZE = 20
+    PRAYER_API_MAX_PAGE_SIZE = 100
+"""
+import hashlib
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import generics, serializers
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from mainapp.caching import get_cache
+from mainapp.models import PrayerRequest
+from mainapp.pagination import InvalidCursor, paginate_keyset
+
+PRAYER_API_KEYSET = ('submitted_at', 'id')
+
+# When prayer counts last changed; updated_at doesn't move for them
+COUNTS_CHANGED_KEY = 'api:prayers:counts-changed-at'
+
+# {'version': ..., 'changed': timestamp} of the list; see touch_prayer_list
+LIST_VERSION_KEY = 'api:prayers:list-version'
+
+
+def touch_prayer_counts():
+    get_cache().set(COUNTS_CHANGED_KEY, timezone.now().timestamp(), None)
+
+
+def touch_prayer_list():
+    """A list page may have changed: give it a new ETag and Last-Modified"""
+    get_cache().set(LIST_VERSION_KEY, {'version': uuid.uuid4().hex, 'changed': timezone.now().timestamp()}, None)
+
+
+def counts_changed_at():
+    timestamp = get_cache().get(COUNTS_CHANGED_KEY)
+    return datetime.fromtimestamp(timestamp, dt_timezone.utc) if timestamp else None
+
+
+def approved_prayers():
+    return PrayerRequest.objects.filter(approved=True)
+
+
+def latest(*moments):
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+# Serialization
+
+class PrayerSerializer(serializers.ModelSerializer):
+    """Approved prayer; ``fields=`` narrows the output to the requested fields."""
+
+    class Meta:
+        model = PrayerRequest
+        fields = ('id', 'name', 'message', 'submitted_at', 'updated_at', 'prayer_count')
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    """The ``?fields=`` selection, or None for all fields"""
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(fields) - set(PrayerSerializer.Meta.fields))
+    if unknown:
+        raise ValidationError({'fields': f'Unknown field(s): {", ".join(unknown)}.'})
+    return fields
+
+
+class KeysetCursorPagination(BasePagination):
+    """``mainapp.pagination.paginate_keyset`` as a DRF paginator."""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'PRAYER_API_PAGE_SIZE', 20)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param) or default)
+        except ValueError:
+            size = default
+        return max(1, min(size, getattr(settings, 'PRAYER_API_MAX_PAGE_SIZE', 100)))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = paginate_keyset(
+                queryset, PRAYER_API_KEYSET,
+                cursor=request.query_params.get(self.cursor_query_param),
+                page_size=self.get_page_size(request),
+            )
+        except InvalidCursor:
+            raise NotFound('Invalid cursor.')
+        return self.page.items
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+
+# Conditional GET
+
+def list_state():
+    """One aggregate query that changes whenever any page of the list would"""
+    return approved_prayers().aggregate(
+        total=Count('id'), newest=Max('id'), updated=Max('updated_at'), prayed=Sum('prayer_count'),
+    )
+
+
+def list_version():
+    """The cached list version, rebuilt from ``list_state`` when missing"""
+    cache = get_cache()
+    version = cache.get(LIST_VERSION_KEY)
+    if version is None:
+        state = list_state()
+        changed = latest(state['updated'], counts_changed_at())
+        version = {
+            'version': hashlib.sha1(repr(sorted(state.items())).encode()).hexdigest(),
+            'changed': changed.timestamp() if changed else None,
+        }
+        # add(), not set(): a touch_prayer_list() since our query wins
+        if not cache.add(LIST_VERSION_KEY, version, None):
+            version = cache.get(LIST_VERSION_KEY, version)
+    return version
+
+
+def make_etag(request, *parts):
+    # The query string selects page, size and fields, so it's part of the representation
+    digest = hashlib.sha1(repr((*parts, request.GET.urlencode())).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def _list_version(request):
+    # condition() asks for Last-Modified and then the ETag; read once for both
+    if not hasattr(request, '_prayer_list_version'):
+        request._prayer_list_version = list_version()
+    return request._prayer_list_version
+
+
+def list_etag(request):
+    return make_etag(request, _list_version(request)['version'])
+
+
+def list_last_modified(request):
+    changed = _list_version(request)['changed']
+    return datetime.fromtimestamp(changed, dt_timezone.utc) if changed else None
+
+
+def _prayer_version(request, pk):
+    if not hasattr(request, '_prayer_version'):
+        request._prayer_version = (
+            approved_prayers().filter(pk=pk).values_list('updated_at', 'prayer_count').first()
+        )
+    return request._prayer_version
+
+
+def detail_etag(request, pk):
+    version = _prayer_version(request, pk)
+    return make_etag(request, pk, version) if version else None
+
+
+def detail_last_modified(request, pk):
+    version = _prayer_version(request, pk)
+    return latest(version[0], counts_changed_at()) if version else None
+
+
+class PrayerAPIMixin:
+    # Public and read-only: no sessions or users to load, and JSON only, so
+    # nothing here renders a template
+    authentication_classes = []
+    permission_classes = []
+    renderer_classes = [JSONRenderer]
+    serializer_class = PrayerSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, fields=requested_fields(self.request), **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Cache, but ask us (cheaply) before every reuse
+        patch_cache_control(response, no_cache=True)
+        return response
+
+
+@method_decorator(condition(etag_func=list_etag, last_modified_func=list_last_modified), name='dispatch')
+class PrayerList(PrayerAPIMixin, generics.ListAPIView):
+    pagination_class = KeysetCursorPagination
+
+    def get_queryset(self):
+        fields = requested_fields(self.request)
+        if fields is None:
+            return approved_prayers()
+        # The keyset columns are needed for the next cursor
+        return approved_prayers().only(*{*fields, *PRAYER_API_KEYSET})
+
+
+@method_decorator(condition(etag_func=detail_etag, last_modified_func=detail_last_modified), name='dispatch')
+class PrayerDetail(PrayerAPIMixin, generics.RetrieveAPIView):
+    def get_queryset(self):
+        return approved_prayers()
+
+
+prayer_list = PrayerList.as_view()
+prayer_detail = PrayerDetail.as_view()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MainappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mainapp'
+
+    def ready(self):
+        from mainapp import signals, sqlite_tuning  # noqa: F401
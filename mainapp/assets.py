@@ -0,0 +1,350 @@
+"""
+CSS/JavaScript bundles.
+
+The page styles and scripts live as ordinary files under
+``mainapp/static/mainapp/{css,js}``. ``manage.py build_assets`` combines them
+into one file per bundle, minifies it, drops duplicate CSS rules, names it
+after its content hash (``base.3fa2c1d9e0ab.css``) and writes ``.gz`` (and,
+with the optional ``brotli`` package, ``.br``) siblings next to it, plus a
+``manifest.json``. Templates use ``{% stylesheet 'base' %}`` and
+``{% script 'base' %}``; without a build they fall back to the source files.
+
+Because a bundle's name changes whenever its content does, the front
+server can cache them forever, e.g. for nginx:
+
+    location /static/bundles/ {
+        expires max;
+        add_header Cache-Control "public, immutable";
+        gzip_static on;
+        brotli_static on;
+    }
+"""
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is an optional dependency
+    brotli = None
+
+# bundle -> source files (static paths), in the order they are concatenated
+DEFAULT_BUNDLES = {
+    'base.css': ['mainapp/css/base.css'],
+    'base.js': ['mainapp/js/base.js'],
+    # home.html, homepage.html and index.html are standalone pages
+    'landing.css': ['mainapp/css/landing.css'],
+    'landing.js': ['mainapp/js/landing.js'],
+    'services.css': ['mainapp/css/services.css'],
+    'services.js': ['mainapp/js/services.js', 'mainapp/js/prayer-wall.js'],
+    'gallery.css': ['mainapp/css/gallery.css'],
+    'gallery.js': ['mainapp/js/gallery.js'],
+    'events.css': ['mainapp/css/events.css'],
+    'events.js': ['mainapp/js/events.js'],
+    'moderation.js': ['mainapp/js/moderation.js'],
+}
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+
+
+class AssetError(Exception):
+    pass
+
+
+def bundles():
+    return getattr(settings, 'ASSET_BUNDLES', DEFAULT_BUNDLES)
+
+
+def build_dir():
+    return str(getattr(settings, 'ASSET_BUILD_DIR', settings.BASE_DIR / 'static' / 'bundles'))
+
+
+def build_prefix():
+    """Static path of ``build_dir()``, i.e. where its files appear under STATIC_URL."""
+    return getattr(settings, 'ASSET_BUILD_PREFIX', 'bundles')
+
+
+# CSS
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)''', re.S)
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def minify_css(text):
+    """Strip comments and insignificant whitespace, leaving strings alone."""
+    out = []
+    for i, part in enumerate(_CSS_TOKENS.split(text)):
+        if i % 2:
+            if not part.startswith('/*'):
+                out.append(part)
+            continue
+        part = re.sub(r'\s+', ' ', part)
+        part = re.sub(r'\s*([{};,])\s*', r'\1', part)
+        part = re.sub(r':\s+', ':', part)
+        out.append(part)
+    return ''.join(out).replace(';}', '}').strip()
+
+
+def css_blocks(css):
+    """Split minified CSS into top-level statements (rules, @media blocks, @imports)."""
+    blocks, depth, start, quote = [], 0, 0, None
+    for i, char in enumerate(css):
+        if quote:
+            if char == quote and css[i - 1] != '\\':
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                blocks.append(css[start:i + 1])
+                start = i + 1
+        elif char == ';' and depth == 0:
+            blocks.append(css[start:i + 1])
+            start = i + 1
+    if css[start:].strip():
+        blocks.append(css[start:])
+    return blocks
+
+
+def dedupe_css(css):
+    """
+    Drop rules that appear again, identically, later in the same bundle.
+
+    Keeping the last copy leaves the cascade unchanged: whatever the
+    earlier copy set, the later one sets again afterwards.
+    """
+    blocks = css_blocks(css)
+    last = {block: i for i, block in enumerate(blocks) if block.endswith('}')}
+    return ''.join(
+        block for i, block in enumerate(blocks) if not block.endswith('}') or last[block] == i
+    )
+
+
+def rewrite_css_urls(css, source_path, output_path):
+    """Make relative ``url()`` references correct from the bundle's location."""
+    source_dir = posixpath.dirname(source_path)
+    output_dir = posixpath.dirname(output_path)
+
+    def rewrite(match):
+        quote, url = match.groups()
+        if re.match(r'^(/|#|[a-z][a-z0-9+.-]*:)', url, re.I):
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(source_dir, url))
+        return f'url({quote}{posixpath.relpath(target, output_dir or ".")}{quote})'
+
+    return _CSS_URL.sub(rewrite, css)
+
+
+# JavaScript
+
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = ('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'delete', 'throw')
+
+
+def minify_js(text):
+    """
+    Remove comments, indentation and blank lines.
+
+    Deliberately conservative: line breaks are kept, so automatic
+    semicolon insertion behaves exactly as in the source, and string,
+    template and regex literals are copied untouched.
+    """
+    out = []
+    i, n = 0, len(text)
+    template_depth = []  # brace depth at each open ${ ... } inside a template
+
+    def last_significant():
+        for chunk in reversed(out):
+            stripped = chunk.rstrip()
+            if stripped:
+                return stripped
+        return ''
+
+    def copy_string(start, quote):
+        j = start + 1
+        while j < n and text[j] != quote:
+            j += 2 if text[j] == '\\' else 1
+        return j + 1
+
+    def copy_template(start):
+        # Returns the index after the literal, or of "${" to resume code
+        j = start
+        while j < n:
+            if text[j] == '\\':
+                j += 2
+            elif text[j] == '`':
+                return j + 1, False
+            elif text.startswith('${', j):
+                return j + 2, True
+            else:
+                j += 1
+        return j, False
+
+    braces = 0
+    while i < n:
+        char = text[i]
+        if char in '"\'':
+            end = copy_string(i, char)
+            out.append(text[i:end])
+            i = end
+        elif char == '`' or (char == '}' and template_depth and template_depth[-1] == braces):
+            if char == '}':
+                template_depth.pop()
+            end, interpolation = copy_template(i + 1)
+            out.append(text[i:end])
+            if interpolation:
+                template_depth.append(braces)
+            i = end
+        elif text.startswith('//', i):
+            while i < n and text[i] != '\n':
+                i += 1
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+        elif char == '/':
+            previous = last_significant()
+            if not previous or previous[-1] in _REGEX_PRECEDERS or previous.endswith(_REGEX_KEYWORDS):
+                j, in_class = i + 1, False
+                while j < n and (in_class or text[j] != '/') and text[j] != '\n':
+                    if text[j] == '\\':
+                        j += 1
+                    elif text[j] == '[':
+                        in_class = True
+                    elif text[j] == ']':
+                        in_class = False
+                    j += 1
+                j += 1
+                while j < n and text[j].isalpha():
+                    j += 1  # flags
+                out.append(text[i:j])
+                i = j
+            else:
+                out.append(char)
+                i += 1
+        else:
+            if char == '{':
+                braces += 1
+            elif char == '}':
+                braces -= 1
+            out.append(char)
+            i += 1
+
+    lines = (line.strip() for line in ''.join(out).splitlines())
+    return '\n'.join(line for line in lines if line)
+
+
+# Building
+
+def read_source(path):
+    found = finders.find(path)
+    if not found:
+        raise AssetError(f'Bundle source not found: {path}')
+    with open(found, encoding='utf-8') as fh:
+        return fh.read()
+
+
+def render_bundle(name, sources):
+    """Combined, minified text of one bundle."""
+    output_path = posixpath.join(build_prefix(), name)
+    if name.endswith('.css'):
+        css = ''.join(
+            minify_css(rewrite_css_urls(read_source(path), path, output_path)) for path in sources
+        )
+        return dedupe_css(css)
+    if name.endswith('.js'):
+        # ";" guards against a file that ends without one running into the next
+        return '\n;'.join(minify_js(read_source(path)) for path in sources)
+    raise AssetError(f'Unknown bundle type: {name}')
+
+
+def hashed_name(name, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{digest}{extension}'
+
+
+def _write(path, data):
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as fh:
+        fh.write(data)
+    os.replace(temp_path, path)
+
+
+def build(output_dir=None, bundle_map=None):
+    """
+    Build every bundle into ``output_dir`` and return the manifest
+    (``{bundle: hashed file name}``).
+    """
+    output_dir = output_dir or build_dir()
+    bundle_map = bundle_map or bundles()
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = {}
+    for name, sources in bundle_map.items():
+        content = render_bundle(name, sources).encode('utf-8')
+        file_name = hashed_name(name, content)
+        path = os.path.join(output_dir, file_name)
+        if not os.path.exists(path):
+            _write(path, content)
+            _write(f'{path}.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(f'{path}.br', brotli.compress(content, quality=11))
+        manifest[name] = file_name
+
+    _write(os.path.join(output_dir, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    _manifest_cache.clear()
+    return manifest
+
+
+def remove_stale(output_dir, manifest):
+    """Delete earlier builds of the bundles; returns the removed file names."""
+    current = set(manifest.values())
+    removed = []
+    for entry in os.scandir(output_dir):
+        base = re.sub(r'\.(gz|br)$', '', entry.name)
+        if entry.name != MANIFEST_NAME and base not in current:
+            os.remove(entry.path)
+            removed.append(entry.name)
+    return removed
+
+
+# Lookup
+
+_manifest_cache = {}
+
+
+def load_manifest():
+    """The current manifest, re-read only when the file changes."""
+    path = os.path.join(build_dir(), MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _manifest_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    _manifest_cache[path] = (mtime, manifest)
+    return manifest
+
+
+def bundle_paths(name):
+    """Static paths to include for bundle ``name`` (the built file, or its sources)."""
+    built = load_manifest().get(name)
+    if built:
+        return [posixpath.join(build_prefix(), built)]
+    try:
+        return list(bundles()[name])
+    except KeyError:
+        raise AssetError(f'Unknown bundle: {name}')
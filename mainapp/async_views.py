@@ -0,0 +1,160 @@
+"""
+Native async versions of the AJAX endpoints, used when running under ASGI.
+
+Under ASGI a sync view costs a hop onto Django's single thread for sync
+code. These views await the async ORM instead, so many slow or waiting
+requests can be handled concurrently by one worker. Each view returns
+exactly the same responses as its counterpart in ``mainapp.views``.
+``mainapp.urls`` selects them when ``ASYNC_VIEWS`` is on, which
+``church_website/asgi.py`` does by default.
+
+Under WSGI the sync views are kept: an async view there would need its
+own event loop per request.
+"""
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+
+from mainapp.counters import get_prayer_counter
+from mainapp.events import astream_events, get_broker, last_event_id
+from mainapp.metrics import PRAYERS_PRAYED
+from mainapp.models import MediaFile, PrayerRequest
+from mainapp.ratelimit import rate_limit
+from mainapp.submissions import CREATED, DuplicatePrayer, request_key, submit_prayer
+from mainapp.views import event_stream_response
+
+logger = logging.getLogger('mainapp.views')
+
+
+@require_POST
+@csrf_exempt
+@rate_limit('prayer_increment', as_json=True)
+async def increment_prayer_count(request, prayer_id):
+    """
+    Increment prayer count for a specific prayer request
+    """
+    try:
+        prayer_count = await get_prayer_counter().aincrement(prayer_id)
+        PRAYERS_PRAYED.inc()
+
+        return JsonResponse({
+            'success': True,
+            'prayer_count': prayer_count
+        })
+
+    except PrayerRequest.DoesNotExist:
+        return JsonResponse({'error': 'Prayer request not found'}, status=404)
+    except Exception:
+        logger.exception('Failed to increment prayer %s', prayer_id)
+        return JsonResponse({'error': 'Failed to increment prayer count'}, status=500)
+
+
+@require_http_methods(["DELETE"])
+@csrf_exempt
+@rate_limit('delete', methods=['DELETE'], as_json=True)
+async def delete_prayer(request, prayer_id):
+    """
+    Delete a prayer request
+    """
+    try:
+        prayer = await aget_object_or_404(PrayerRequest, id=prayer_id)
+        prayer_name = prayer.name
+        await prayer.adelete()
+
+        return JsonResponse({
+            'success': True,
+            'message': f'Prayer request from {prayer_name} has been deleted successfully'
+        })
+
+    except PrayerRequest.DoesNotExist:
+        return JsonResponse({'error': 'Prayer request not found'}, status=404)
+    except Exception:
+        logger.exception('Failed to delete prayer %s', prayer_id)
+        return JsonResponse({'error': 'Failed to delete prayer request'}, status=500)
+
+
+@require_http_methods(["DELETE"])
+@rate_limit('delete', methods=['DELETE'], as_json=True)
+async def delete_gallery_media(request, media_id):
+    """
+    Delete a gallery media item
+    """
+    try:
+        media = await aget_object_or_404(MediaFile, id=media_id)
+
+        # The files themselves are unlinked by a background job once the
+        # last reference is gone (mainapp.storage.release_blob).
+        await media.adelete()
+
+        return JsonResponse({
+            'success': True,
+            'message': 'Media deleted successfully'
+        })
+
+    except MediaFile.DoesNotExist:
+        return JsonResponse({'error': 'Media not found'}, status=404)
+    except Exception:
+        return JsonResponse({'error': 'Failed to delete media'}, status=500)
+
+
+@csrf_exempt
+@rate_limit('prayer_submit', as_json=True)
+async def submit_prayer_ajax(request):
+    """
+    AJAX endpoint for submitting prayer requests
+    """
+    if request.method == "POST" and request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        name = request.POST.get('name')
+        message = request.POST.get('message')
+
+        if name and message:
+            try:
+                # The duplicate checks need a transaction, which only sync code can hold
+                prayer, outcome = await sync_to_async(submit_prayer)(
+                    name, message, approved=True, key=request_key(request),
+                )
+
+                return JsonResponse({
+                    'success': True,
+                    'message': 'Prayer request submitted successfully!',
+                    'prayer': {
+                        'id': prayer.id,
+                        'name': prayer.name,
+                        'message': prayer.message,
+                        'submitted_at': prayer.submitted_at.strftime("%b %d, %Y")
+                    },
+                    'duplicate': outcome != CREATED,
+                })
+            except DuplicatePrayer:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'This prayer request has already been submitted.'
+                }, status=409)
+            except Exception:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'An error occurred while submitting your prayer.'
+                }, status=500)
+        else:
+            return JsonResponse({
+                'success': False,
+                'message': 'Please fill in all required fields.'
+            }, status=400)
+
+    return JsonResponse({
+        'success': False,
+        'message': 'Invalid request method.'
+    }, status=405)
+
+
+@require_GET
+async def prayer_events(request):
+    """
+    Server-Sent Events stream of prayer-wall changes; an idle stream is just a waiting coroutine
+    """
+    stream = astream_events(get_broker(), last_event_id(request))
+    return event_stream_response(stream)
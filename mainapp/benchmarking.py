@@ -0,0 +1,158 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway SQLite database (``scratch_database``)
+so they never touch ``db.sqlite3``, and report the same summary
+(``summarize``): requests, errors, throughput and latency percentiles.
+
+``seed_database`` fills a database with generated prayers, media rows and
+contact messages at one of the ``SCALES``; the same seed gives the same
+rows. ``compare_results`` reads two saved ``manage.py benchmark`` results
+and lists what got slower.
+"""
+import os
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.utils import timezone
+
+# Row counts for ``manage.py benchmark --scale``
+SCALES = {
+    'tiny': {'prayers': 100, 'media': 50, 'messages': 20},
+    'small': {'prayers': 1_000, 'media': 1_000, 'messages': 200},
+    'medium': {'prayers': 100_000, 'media': 10_000, 'messages': 5_000},
+    'large': {'prayers': 1_000_000, 'media': 10_000, 'messages': 50_000},
+}
+
+# Share of seeded prayers still waiting for approval
+PENDING_FRACTION = 0.1
+
+# Prayer and message text is drawn from these, so searches find something
+WORDS = (
+    'pray healing family mother father peace strength hope grace mercy health '
+    'exam journey work home blessing comfort guidance patience friend child '
+    'surgery recovery faith thanks wedding baptism travel safety light'
+).split()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(latencies, errors, seconds):
+    """Summary of one run; ``latencies`` in seconds, one per request."""
+    total = len(latencies)
+    return {
+        'requests': total,
+        'errors': errors,
+        'seconds': seconds,
+        'requests_per_second': (total - errors) / seconds if seconds else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+@contextmanager
+def scratch_database(alias='default', name=None, **overrides):
+    """
+    Point ``alias`` at a new, migrated SQLite file for the duration of the block.
+
+    ``overrides`` replace keys of the connection settings (``OPTIONS``,
+    ``CONN_MAX_AGE`` ...). Every thread opens its own connection from the
+    same settings, so threads started inside the block use it too. With
+    ``name`` that file is used (and kept) instead, e.g. to share it with a
+    server started with ``DB_NAME``.
+    """
+    settings_dict = connections.settings[alias]
+    saved = {key: settings_dict.get(key) for key in ['NAME', *overrides]}
+    directory = None if name else tempfile.mkdtemp(prefix='benchmark-db-')
+    try:
+        connections.close_all()
+        settings_dict.update(overrides, NAME=name or os.path.join(directory, 'benchmark.sqlite3'))
+        call_command('migrate', database=alias, verbosity=0)
+        yield settings_dict['NAME']
+    finally:
+        connections.close_all()
+        settings_dict.update(saved)
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def seed_database(prayers=0, media=0, messages=0, seed=0, batch_size=5000):
+    """
+    Add generated rows with ``bulk_create``, in one transaction per batch.
+
+    Signals don't fire for bulk inserts, so the search index is rebuilt at
+    the end and every row counts as already reported in a digest.
+    """
+    from mainapp.models import ContactMessage, MediaFile, PrayerRequest
+    from mainapp.search import get_search_backend
+
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    def insert(model, count, make):
+        for start in range(0, count, batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(make(i) for i in range(start, min(start + batch_size, count)))
+
+    def make_prayer(i):
+        prayer = PrayerRequest(
+            name=f'Visitor {i}', message=sentence(rng), approved=rng.random() >= PENDING_FRACTION,
+            prayer_count=rng.randrange(50), notified_at=now,
+        )
+        prayer.update_fingerprints()  # save() isn't called by bulk_create
+        return prayer
+
+    insert(PrayerRequest, prayers, make_prayer)
+    insert(MediaFile, media, lambda i: MediaFile(
+        file=f'uploads/benchmark-{i}.jpg', kind=MediaFile.KIND_VIDEO if i % 10 == 0 else MediaFile.KIND_IMAGE,
+        mime_type='image/jpeg', size_bytes=250_000, processing_status=MediaFile.PROCESSING_READY,
+    ))
+    insert(ContactMessage, messages, lambda i: ContactMessage(
+        name=f'Visitor {i}', email=f'visitor{i}@example.com', subject=sentence(rng, 4),
+        message=sentence(rng, 40), notified_at=now,
+    ))
+    for model, count in ((PrayerRequest, prayers), (ContactMessage, messages)):
+        if count:
+            get_search_backend().rebuild(model, batch_size=batch_size)
+
+
+def compare_results(baseline, current, tolerance=0.2, min_delta_ms=1.0, min_requests=20):
+    """
+    Regressions of ``current`` against ``baseline`` (both ``benchmark`` results).
+
+    A route regresses when it runs more queries, or when its p95 grows by
+    more than ``tolerance`` and ``min_delta_ms``; latency is only compared
+    for routes with ``min_requests`` samples in both runs, as a p95 of a
+    handful of requests is mostly noise. Overall throughput regresses when
+    it drops by more than ``tolerance``. Returns one line per regression.
+    """
+    regressions = []
+    before, after = baseline['total'], current['total']
+    if after['requests_per_second'] < before['requests_per_second'] * (1 - tolerance):
+        regressions.append(
+            f"throughput: {before['requests_per_second']:.0f} -> {after['requests_per_second']:.0f} req/s"
+        )
+    for route, now in sorted(current['routes'].items()):
+        was = baseline['routes'].get(route)
+        if was is None:
+            continue
+        enough = min(was['requests'], now['requests']) >= min_requests
+        if enough and now['p95_ms'] > was['p95_ms'] * (1 + tolerance) and now['p95_ms'] - was['p95_ms'] > min_delta_ms:
+            regressions.append(f"{route}: p95 {was['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+        if was.get('queries_max') is not None and (now.get('queries_max') or 0) > was['queries_max']:
+            regressions.append(f"{route}: up to {now['queries_max']} queries, was {was['queries_max']}")
+    return regressions
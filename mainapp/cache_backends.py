@@ -0,0 +1,173 @@
+"""
+A cache backend stored in a standalone SQLite file.
+
+Local-memory caches are per process, so with several server workers each
+one warms (and invalidates) its own copy. Pointing every worker at the same
+SQLite file gives them one shared cache without running memcached or Redis:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'mainapp.cache_backends.SQLiteCache',
+            'LOCATION': BASE_DIR / 'cache.sqlite3',
+        }
+    }
+
+The file is separate from the application database, runs in WAL mode so
+readers never wait for writers, and keeps one connection per thread.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entry (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+) WITHOUT ROWID
+"""
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = str(location)
+        self.busy_timeout = params.get('OPTIONS', {}).get('busy_timeout', 5.0)
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections can't follow a fork, so they are also keyed by pid
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.location, timeout=self.busy_timeout, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _load(self, value):
+        return pickle.loads(value)
+
+    def _dump(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else self._load(row[0])
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        placeholders = ','.join('?' * len(key_map))
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache_entry WHERE key IN ({placeholders}) '
+            'AND (expires IS NULL OR expires > ?)',
+            (*key_map, time.time()),
+        ).fetchall()
+        return {key_map[key]: self._load(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache_entry (key, value, expires) VALUES (?, ?, ?)',
+            (key, self._dump(value), self.get_backend_timeout(timeout)),
+        )
+        self._maybe_cull(connection)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'INSERT INTO cache_entry (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache_entry.expires IS NOT NULL AND cache_entry.expires <= ?',
+            (key, self._dump(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache_entry SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so the read and
+        # write below can't interleave with another worker's increment.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._load(row[0]) + delta
+            connection.execute('UPDATE cache_entry SET value = ? WHERE key = ?', (self._dump(value), key))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            placeholders = ','.join('?' * len(keys))
+            self._connection().execute(f'DELETE FROM cache_entry WHERE key IN ({placeholders})', keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            'SELECT 1 FROM cache_entry WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entry')
+
+    def _maybe_cull(self, connection):
+        # Checking the size on every write would cost a table scan; sample it
+        if int.from_bytes(os.urandom(1), 'big') >= 16:
+            return
+        connection.execute('DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        (count,) = connection.execute('SELECT COUNT(*) FROM cache_entry').fetchone()
+        if count > self._max_entries and self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entry')
+        elif count > self._max_entries:
+            connection.execute(
+                'DELETE FROM cache_entry WHERE key IN '
+                '(SELECT key FROM cache_entry ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+
+    def close(self, **kwargs):
+        # Called at the end of every request; the connection is reused.
+        pass
@@ -0,0 +1,203 @@
+"""
+Whole-page and fragment caching.
+
+The static pages (index, history, events, administration) render the same
+HTML for every visitor, so ``cache_page_as`` stores the rendered response
+under a fixed name. The "recent prayers" list on home/services is cached as
+a fragment (see ``{% prayer_list %}``) and dropped as soon as a change could
+alter it: a saved or deleted ``PrayerRequest`` on the list, a newly approved
+prayer recent enough to join it, or a count flushed for one of its rows.
+
+Settings (all optional):
+
+    PAGE_CACHE = {
+        'CACHE_ALIAS': 'default',
+        'TIMEOUT': 3600,              # whole pages
+        'PRAYER_LIST_TIMEOUT': 600,   # prayer-list fragment
+        'PRAYER_LIST_SIZE': 10,
+    }
+
+Hits and misses are counted in the cache itself, so with a shared backend
+``cache_stats()`` (and ``manage.py cache_stats``) covers every worker.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+DEFAULT_PAGE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': 60 * 60,
+    'PRAYER_LIST_TIMEOUT': 10 * 60,
+    'PRAYER_LIST_SIZE': 10,
+}
+
+PRAYER_LIST = 'prayer_list'
+PRAYER_LIST_GENERATION_KEY = 'fragment:prayer_list:generation'
+
+# Names of everything cached here, for cache_stats()
+tracked_names = {PRAYER_LIST}
+
+
+def page_cache_setting(name):
+    return {**DEFAULT_PAGE_CACHE, **getattr(settings, 'PAGE_CACHE', {})}[name]
+
+
+def get_cache():
+    return caches[page_cache_setting('CACHE_ALIAS')]
+
+
+def record(name, outcome):
+    """Count one of ``'hits'`` or ``'misses'`` for ``name``."""
+    cache = get_cache()
+    key = f'cache-stats:{name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def cache_stats():
+    """``{name: {'hits': n, 'misses': n}}`` for every cached page and fragment."""
+    keys = {
+        f'cache-stats:{name}:{outcome}': (name, outcome)
+        for name in tracked_names for outcome in ('hits', 'misses')
+    }
+    values = get_cache().get_many(keys)
+    stats = {name: {'hits': 0, 'misses': 0} for name in sorted(tracked_names)}
+    for key, value in values.items():
+        name, outcome = keys[key]
+        stats[name][outcome] = value
+    return stats
+
+
+def reset_cache_stats():
+    get_cache().delete_many([
+        f'cache-stats:{name}:{outcome}' for name in tracked_names for outcome in ('hits', 'misses')
+    ])
+
+
+def page_key(name):
+    return f'page:{name}'
+
+
+def cache_page_as(name):
+    """
+    Cache a view's whole response under ``name``.
+
+    Only for views whose output is the same for every visitor. Requests
+    with a query string, non-GET/HEAD requests and responses that aren't a
+    plain 200 (or that set cookies) bypass the cache.
+    """
+    tracked_names.add(name)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.GET:
+                return view(request, *args, **kwargs)
+
+            cache = get_cache()
+            cached = cache.get(page_key(name))
+            if cached is not None:
+                record(name, 'hits')
+                response = HttpResponse(cached['content'], content_type=cached['content_type'])
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view(request, *args, **kwargs)
+            record(name, 'misses')
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                cache.set(page_key(name), {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                }, page_cache_setting('TIMEOUT'))
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def clear_page_cache():
+    """Forget every cached page, e.g. after a deploy changed the templates."""
+    get_cache().delete_many([page_key(name) for name in tracked_names if name != PRAYER_LIST])
+    invalidate_prayer_list()
+
+
+def _prayer_list_key(cache):
+    generation = cache.get(PRAYER_LIST_GENERATION_KEY)
+    if generation is None:
+        cache.add(PRAYER_LIST_GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(PRAYER_LIST_GENERATION_KEY, 1)
+    return f'fragment:prayer_list:{generation}'
+
+
+def prayer_list_fragment():
+    """Rendered "recent prayers" card, from the cache when possible."""
+    from mainapp.models import PrayerRequest
+
+    cache = get_cache()
+    # The key embeds a generation number read *before* querying: if the
+    # list is invalidated while we render, our copy lands under the old
+    # generation and is never served.
+    key = _prayer_list_key(cache)
+    cached = cache.get(key)
+    if cached is not None:
+        record(PRAYER_LIST, 'hits')
+        return cached['html']
+
+    # Read from the primary: a copy built from a lagging replica would be
+    # served to everyone until the next invalidation.
+    prayers = list(
+        PrayerRequest.objects.using(router.db_for_write(PrayerRequest)).filter(approved=True)
+        .order_by('-submitted_at')[:page_cache_setting('PRAYER_LIST_SIZE')]
+    )
+    html = render_to_string('mainapp/partials/prayer_list.html', {
+        'prayers': prayers,
+        'list_size': page_cache_setting('PRAYER_LIST_SIZE'),
+    })
+    cache.set(key, {
+        'html': html,
+        'ids': [prayer.pk for prayer in prayers],
+        'oldest': prayers[-1].submitted_at if prayers else None,
+        'full': len(prayers) >= page_cache_setting('PRAYER_LIST_SIZE'),
+    }, page_cache_setting('PRAYER_LIST_TIMEOUT'))
+    record(PRAYER_LIST, 'misses')
+    return html
+
+
+def invalidate_prayer_list(prayer=None, prayer_ids=None, deleted=False):
+    """
+    Drop the cached prayer list if the change could show up in it.
+
+    With no arguments the list is always dropped. ``prayer`` is a saved or
+    deleted ``PrayerRequest``; ``prayer_ids`` are rows whose count changed.
+    """
+    cache = get_cache()
+    if prayer is not None or prayer_ids is not None:
+        cached = cache.get(_prayer_list_key(cache))
+        if cached is not None and not _affects_prayer_list(cached, prayer, prayer_ids, deleted):
+            return
+    try:
+        cache.incr(PRAYER_LIST_GENERATION_KEY)
+    except ValueError:
+        cache.add(PRAYER_LIST_GENERATION_KEY, 2, timeout=None)
+
+
+def _affects_prayer_list(cached, prayer, prayer_ids, deleted):
+    ids = set(cached['ids'])
+    if prayer_ids is not None and ids.intersection(prayer_ids):
+        return True
+    if prayer is None:
+        return False
+    if prayer.pk in ids:
+        return True
+    if deleted or not prayer.approved:
+        return False
+    return not cached['full'] or prayer.submitted_at >= cached['oldest']
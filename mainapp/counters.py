@@ -0,0 +1,359 @@
+"""
+Prayer counter backends.
+
+Every click on "Pray" ends up in one of these backends. They never load and
+re-save the whole ``PrayerRequest`` row; increments are applied as
+``prayer_count = prayer_count + n`` in the database, so concurrent clicks
+can't overwrite each other and ``updated_at`` is left alone.
+
+The backend is chosen with the ``PRAYER_COUNTER`` setting:
+
+    PRAYER_COUNTER = {
+        'BACKEND': 'mainapp.counters.BufferedPrayerCounter',
+        'OPTIONS': {'flush_interval': 1.0, 'max_pending': 500},
+    }
+"""
+import atexit
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.dispatch import Signal, receiver
+from django.utils.module_loading import import_string
+
+from mainapp.models import PrayerRequest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAYER_COUNTER = {
+    'BACKEND': 'mainapp.counters.DirectPrayerCounter',
+    'OPTIONS': {},
+}
+
+# Sent with ``prayer_ids`` once new counts are stored (after commit), for
+# caches and listeners that show counts.
+prayer_counts_changed = Signal()
+
+# SQLite allows 999 bound parameters per statement on older builds; each id
+# appears twice in the CASE update (WHERE ... IN and WHEN), plus its delta.
+UPDATE_BATCH_SIZE = 300
+
+
+def apply_increments(deltas):
+    """
+    Add ``{prayer_id: delta}`` to the stored counts.
+
+    One ``UPDATE ... SET prayer_count = prayer_count + CASE ... END`` is
+    issued per batch of ids, so a flush of many prayers is still only a
+    handful of statements. Returns the number of rows updated.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+
+    updated = 0
+    ids = sorted(deltas)
+    with transaction.atomic():
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            batch = ids[start:start + UPDATE_BATCH_SIZE]
+            increment = Case(
+                *[When(pk=pk, then=Value(deltas[pk])) for pk in batch],
+                default=Value(0),
+                output_field=PositiveIntegerField(),
+            )
+            updated += PrayerRequest.objects.filter(pk__in=batch).update(
+                prayer_count=F('prayer_count') + increment
+            )
+        transaction.on_commit(lambda: prayer_counts_changed.send(sender=PrayerRequest, prayer_ids=ids))
+    return updated
+
+
+def stored_prayer_count(prayer_id):
+    """Return the persisted count, raising ``DoesNotExist`` for unknown ids."""
+    count = (
+        PrayerRequest.objects.filter(pk=prayer_id)
+        .values_list('prayer_count', flat=True)
+        .first()
+    )
+    if count is None:
+        raise PrayerRequest.DoesNotExist(f'Prayer request {prayer_id} does not exist.')
+    return count
+
+
+async def astored_prayer_count(prayer_id):
+    count = await (
+        PrayerRequest.objects.filter(pk=prayer_id)
+        .values_list('prayer_count', flat=True)
+        .afirst()
+    )
+    if count is None:
+        raise PrayerRequest.DoesNotExist(f'Prayer request {prayer_id} does not exist.')
+    return count
+
+
+class BasePrayerCounter:
+    """Interface shared by all prayer counter backends."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def increment(self, prayer_id, amount=1):
+        """Record ``amount`` prayers and return the (approximate) new count."""
+        raise NotImplementedError('subclasses of BasePrayerCounter must provide an increment() method')
+
+    async def aincrement(self, prayer_id, amount=1):
+        """Async ``increment()``; backends without a native version run it in a thread."""
+        return await sync_to_async(self.increment)(prayer_id, amount)
+
+    def pending(self, prayer_id):
+        """Return increments recorded for ``prayer_id`` but not yet written."""
+        return 0
+
+    def flush(self):
+        """Write buffered increments to the database. Returns the amount flushed."""
+        return 0
+
+    def close(self):
+        """Flush and stop any background work."""
+        self.flush()
+
+
+class DirectPrayerCounter(BasePrayerCounter):
+    """Apply every increment straight away as an atomic UPDATE."""
+
+    def increment(self, prayer_id, amount=1):
+        updated = PrayerRequest.objects.filter(pk=prayer_id).update(
+            prayer_count=F('prayer_count') + amount
+        )
+        if not updated:
+            raise PrayerRequest.DoesNotExist(f'Prayer request {prayer_id} does not exist.')
+        transaction.on_commit(
+            lambda: prayer_counts_changed.send(sender=PrayerRequest, prayer_ids=[prayer_id])
+        )
+        return stored_prayer_count(prayer_id)
+
+    async def aincrement(self, prayer_id, amount=1):
+        updated = await PrayerRequest.objects.filter(pk=prayer_id).aupdate(
+            prayer_count=F('prayer_count') + amount
+        )
+        if not updated:
+            raise PrayerRequest.DoesNotExist(f'Prayer request {prayer_id} does not exist.')
+        # Async code always runs in autocommit mode, so the row is committed
+        await prayer_counts_changed.asend(sender=PrayerRequest, prayer_ids=[prayer_id])
+        return await astored_prayer_count(prayer_id)
+
+
+class BufferedPrayerCounter(BasePrayerCounter):
+    """
+    Coalesce increments in process memory and flush them periodically.
+
+    A burst of clicks on the same prayer becomes a single UPDATE per
+    ``flush_interval`` seconds, or sooner once ``max_pending`` increments
+    are waiting. The returned count is the stored value plus whatever this
+    process still holds, which is what the clicking visitor expects to see.
+    """
+
+    def __init__(self, flush_interval=1.0, max_pending=500, **options):
+        super().__init__(**options)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._flusher_pid = None
+        atexit.register(self.close)
+
+    def increment(self, prayer_id, amount=1):
+        stored = stored_prayer_count(prayer_id)
+        with self._lock:
+            pending = self._add_pending(prayer_id, amount)
+            flush_now = self._pending_total >= self.max_pending
+        self._ensure_flusher()
+        if flush_now:
+            self.flush()
+        return stored + pending
+
+    async def aincrement(self, prayer_id, amount=1):
+        stored = await astored_prayer_count(prayer_id)
+        with self._lock:
+            pending = self._add_pending(prayer_id, amount)
+            flush_now = self._pending_total >= self.max_pending
+        self._ensure_flusher()
+        if flush_now:
+            await sync_to_async(self.flush)()
+        return stored + pending
+
+    def pending(self, prayer_id):
+        with self._lock:
+            return self._pending.get(prayer_id, 0)
+
+    def flush(self):
+        # Serialise flushes so that once flush() returns, every increment
+        # recorded before the call is committed, even if the background
+        # flusher had already taken part of it.
+        with self._flush_lock:
+            with self._lock:
+                deltas = self._take_pending()
+            if not deltas:
+                return 0
+            try:
+                apply_increments(deltas)
+            except Exception:
+                # Put the increments back so the next flush retries them.
+                with self._lock:
+                    for prayer_id, delta in deltas.items():
+                        self._add_pending(prayer_id, delta)
+                raise
+            return sum(deltas.values())
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush prayer counts on shutdown')
+
+    def _add_pending(self, prayer_id, amount):
+        pending = self._pending.get(prayer_id, 0) + amount
+        self._pending[prayer_id] = pending
+        self._pending_total += amount
+        return pending
+
+    def _take_pending(self):
+        deltas, self._pending = self._pending, {}
+        self._pending_total = 0
+        return deltas
+
+    def _ensure_flusher(self):
+        # Started lazily and per process, so forked workers get their own.
+        if self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid() and self._flusher.is_alive():
+                return
+            self._stop.clear()
+            self._flusher = threading.Thread(
+                target=self._run_flusher, name='prayer-counter-flusher', daemon=True
+            )
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.flush_interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush prayer counts')
+
+
+class CachePrayerCounter(BufferedPrayerCounter):
+    """
+    Buffer increments in a shared Django cache instead of process memory.
+
+    Every worker adds to the same ``prayer-count:<id>`` key, so the count
+    returned to a visitor includes clicks handled by other workers. Each
+    worker flushes the keys it has touched by taking the current value
+    with ``decr``; workers flushing the same key take turns through an
+    ``add``-based lock, so a value is never taken twice. The cache must
+    support atomic ``add``/``incr``/``decr`` (local memory, Redis and
+    Memcached all do).
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='prayer-count', lock_timeout=10, **options):
+        super().__init__(**options)
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.lock_timeout = lock_timeout
+        self._dirty = set()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def make_key(self, prayer_id):
+        return f'{self.key_prefix}:{prayer_id}'
+
+    # The cache calls in _add_pending() block, so keep them off the event loop
+    aincrement = BasePrayerCounter.aincrement
+
+    def pending(self, prayer_id):
+        return max(self.cache.get(self.make_key(prayer_id), 0), 0)
+
+    def _add_pending(self, prayer_id, amount):
+        key = self.make_key(prayer_id)
+        self.cache.add(key, 0, timeout=None)
+        try:
+            pending = self.cache.incr(key, amount)
+        except ValueError:
+            # The key expired or was evicted between add() and incr().
+            self.cache.add(key, amount, timeout=None)
+            pending = amount
+        self._dirty.add(prayer_id)
+        self._pending_total += amount
+        return max(pending, 0)
+
+    def _take_pending(self):
+        dirty, self._dirty = self._dirty, set()
+        self._pending_total = 0
+        deltas = {}
+        for prayer_id in dirty:
+            lock = f'{self.make_key(prayer_id)}:flushing'
+            if not self.cache.add(lock, os.getpid(), timeout=self.lock_timeout):
+                # Another worker is taking this key's value; look again next flush
+                self._dirty.add(prayer_id)
+                continue
+            try:
+                taken = self._take(self.make_key(prayer_id))
+            finally:
+                self.cache.delete(lock)
+            if taken > 0:
+                deltas[prayer_id] = taken
+        return deltas
+
+    def _take(self, key):
+        taken = self.cache.get(key, 0)
+        if taken <= 0:
+            return 0
+        try:
+            remaining = self.cache.decr(key, taken)
+        except ValueError:
+            return 0  # Evicted since get(): nothing left to take
+        if remaining < 0:
+            # Taken by someone else after all (the lock expired): give it back
+            self.cache.incr(key, -remaining)
+            taken += remaining
+        return taken
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_prayer_counter():
+    """Return the process-wide counter configured by ``PRAYER_COUNTER``."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                config = getattr(settings, 'PRAYER_COUNTER', DEFAULT_PRAYER_COUNTER)
+                backend = import_string(config.get('BACKEND', DEFAULT_PRAYER_COUNTER['BACKEND']))
+                _counter = backend(**config.get('OPTIONS', {}))
+    return _counter
+
+
+@receiver(setting_changed)
+def _reset_prayer_counter(setting, **kwargs):
+    global _counter
+    if setting == 'PRAYER_COUNTER' and _counter is not None:
+        _counter.close()
+        _counter = None
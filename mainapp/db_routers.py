@@ -0,0 +1,128 @@
+"""
+Primary/replica database routing.
+
+With read replicas configured, every read goes to a replica and every
+write to the primary:
+
+    DATABASE_ROUTERS = ['mainapp.db_routers.PrimaryReplicaRouter']
+    DATABASE_ROUTING = {
+        'PRIMARY': 'default',
+        'REPLICAS': ['replica1', 'replica2'],
+        'STICKY_SECONDS': 15,
+    }
+
+Replicas lag behind the primary, so someone who just submitted a prayer
+could be redirected to a page that doesn't show it yet. To avoid that,
+``ReadYourWritesMiddleware`` pins the rest of a POST (or PUT, DELETE ...)
+request to the primary. It also sets a short-lived cookie so that the
+same visitor's requests keep reading from the primary for
+``STICKY_SECONDS``. Jobs enqueued while a request is pinned run pinned too
+(see ``mainapp.jobqueue``). Code outside a request can use
+``with use_primary():``.
+
+Without replicas the router sends everything to the primary and the
+middleware removes itself.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+DEFAULT_DATABASE_ROUTING = {
+    'PRIMARY': 'default',
+    'REPLICAS': [],
+    'STICKY_SECONDS': 15,
+}
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+
+
+def routing_setting(name):
+    return {**DEFAULT_DATABASE_ROUTING, **getattr(settings, 'DATABASE_ROUTING', {})}[name]
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def use_primary():
+    """Send every read inside the block to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = routing_setting('REPLICAS')
+        if not replicas or _pinned.get():
+            return routing_setting('PRIMARY')
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return routing_setting('PRIMARY')
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {routing_setting('PRIMARY'), *routing_setting('REPLICAS')}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in routing_setting('REPLICAS'):
+            return False
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """Read from the primary during and shortly after a visitor's writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routing_setting('REPLICAS'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _pinned.set(self.should_pin(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        token = _pinned.set(self.should_pin(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned.reset(token)
+        return self.process_response(request, response)
+
+    def should_pin(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=routing_setting('STICKY_SECONDS'),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,419 @@
+"""
+Live prayer-wall events, streamed to browsers with Server-Sent Events.
+
+Signal receivers publish an event whenever the wall changes:
+
+    prayer   an approved prayer was added or edited   {id, name, message, submitted_at, prayer_count}
+    count    its prayer count changed                 {id, prayer_count}
+    delete   it was deleted or unapproved             {id}
+
+``/prayers/events/`` streams them (see ``stream_events``). Count changes
+are coalesced: the ids are collected for ``coalesce_interval`` seconds
+and then published as one ``count`` event per prayer, read back from the
+database in a single query, however many clicks there were.
+
+The broker that carries events is chosen with ``PRAYER_EVENTS``:
+
+    PRAYER_EVENTS = {
+        'BACKEND': 'mainapp.events.LocalBroker',   # or CacheBroker
+        'OPTIONS': {'coalesce_interval': 1.0, 'backlog': 200},
+        'KEEPALIVE': 15,              # seconds between keep-alive comments
+        'MAX_STREAM_SECONDS': 300,    # sync (WSGI) streams end after this and reconnect
+    }
+
+``LocalBroker`` only reaches subscribers in its own process. With
+several workers use ``CacheBroker``, which passes events through a shared
+cache (e.g. the SQLite cache backend, Redis or Memcached). Both keep a short
+backlog, so a browser that reconnects with ``Last-Event-ID`` gets what
+it missed, or a ``reset`` event telling it to reload.
+
+Under ASGI each open stream is an idle coroutine waiting on an
+``asyncio.Queue``. Under WSGI each stream holds a worker thread, which is
+why sync streams are cut off after ``MAX_STREAM_SECONDS``.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAYER_EVENTS = {
+    'BACKEND': 'mainapp.events.LocalBroker',
+    'OPTIONS': {},
+    'KEEPALIVE': 15,
+    'MAX_STREAM_SECONDS': 300,
+}
+
+# Tells the browser to reload the list: it missed events we no longer have
+RESET = 'reset'
+
+Event = namedtuple('Event', 'id type data')
+
+
+def events_setting(name):
+    return {**DEFAULT_PRAYER_EVENTS, **getattr(settings, 'PRAYER_EVENTS', {})}[name]
+
+
+def prayer_data(prayer):
+    return {
+        'id': prayer.pk,
+        'name': prayer.name,
+        'message': prayer.message,
+        'submitted_at': prayer.submitted_at.strftime("%b %d, %Y"),
+        'prayer_count': prayer.prayer_count,
+    }
+
+
+def format_event(event):
+    """One event in ``text/event-stream`` format."""
+    # A reset has no id, so the browser keeps resuming from its last real event
+    event_id = f'id: {event.id}\n' if event.id else ''
+    return f'{event_id}event: {event.type}\ndata: {json.dumps(event.data)}\n\n'
+
+
+# Subscriptions
+
+class Subscription:
+    """Events for one blocking (WSGI) consumer."""
+
+    def __init__(self, broker, max_queue):
+        self.broker = broker
+        self._queue = queue.Queue(max_queue)
+
+    def put(self, event):
+        # Called from any thread; a consumer this far behind starts over
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflow()
+
+    def overflow(self):
+        with self._queue.mutex:
+            self._queue.queue.clear()
+        self._queue.put_nowait(Event(0, RESET, {}))
+
+    def get(self, timeout=None):
+        """The next event, or None after ``timeout`` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncSubscription(Subscription):
+    """Events for one coroutine; must be created on its event loop."""
+
+    def __init__(self, broker, max_queue):
+        self.broker = broker
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(max_queue)
+
+    def put(self, event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # The loop has gone; close() is on its way
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflow()
+
+    def overflow(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(Event(0, RESET, {}))
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# Brokers
+
+class LocalBroker:
+    """In-process publish/subscribe with count coalescing and a replay backlog."""
+
+    def __init__(self, coalesce_interval=1.0, backlog=200, max_queue=1000):
+        self.coalesce_interval = coalesce_interval
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._backlog = deque(maxlen=backlog)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending_counts = set()
+        self._counts_lock = threading.Lock()
+        self._counts_ready = threading.Event()
+        self._flusher_pid = None
+
+    # Publishing
+
+    def publish(self, event_type, data):
+        self.deliver(event_type, data)
+
+    def counts_changed(self, prayer_ids):
+        """Queue ``count`` events for ``prayer_ids``, coalesced per interval."""
+        if not self.has_subscribers():
+            return
+        with self._counts_lock:
+            self._pending_counts.update(prayer_ids)
+        if self.coalesce_interval:
+            self._ensure_flusher()
+            self._counts_ready.set()
+        else:
+            self.flush_counts()
+
+    def flush_counts(self):
+        """Publish one ``count`` event per prayer changed since the last flush."""
+        from mainapp.models import PrayerRequest
+
+        with self._counts_lock:
+            ids, self._pending_counts = self._pending_counts, set()
+        if not ids:
+            return 0
+        counts = PrayerRequest.objects.filter(pk__in=ids, approved=True).values_list('pk', 'prayer_count')
+        published = 0
+        for pk, prayer_count in counts:
+            self.publish('count', {'id': pk, 'prayer_count': prayer_count})
+            published += 1
+        return published
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def deliver(self, event_type, data, event_id=None):
+        """Hand an event to this process's subscribers."""
+        with self._lock:
+            event = Event(event_id or next(self._ids), event_type, data)
+            self._backlog.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    # Subscribing
+
+    def subscribe(self, last_event_id=None):
+        return self._add(Subscription(self, self.max_queue), last_event_id)
+
+    def asubscribe(self, last_event_id=None):
+        return self._add(AsyncSubscription(self, self.max_queue), last_event_id)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _add(self, subscription, last_event_id):
+        with self._lock:
+            if last_event_id is not None:
+                self._replay(subscription, last_event_id)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def _replay(self, subscription, last_event_id):
+        newest = self._backlog[-1].id if self._backlog else 0
+        oldest = self._backlog[0].id if self._backlog else newest + 1
+        if last_event_id > newest or last_event_id < oldest - 1:
+            subscription.put(Event(0, RESET, {}))
+            return
+        for event in self._backlog:
+            if event.id > last_event_id:
+                subscription.put(event)
+
+    # Count coalescing
+
+    def _ensure_flusher(self):
+        # Started lazily and per process, so forked workers get their own
+        if self._flusher_pid == os.getpid():
+            return
+        with self._counts_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._run_flusher, name='prayer-events-flusher', daemon=True).start()
+            self._flusher_pid = os.getpid()
+
+    def _run_flusher(self):
+        while True:
+            self._counts_ready.wait()
+            time.sleep(self.coalesce_interval)
+            self._counts_ready.clear()
+            close_old_connections()
+            try:
+                self.flush_counts()
+            except Exception:
+                logger.exception('Failed to publish prayer counts')
+
+
+class CacheBroker(LocalBroker):
+    """
+    Share events between processes through a Django cache.
+
+    Each event is stored under a sequence number taken with ``incr``; every
+    process polls the sequence and hands new events to its own
+    subscribers, so event ids are the same in every worker. The cache must
+    be shared and support atomic ``incr``.
+
+    A publisher takes its number before it stores the event, so a poll can
+    find a number without its event. Polling stops there until the event
+    arrives; only numbers still missing ``gap_timeout`` seconds later (the
+    publisher died, or the event expired) are given up on.
+    """
+
+    def __init__(self, cache_alias='default', key_prefix='prayer-events', poll_interval=0.5,
+                 event_timeout=300, gap_timeout=5.0, **options):
+        super().__init__(**options)
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.poll_interval = poll_interval
+        self.event_timeout = event_timeout
+        self.gap_timeout = gap_timeout
+        self._gap = None  # (last_seen, newest id then, since) while waiting on a missing event
+        self._poller_pid = None
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def sequence_key(self):
+        return f'{self.key_prefix}:sequence'
+
+    def publish(self, event_type, data):
+        self.cache.add(self.sequence_key, 0, timeout=None)
+        try:
+            event_id = self.cache.incr(self.sequence_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            self.cache.add(self.sequence_key, 1, timeout=None)
+            event_id = 1
+        self.cache.set(f'{self.key_prefix}:{event_id}', (event_type, data), self.event_timeout)
+
+    def has_subscribers(self):
+        return True  # They may be in another process
+
+    def _add(self, subscription, last_event_id):
+        self._ensure_poller()
+        return super()._add(subscription, last_event_id)
+
+    def poll(self, last_seen):
+        """Deliver events published after ``last_seen``; returns the newest id seen."""
+        current = self.cache.get(self.sequence_key, 0)
+        if current <= last_seen:
+            return current
+        keys = {event_id: f'{self.key_prefix}:{event_id}' for event_id in range(last_seen + 1, current + 1)}
+        found = self.cache.get_many(keys.values())
+        lost_up_to = self._lost_up_to(last_seen, current)
+        for event_id, key in keys.items():
+            if key in found:
+                event_type, data = found[key]
+                self.deliver(event_type, data, event_id=event_id)
+            elif event_id > lost_up_to:
+                # Numbered but not stored yet: wait for it rather than skip it
+                return event_id - 1
+        self._gap = None
+        return current
+
+    def _lost_up_to(self, last_seen, current):
+        """Newest id whose missing event is given up on, after waiting ``gap_timeout``"""
+        now = time.monotonic()
+        if self._gap is None or self._gap[0] != last_seen:
+            self._gap = (last_seen, current, now)
+        _, newest, since = self._gap
+        # Only ids taken before the wait began: later ones may still be in flight
+        return newest if now - since >= self.gap_timeout else last_seen
+
+    def _ensure_poller(self):
+        if self._poller_pid == os.getpid():
+            return
+        with self._lock:
+            if self._poller_pid == os.getpid():
+                return
+            last_seen = self.cache.get(self.sequence_key, 0)
+            threading.Thread(target=self._run_poller, args=(last_seen,), name='prayer-events-poller', daemon=True).start()
+            self._poller_pid = os.getpid()
+
+    def _run_poller(self, last_seen):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                last_seen = self.poll(last_seen)
+            except Exception:
+                logger.exception('Failed to poll prayer events')
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Return the process-wide broker configured by ``PRAYER_EVENTS``."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = import_string(events_setting('BACKEND'))
+                _broker = backend(**events_setting('OPTIONS'))
+    return _broker
+
+
+@receiver(setting_changed)
+def _reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'PRAYER_EVENTS':
+        _broker = None
+
+
+# Streams
+
+def last_event_id(request):
+    try:
+        return int(request.headers.get('Last-Event-ID') or request.GET['last_event_id'])
+    except (KeyError, ValueError):
+        return None
+
+
+def stream_events(broker, last_event_id=None):
+    """``text/event-stream`` body for a blocking consumer; ends after MAX_STREAM_SECONDS."""
+    keepalive = events_setting('KEEPALIVE')
+    deadline = time.monotonic() + events_setting('MAX_STREAM_SECONDS')
+    # Subscribing on the first read means a response that is never sent
+    # leaves nothing behind
+    with broker.subscribe(last_event_id) as subscription:
+        yield 'retry: 3000\n\n'
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = subscription.get(timeout=min(keepalive, remaining))
+            yield format_event(event) if event else ': keep-alive\n\n'
+
+
+async def astream_events(broker, last_event_id=None):
+    """Async ``stream_events()``; runs until the client goes away."""
+    keepalive = events_setting('KEEPALIVE')
+    with broker.asubscribe(last_event_id) as subscription:
+        yield 'retry: 3000\n\n'
+        while True:
+            event = await subscription.get(timeout=keepalive)
+            yield format_event(event) if event else ': keep-alive\n\n'
@@ -0,0 +1,66 @@
+"""
+Text fingerprints for spotting the same prayer submitted twice.
+
+``normalize`` folds case, accents, punctuation and spacing, so "Pray for
+my Mother!" and "pray for my mother" are the same text. ``fingerprint`` is
+a short hash of that, for exact repeats. ``simhash`` is a 64-bit hash of
+the text's word shingles in which similar texts get similar bits: a typo
+fixed or a word added flips a few bits, an unrelated text about half of
+them, so ``distance`` (differing bits) measures how near two texts are.
+That only holds for texts of many shingles: in a short one a single
+changed word is a large share of the shingles and can still land within a
+few bits, so ``shingle_count`` tells callers when to trust it.
+"""
+import hashlib
+import re
+import unicodedata
+
+WORD = re.compile(r'\w+')
+
+SHINGLE_SIZE = 2
+
+BITS = 64
+MASK = (1 << BITS) - 1
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(WORD.findall(text.casefold()))
+
+
+def _hash(text, size=8):
+    return hashlib.blake2b(text.encode(), digest_size=size).digest()
+
+
+def fingerprint(text):
+    """16 hex digits; equal for texts that only differ in case, accents or punctuation"""
+    return _hash(normalize(text)).hex()
+
+
+def shingle_count(text):
+    """Number of word shingles ``simhash`` combines for ``text``"""
+    words = len(normalize(text).split())
+    return max(words - SHINGLE_SIZE + 1, 1) if words else 0
+
+
+def simhash(text):
+    """Signed 64-bit similarity hash (it fits a BigIntegerField), 0 for empty text"""
+    words = normalize(text).split()
+    if not words:
+        return 0
+    size = min(SHINGLE_SIZE, len(words))
+    bits = [
+        format(int.from_bytes(_hash(' '.join(words[i:i + size])), 'big'), f'0{BITS}b')
+        for i in range(len(words) - size + 1)
+    ]
+    # Each bit is set if most shingles' hashes have it set; counted a
+    # column of the bit strings at a time, which is far quicker in Python
+    half = len(bits) / 2
+    value = int(''.join('1' if column.count('1') > half else '0' for column in zip(*bits)), 2)
+    return value - (1 << BITS) if value >> (BITS - 1) else value
+
+
+def distance(a, b):
+    """Number of differing bits between two simhashes"""
+    return ((a ^ b) & MASK).bit_count()
@@ -1,3 +1,5 @@
+import uuid
+
 from django import forms
 from .models import MediaFile, ContactMessage, PrayerRequest
 
@@ -15,6 +17,9 @@ class MediaUploadForm(forms.ModelForm):
 
 
 class PrayerRequestForm(forms.ModelForm):
+    # New per rendered form: resubmitting the same form can't add the prayer twice
+    idempotency_key = forms.CharField(required=False, max_length=64, widget=forms.HiddenInput)
+
     class Meta:
         model = PrayerRequest
         fields = ['name', 'message']
@@ -36,6 +41,11 @@ class PrayerRequestForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not self.is_bound:
+            self.fields['idempotency_key'].initial = uuid.uuid4().hex
+
     def clean_name(self):
         name = self.cleaned_data.get('name')
         if not name:
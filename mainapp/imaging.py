@@ -0,0 +1,152 @@
+"""
+Responsive image variants for gallery uploads.
+
+Each uploaded photo gets a handful of downscaled copies written next to the
+original (``uploads/photo.jpg`` -> ``uploads/photo_320w.webp``, ...), so the
+gallery grid can offer the browser a ``srcset`` and let it pick the smallest
+file that fills the tile instead of downloading the full original.
+
+Pillow is optional; without it no variants are produced and templates fall
+back to the original file.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # pragma: no cover - Pillow is an optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VARIANT_WIDTHS = (320, 640, 1024, 1600)
+
+# Pillow format name -> (file extension, mime type, save options)
+VARIANT_FORMATS = {
+    'WEBP': ('webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'JPEG': ('jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'PNG': ('png', 'image/png', {'optimize': True}),
+}
+
+# Extensions the pipeline will try to open; everything else is left alone.
+SOURCE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif'}
+
+
+def imaging_available():
+    return Image is not None
+
+
+def variant_widths():
+    return tuple(getattr(settings, 'MEDIA_VARIANT_WIDTHS', DEFAULT_VARIANT_WIDTHS))
+
+
+def variant_name(source_name, width, extension):
+    """``uploads/photo.jpg`` -> ``uploads/photo_640w.webp``"""
+    stem = os.path.splitext(source_name)[0]
+    return f'{stem}_{width}w.{extension}'
+
+
+def can_have_variants(name):
+    extension = os.path.splitext(name)[1].lstrip('.').lower()
+    return imaging_available() and extension in SOURCE_EXTENSIONS
+
+
+def _fallback_format(image):
+    """Format for browsers without WebP: keep transparency as PNG, else JPEG."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    return 'PNG' if has_alpha else 'JPEG'
+
+
+def _encode(image, pillow_format):
+    extension, mime_type, options = VARIANT_FORMATS[pillow_format]
+    if pillow_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return extension, mime_type, buffer.getvalue()
+
+
+def build_variants(source_name, storage=None, widths=None):
+    """
+    Write resized WebP and JPEG/PNG variants of ``source_name`` to ``storage``.
+
+    Returns a list of ``{'name', 'width', 'height', 'mime_type'}`` dicts,
+    smallest first. Widths at or above the original's are skipped, except
+    that an image smaller than every configured width still gets one
+    same-size WebP copy. Animated images are left untouched.
+    """
+    storage = storage or default_storage
+    if not can_have_variants(source_name):
+        return []
+
+    with storage.open(source_name, 'rb') as fh:
+        original = Image.open(fh)
+        if getattr(original, 'is_animated', False):
+            return []
+        original = ImageOps.exif_transpose(original)
+        original.load()
+
+    widths = [w for w in widths or variant_widths() if w < original.width] or [original.width]
+    fallback_format = _fallback_format(original)
+
+    variants = []
+    for width in sorted(set(widths)):
+        resized = original.copy()
+        resized.thumbnail((width, original.height), Image.LANCZOS)
+        for pillow_format in ('WEBP', fallback_format):
+            extension, mime_type, data = _encode(resized, pillow_format)
+            name = variant_name(source_name, width, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            name = storage.save(name, ContentFile(data))
+            variants.append({
+                'name': name,
+                'width': resized.width,
+                'height': resized.height,
+                'mime_type': mime_type,
+            })
+    return variants
+
+
+def build_variants_at(location, source_name, widths=None):
+    """
+    Process-pool entry point for ``build_variants``.
+
+    Takes plain values only, so workers can be spawned without setting up
+    Django or touching the database.
+    """
+    return build_variants(source_name, FileSystemStorage(location=location), widths)
+
+
+def delete_variants(variants, storage=None):
+    storage = storage or default_storage
+    for variant in variants or []:
+        try:
+            storage.delete(variant['name'])
+        except OSError:
+            pass
+
+
+def generate_variants_for(media):
+    """
+    Build and record variants for a ``MediaFile``.
+
+    Failures are logged and swallowed so a bad upload never breaks the
+    request that saved it. Returns the stored variant list.
+    """
+    name = media.file.name
+    if not name or not can_have_variants(name) or not media.file.storage.exists(name):
+        return []
+    try:
+        variants = build_variants(name)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('Could not generate variants for %s', name, exc_info=True)
+        return []
+    type(media).objects.filter(pk=media.pk).update(variants=variants)
+    media.variants = variants
+    return variants
@@ -0,0 +1,313 @@
+"""
+Opt-in per-request instrumentation: where does the time go?
+
+``InstrumentationMiddleware`` times every request and splits the time
+into the ORM (every query, on every database) and template rendering
+(excluding the queries templates trigger). It counts queries and spots
+N+1 patterns: the same SQL run again and again with different parameters.
+A sample of requests is run under cProfile, and the profiles of the slow
+ones are written to disk. Everything is configured with
+``INSTRUMENTATION``:
+
+    INSTRUMENTATION = {
+        'ENABLED': False,
+        'SAMPLE_RATE': 0.01,          # share of requests run under cProfile
+        'SAMPLE_INTERVAL_MS': 1,      # stack samples for the flame graph
+        'SLOW_REQUEST_MS': 500,       # keep profiles (and warn) above this
+        'PROFILE_DIR': BASE_DIR / 'profiles',
+        'DUPLICATE_QUERY_THRESHOLD': 5,  # same SQL this often: N+1 warning
+        'SERVER_TIMING': True,        # Server-Timing header for browser dev tools
+    }
+
+Each request logs a line to the ``mainapp.instrumentation`` logger (DEBUG,
+or WARNING when slow or N+1). With ``SERVER_TIMING`` the numbers are also
+sent as a ``Server-Timing`` header, so anyone can read them; turn it off
+on a public site.
+
+Profiles are written as ``<time>-<view>-<ms>ms.prof`` (open with snakeviz,
+``python -m pstats`` ...) next to a ``.folded`` file for flamegraph.pl or
+speedscope. cProfile only records caller/callee pairs, so the ``.folded``
+stacks come from sampling the request's thread every
+``SAMPLE_INTERVAL_MS`` while it is profiled.
+
+When ``ENABLED`` is false the middleware removes itself and nothing is
+patched, so it costs nothing. When enabled but not sampling, each query
+costs a timer call and a dict update. Timings cover the view, not the
+streaming of a ``StreamingHttpResponse``. cProfile only sees the thread
+the request runs in; for async views that is the event loop, so work
+moved to ``sync_to_async`` threads isn't in the profile (it is still
+counted in the timings).
+"""
+import cProfile
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.0,
+    'SAMPLE_INTERVAL_MS': 1,
+    'SLOW_REQUEST_MS': 500,
+    'PROFILE_DIR': 'profiles',
+    'DUPLICATE_QUERY_THRESHOLD': 5,
+    'SERVER_TIMING': True,
+}
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_stats', default=None)
+
+
+def instrumentation_setting(name):
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'INSTRUMENTATION', {})}[name]
+
+
+class RequestStats:
+    """Timings and queries of one request, filled in while it runs."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.queries = Counter()  # SQL -> times run
+        self.rendering = 0  # Depth of nested renders; only the outermost is timed
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def repeated_queries(self, threshold):
+        """(SQL, count) for statements run at least ``threshold`` times, most first"""
+        return [(sql, count) for sql, count in self.queries.most_common() if count >= threshold]
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+
+def current_stats():
+    """Stats of the request being instrumented in this context, or None."""
+    return _current.get()
+
+
+@contextmanager
+def measure_request():
+    """
+    Collect ``RequestStats`` for the block (needs ``install_hooks()``).
+
+    Nested blocks share the outermost block's stats, so the middleware and
+    ``mainapp.metrics`` can both measure a request without double hooks.
+    """
+    stats = _current.get()
+    if stats is not None:
+        yield stats
+        return
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        stats.finish()
+        _current.reset(token)
+
+
+# Hooks, installed once the middleware is enabled
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries[sql] += 1
+
+
+def _add_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None or stats.rendering:
+            return render(self, context, request)
+        stats.rendering += 1
+        started, db_before = time.perf_counter(), stats.db_time
+        try:
+            return render(self, context, request)
+        finally:
+            stats.rendering -= 1
+            stats.template_time += time.perf_counter() - started - (stats.db_time - db_before)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+def install_hooks():
+    """Record queries on every connection and time top-level template renders."""
+    from django.template.backends.django import Template
+
+    connection_created.connect(_add_query_recorder, dispatch_uid='mainapp.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        _add_query_recorder(connection)
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = _timed_render(Template.render)
+
+
+# Profiles
+
+class StackSampler(threading.Thread):
+    """Record the stack of another thread every ``interval`` seconds."""
+
+    def __init__(self, thread_id, interval=0.001):
+        super().__init__(name='instrumentation-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def folded(self):
+        """Collapsed stacks, ``a;b;c <samples>`` per line"""
+        return [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+
+
+class Profiler:
+    """cProfile plus a stack sampler for one request, on the current thread."""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), interval)
+
+    def start(self):
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+
+    def save(self, label):
+        """Write ``.prof`` and ``.folded`` files; return the path without extension."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{time.strftime("%Y%m%d-%H%M%S")}-{label}')
+        self.profile.dump_stats(f'{path}.prof')
+        with open(f'{path}.folded', 'w') as f:
+            f.writelines(f'{line}\n' for line in self.sampler.folded())
+        return path
+
+
+# Middleware
+
+class InstrumentationMiddleware:
+    """Time each request, count its queries and profile a sample of them."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not instrumentation_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        install_hooks()
+        self.get_response = get_response
+        self.sample_rate = instrumentation_setting('SAMPLE_RATE')
+        self.sample_interval = instrumentation_setting('SAMPLE_INTERVAL_MS') / 1000
+        self.profile_dir = instrumentation_setting('PROFILE_DIR')
+        self.slow = instrumentation_setting('SLOW_REQUEST_MS') / 1000
+        self.threshold = instrumentation_setting('DUPLICATE_QUERY_THRESHOLD')
+        self.server_timing = instrumentation_setting('SERVER_TIMING')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = self.start_profile()
+        with measure_request() as stats:
+            try:
+                response = self.get_response(request)
+            finally:
+                if profile is not None:
+                    profile.stop()
+        return self.process_response(request, response, stats, profile)
+
+    async def __acall__(self, request):
+        profile = self.start_profile()
+        with measure_request() as stats:
+            try:
+                response = await self.get_response(request)
+            finally:
+                if profile is not None:
+                    profile.stop()
+        return self.process_response(request, response, stats, profile)
+
+    def start_profile(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            profile = Profiler(self.profile_dir, self.sample_interval)
+            profile.start()
+            return profile
+        return None
+
+    def process_response(self, request, response, stats, profile):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        repeated = stats.repeated_queries(self.threshold)
+        slow = stats.duration >= self.slow
+        summary = (
+            f'{request.method} {request.path} {view} {response.status_code} {stats.duration * 1000:.1f}ms '
+            f'db={stats.db_time * 1000:.1f}ms/{stats.query_count}q template={stats.template_time * 1000:.1f}ms'
+        )
+        if profile is not None and slow:
+            label = re.sub(r'[^\w.-]+', '_', view)
+            summary += f' profile={profile.save(f"{label}-{stats.duration * 1000:.0f}ms")}.prof'
+        if repeated:
+            details = '; '.join(f'{count}x {sql[:200]}' for sql, count in repeated[:3])
+            logger.warning('%s; possible N+1: %s', summary, details)
+        elif slow:
+            logger.warning('%s; slow', summary)
+        else:
+            logger.debug(summary)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'total;dur={stats.duration * 1000:.1f}, '
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries", '
+                f'template;dur={stats.template_time * 1000:.1f}'
+            )
+        request.instrumentation = stats
+        return response
@@ -0,0 +1,400 @@
+"""
+Background jobs: work that shouldn't hold up a request.
+
+A job is a call to a module-level function, queued with
+
+    get_job_queue().enqueue(process_media, media.pk)
+    get_job_queue().enqueue_on_commit(process_media, media.pk)
+    get_job_queue().enqueue_once(send_notification_digest, 600)  # batched
+
+and run later by a worker. The queue is chosen with ``JOB_QUEUE``:
+
+    JOB_QUEUE = {
+        'BACKEND': 'mainapp.jobqueue.DatabaseJobQueue',   # or LocalJobQueue
+        'OPTIONS': {
+            'workers': 2,              # in-process worker threads; 0 with runworker
+            'poll_interval': 5,        # seconds between looks for due jobs
+            'max_attempts': 3,
+            'backoff': 10,             # first retry delay, doubled per attempt
+            'max_backoff': 3600,
+            'visibility_timeout': 600, # a job running this long is presumed dead
+        },
+        'LANES': {'high': 0, 'default': 10, 'low': 20},
+        'EAGER': False,  # run jobs inline, e.g. in tests
+    }
+
+``DatabaseJobQueue`` stores jobs in the ``Job`` table, so they survive
+restarts and need no broker. Enqueueing is one INSERT; inside a transaction
+it commits (or rolls back) with the rows the job is about. Jobs are run by
+``manage.py runworker`` and, unless ``workers`` is 0, by a few threads in
+each web process, which an enqueue in the same process wakes at once.
+Workers claim a job with a conditional UPDATE, so any number of them can
+share the table. A failing job is retried with exponential backoff and
+kept as ``failed`` after ``max_attempts``; a successful one is deleted.
+
+Lanes order the work: due jobs run in lane priority order and workers can
+be dedicated to lanes (``runworker --lane high``). Functions choose their
+lane and retry policy with ``@job(lane='low', max_attempts=5)``.
+
+``LocalJobQueue`` keeps jobs in memory instead: nothing to set up, but
+queued jobs are lost with the process and failures are only logged. A
+local job runs in a copy of the context it was enqueued from, so e.g. a
+request pinned to the primary database (``mainapp.db_routers``) pins its
+jobs too; database jobs always read from the primary.
+"""
+import contextvars
+import logging
+import os
+import queue
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_QUEUE = {
+    'BACKEND': 'mainapp.jobqueue.DatabaseJobQueue',
+    'OPTIONS': {},
+    'LANES': {'high': 0, 'default': 10, 'low': 20},
+    'EAGER': False,
+}
+
+DEFAULT_LANE = 'default'
+
+
+def job_queue_setting(name):
+    return {**DEFAULT_JOB_QUEUE, **getattr(settings, 'JOB_QUEUE', {})}[name]
+
+
+def job(lane=DEFAULT_LANE, max_attempts=None):
+    """Set the lane and retry limit for every enqueue of the decorated function."""
+    def decorator(func):
+        func.job_options = {'lane': lane, 'max_attempts': max_attempts}
+        return func
+    return decorator
+
+
+def job_path(func):
+    """Dotted path of ``func``; only module-level functions can be stored."""
+    path = f'{func.__module__}.{func.__qualname__}'
+    try:
+        found = import_string(path)
+    except ImportError:
+        found = None
+    if found is not func:
+        raise ValueError(f'{path} is not importable; jobs must be module-level functions.')
+    return path
+
+
+def run_job(func, args, kwargs):
+    """Run one job, logging rather than raising its failure."""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background job %s failed', getattr(func, '__qualname__', func))
+        return False
+    return True
+
+
+class BaseJobQueue:
+    """Interface shared by all job queues."""
+
+    def __init__(self, workers=2, eager=False, **options):
+        self.workers = workers
+        self.eager = eager
+        self.options = options
+
+    def enqueue(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the background."""
+        if self.eager:
+            run_job(func, args, kwargs)
+        else:
+            self.push(func, args, kwargs)
+
+    def enqueue_on_commit(self, func, *args, **kwargs):
+        """Enqueue once the current transaction commits, so the job sees its rows."""
+        transaction.on_commit(lambda: self.enqueue(func, *args, **kwargs))
+
+    def enqueue_once(self, func, delay=0):
+        """
+        Run ``func()`` in ``delay`` seconds, unless a run is already waiting.
+
+        For batching: however many times this is called before the run, the
+        function runs once and handles everything that accumulated.
+        """
+        if self.eager:
+            run_job(func, (), {})
+        else:
+            self.push_once(func, delay)
+
+    def push(self, func, args, kwargs):
+        raise NotImplementedError('subclasses of BaseJobQueue must provide a push() method')
+
+    def push_once(self, func, delay):
+        raise NotImplementedError('subclasses of BaseJobQueue must provide a push_once() method')
+
+    def qsize(self):
+        """Jobs waiting to run."""
+        return 0
+
+
+class LocalJobQueue(BaseJobQueue):
+    """Jobs in process memory, run by a pool of daemon threads."""
+
+    def __init__(self, workers=2, eager=False, **options):
+        super().__init__(max(1, workers), eager, **options)
+        self._queue = queue.Queue()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._scheduled = set()
+
+    def push(self, func, args, kwargs):
+        self._ensure_workers()
+        self._queue.put((contextvars.copy_context(), func, args, kwargs))
+
+    def push_once(self, func, delay):
+        with self._lock:
+            if func in self._scheduled:
+                return
+            self._scheduled.add(func)
+        timer = threading.Timer(delay, self._push_scheduled, args=(func,))
+        timer.daemon = True
+        timer.start()
+
+    def _push_scheduled(self, func):
+        with self._lock:
+            self._scheduled.discard(func)
+        self.push(func, (), {})
+
+    def join(self):
+        """Block until every queued job has finished."""
+        self._queue.join()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _ensure_workers(self):
+        # Started lazily and per process, so forked server workers get their own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._work, name=f'local-job-queue-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _work(self):
+        while True:
+            context, func, args, kwargs = self._queue.get()
+            try:
+                close_old_connections()
+                context.run(run_job, func, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+
+class DatabaseJobQueue(BaseJobQueue):
+    """Durable jobs in the ``Job`` table, with retries and priority lanes."""
+
+    def __init__(self, workers=2, eager=False, poll_interval=5, max_attempts=3, backoff=10,
+                 max_backoff=3600, visibility_timeout=600, **options):
+        super().__init__(workers, eager, **options)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.visibility_timeout = visibility_timeout
+        self._wake = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def lanes(self):
+        return job_queue_setting('LANES')
+
+    # Enqueueing
+
+    def push(self, func, args, kwargs, run_at=None):
+        from mainapp.models import Job
+
+        options = getattr(func, 'job_options', {})
+        lane = options.get('lane', DEFAULT_LANE)
+        try:
+            priority = self.lanes()[lane]
+        except KeyError:
+            raise ValueError(f'Unknown job lane {lane!r}.') from None
+        created = Job.objects.create(
+            func=job_path(func), args=list(args), kwargs=kwargs, lane=lane, priority=priority,
+            max_attempts=options.get('max_attempts') or self.max_attempts,
+            run_at=run_at or timezone.now(),
+        )
+        if self.workers:
+            self._ensure_workers()
+            transaction.on_commit(self._wake.set)
+        return created
+
+    def enqueue_on_commit(self, func, *args, **kwargs):
+        if self.eager:
+            return super().enqueue_on_commit(func, *args, **kwargs)
+        # The row itself only appears when the transaction commits
+        self.push(func, args, kwargs)
+
+    def push_once(self, func, delay):
+        from mainapp.models import Job
+
+        # Racing requests may both insert; the batch job copes with an empty run
+        if Job.objects.filter(status=Job.STATUS_QUEUED, func=job_path(func)).exists():
+            return
+        self.push(func, (), {}, run_at=timezone.now() + timedelta(seconds=delay))
+
+    def qsize(self):
+        from mainapp.models import Job
+
+        return Job.objects.filter(status=Job.STATUS_QUEUED).count()
+
+    # Working
+
+    def claim(self, worker_id, lanes=None):
+        """Take the next due job, or return None when there isn't one."""
+        from mainapp.models import Job
+
+        due = Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=timezone.now())
+        if lanes:
+            due = due.filter(lane__in=lanes)
+        # A few candidates, so workers racing for the first one don't all come back empty
+        for pk in due.order_by('priority', 'run_at', 'id').values_list('pk', flat=True)[:5]:
+            claimed = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+                status=Job.STATUS_RUNNING, locked_by=worker_id, locked_at=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return Job.objects.get(pk=pk)
+        return None
+
+    def run(self, claimed):
+        """Run a claimed job; delete it on success, else schedule a retry or give up."""
+        from mainapp.db_routers import use_primary
+        from mainapp.models import Job
+
+        try:
+            func = import_string(claimed.func)
+            # Read what the enqueuing request wrote, not a lagging replica's copy
+            with use_primary():
+                func(*claimed.args, **claimed.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            mine = Job.objects.filter(pk=claimed.pk, locked_by=claimed.locked_by)
+            if claimed.attempts >= claimed.max_attempts:
+                logger.exception('Job %s failed for good after %s attempts', claimed.func, claimed.attempts)
+                mine.update(status=Job.STATUS_FAILED, last_error=error, locked_by='', locked_at=None)
+            else:
+                logger.warning('Job %s failed (attempt %s), retrying', claimed.func, claimed.attempts, exc_info=True)
+                mine.update(
+                    status=Job.STATUS_QUEUED, last_error=error, locked_by='', locked_at=None,
+                    run_at=timezone.now() + self.retry_delay(claimed.attempts),
+                )
+            return False
+        Job.objects.filter(pk=claimed.pk).delete()
+        return True
+
+    def retry_delay(self, attempts):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+        # Jitter, so jobs that failed together don't all retry together
+        return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+    def requeue_stale(self):
+        """Put back jobs whose worker died mid-run. Returns how many."""
+        from mainapp.models import Job
+
+        cutoff = timezone.now() - timedelta(seconds=self.visibility_timeout)
+        return Job.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=cutoff).update(
+            status=Job.STATUS_QUEUED, locked_by='', locked_at=None,
+        )
+
+    def run_due(self, worker_id, lanes=None, stop=None):
+        """Run jobs until none is due (or ``stop`` is set). Returns the number run."""
+        done = 0
+        while stop is None or not stop.is_set():
+            claimed = self.claim(worker_id, lanes)
+            if claimed is None:
+                break
+            self.run(claimed)
+            done += 1
+        return done
+
+    def work(self, stop, worker_id, lanes=None, burst=False):
+        """
+        Run jobs as they fall due until ``stop`` is set. Returns the number run.
+
+        With ``burst`` it returns as soon as no job is due.
+        """
+        done = 0
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                done += self.run_due(worker_id, lanes, stop)
+            except Exception:
+                logger.exception('Failed to claim a job')
+            if burst:
+                break
+            # Idle: sleep until the next poll, or until this process enqueues
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        close_old_connections()
+        return done
+
+    def _ensure_workers(self):
+        # Started lazily and per process, so forked server workers get their own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            stop = threading.Event()  # never set: daemon threads end with the process
+            for i in range(self.workers):
+                worker_id = f'{worker_name()}:in-process-{i}'
+                threading.Thread(
+                    target=self.work, args=(stop, worker_id), name=f'job-queue-{i}', daemon=True
+                ).start()
+            self._pid = os.getpid()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide queue configured by ``JOB_QUEUE``."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                backend = import_string(job_queue_setting('BACKEND'))
+                _job_queue = backend(eager=job_queue_setting('EAGER'), **job_queue_setting('OPTIONS'))
+    return _job_queue
+
+
+@receiver(setting_changed)
+def _reset_job_queue(setting, **kwargs):
+    global _job_queue
+    if setting == 'JOB_QUEUE':
+        _job_queue = None
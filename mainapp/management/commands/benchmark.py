@@ -0,0 +1,530 @@
+import http.client
+import json
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack
+from importlib import import_module
+from io import BytesIO
+from urllib.parse import urlencode, urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from mainapp import urls as mainapp_urls
+from mainapp.benchmarking import SCALES, WORDS, compare_results, scratch_database, seed_database, sentence, summarize
+from mainapp.models import MediaFile, PrayerRequest
+
+# Share of scenarios that write, per --mix
+MIXES = {'read': 0.0, 'typical': 0.15, 'busy': 0.4, 'write': 1.0}
+
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+
+Request = namedtuple('Request', 'label method path data content_type headers staff stream', defaults=(None, None, {}, False, False))
+Response = namedtuple('Response', 'status headers body')
+Scenario = namedtuple('Scenario', 'label routes kind weight run pool', defaults=(None,))
+
+
+# Scenarios: generators yielding Requests and receiving each Response, so
+# a scenario can follow a cursor or walk through an upload.
+
+def page(name, label=None):
+    def run(work, rng):
+        yield Request(label or name, 'get', reverse(name))
+    return run
+
+
+def browse_gallery(work, rng):
+    query = {'kind': rng.choice(['', MediaFile.KIND_IMAGE, MediaFile.KIND_VIDEO])}
+    response = yield Request('gallery_page', 'get', f'{reverse("gallery_page")}?{urlencode(query)}')
+    cursor = json.loads(response.body).get('next_cursor')
+    if cursor:
+        yield Request('gallery_page', 'get', f'{reverse("gallery_page")}?{urlencode({**query, "cursor": cursor})}')
+
+
+def search_prayers(work, rng):
+    # The last word cut short, as while typing: it's matched as a prefix
+    query = ' '.join(rng.sample(WORDS, rng.randint(1, 2)))[:-1]
+    yield Request('prayer_search', 'get', f'{reverse("prayer_search")}?{urlencode({"q": query})}')
+
+
+def watch_prayer_wall(work, rng):
+    # Time to the first byte of the stream; the connection is dropped after it
+    yield Request('prayer_events', 'get', reverse('prayer_events'), stream=True)
+
+
+def poll_api(work, rng):
+    url = f'{reverse("api_prayer_list")}?page_size={rng.choice([10, 20, 50])}'
+    response = yield Request('api_prayer_list', 'get', url)
+    etag = response.headers.get('ETag')
+    if etag:
+        yield Request('api_prayer_list:304', 'get', url, headers={'If-None-Match': etag})
+
+
+def api_detail(work, rng):
+    yield Request('api_prayer_detail', 'get', reverse('api_prayer_detail', args=[rng.choice(work.prayer_ids)]))
+
+
+def moderation_queue(work, rng):
+    yield Request('manage_prayers', 'get', f'{reverse("manage_prayers")}?status=pending', staff=True)
+
+
+def prayer_form(name):
+    def run(work, rng):
+        data = {'name': f'Visitor {rng.randrange(10_000)}', 'message': sentence(rng)}
+        yield Request(f'{name}:post', 'post', reverse(name), data)
+    return run
+
+
+def contact_form(work, rng):
+    data = {
+        'name': 'Visitor', 'email': 'visitor@example.com', 'subject': sentence(rng, 4), 'message': sentence(rng, 30),
+    }
+    yield Request('contact:post', 'post', reverse('contact'), data)
+
+
+def upload_media(work, rng):
+    data = {'file': SimpleUploadedFile('photo.jpg', work.image, content_type='image/jpeg')}
+    yield Request('gallery:post', 'post', reverse('gallery'), data)
+
+
+def submit_prayer(work, rng):
+    data = {'name': f'Visitor {rng.randrange(10_000)}', 'message': sentence(rng)}
+    yield Request('submit_prayer_ajax', 'post', reverse('submit_prayer_ajax'), data, headers=XHR)
+
+
+def pray(work, rng):
+    yield Request('increment_prayer', 'post', reverse('increment_prayer', args=[rng.choice(work.prayer_ids)]))
+
+
+def delete_prayer(work, rng):
+    prayer_id = work.take('prayers')
+    if prayer_id:
+        yield Request('delete_prayer', 'delete', reverse('delete_prayer', args=[prayer_id]), headers=XHR)
+
+
+def delete_media(work, rng):
+    media_id = work.take('media')
+    if media_id:
+        yield Request('delete_gallery_media', 'delete', reverse('delete_gallery_media', args=[media_id]), headers=XHR)
+
+
+def approve_prayer(work, rng):
+    prayer_id = work.take('pending')
+    if prayer_id:
+        data = {'action': 'approve', 'ids': [str(prayer_id)]}
+        yield Request('manage_prayers:post', 'post', reverse('manage_prayers'), data, staff=True)
+
+
+def chunked_upload(work, rng):
+    body = json.dumps({'filename': 'photo.jpg', 'size': len(work.image)})
+    response = yield Request('chunked_upload_create', 'post', reverse('chunked_upload_create'), body, 'application/json')
+    upload_id = json.loads(response.body)['id']
+    detail = reverse('chunked_upload_detail', args=[upload_id])
+    yield Request(
+        'chunked_upload_detail:put', 'put', detail, work.image, 'application/offset+octet-stream',
+        headers={'Upload-Offset': '0'},
+    )
+    yield Request('chunked_upload_detail', 'get', detail)
+    yield Request('chunked_upload_complete', 'post', reverse('chunked_upload_complete', args=[upload_id]))
+
+
+SCENARIOS = [
+    Scenario('index', ['index'], 'read', 10, page('index')),
+    Scenario('home', ['home'], 'read', 15, page('home')),
+    Scenario('services', ['services'], 'read', 8, page('services')),
+    Scenario('gallery', ['gallery'], 'read', 6, page('gallery')),
+    Scenario('gallery_page', ['gallery_page'], 'read', 6, browse_gallery),
+    Scenario('administration', ['administration'], 'read', 2, page('administration')),
+    Scenario('contact', ['contact'], 'read', 2, page('contact')),
+    Scenario('history', ['history'], 'read', 2, page('history')),
+    Scenario('events', ['events'], 'read', 2, page('events')),
+    Scenario('prayer_search', ['prayer_search'], 'read', 6, search_prayers),
+    Scenario('prayer_events', ['prayer_events'], 'read', 2, watch_prayer_wall),
+    Scenario('api_prayer_list', ['api_prayer_list'], 'read', 8, poll_api),
+    Scenario('api_prayer_detail', ['api_prayer_detail'], 'read', 6, api_detail),
+    Scenario('manage_prayers', ['manage_prayers'], 'read', 2, moderation_queue),
+    Scenario('metrics', ['metrics'], 'read', 1, page('metrics')),
+    Scenario('home:post', ['home'], 'write', 4, prayer_form('home')),
+    Scenario('services:post', ['services'], 'write', 3, prayer_form('services')),
+    Scenario('contact:post', ['contact'], 'write', 3, contact_form),
+    Scenario('gallery:post', ['gallery'], 'write', 1, upload_media),
+    Scenario('submit_prayer_ajax', ['submit_prayer_ajax'], 'write', 10, submit_prayer),
+    Scenario('increment_prayer', ['increment_prayer'], 'write', 30, pray),
+    Scenario('delete_prayer', ['delete_prayer'], 'write', 3, delete_prayer, 'prayers'),
+    Scenario('delete_gallery_media', ['delete_gallery_media'], 'write', 2, delete_media, 'media'),
+    Scenario('manage_prayers:post', ['manage_prayers'], 'write', 2, approve_prayer, 'pending'),
+    Scenario(
+        'chunked_upload', ['chunked_upload_create', 'chunked_upload_detail', 'chunked_upload_complete'], 'write', 1,
+        chunked_upload,
+    ),
+]
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """Names in mainapp.urls that no scenario requests"""
+    covered = {route for scenario in scenarios for route in scenario.routes}
+    return sorted(pattern.name for pattern in mainapp_urls.urlpatterns if pattern.name not in covered)
+
+
+class Workload:
+    """Rows the scenarios act on, set up after seeding."""
+
+    def __init__(self, pools, seed):
+        rng = random.Random(seed)
+        self.prayer_ids = list(
+            PrayerRequest.objects.filter(approved=True).order_by('?').values_list('pk', flat=True)[:1000]
+        ) or [0]
+        self.staff, _ = get_user_model().objects.get_or_create(
+            username='benchmark-staff', defaults={'is_staff': True},
+        )
+        self.image = self.make_image(rng)
+        self._pools = {
+            'prayers': self.bulk_ids(PrayerRequest, pools['prayers'], lambda i: PrayerRequest(
+                name='Benchmark', message=f'Delete me {i}', approved=True, notified_at=timezone.now(),
+            )),
+            'media': self.bulk_ids(MediaFile, pools['media'], lambda i: MediaFile(
+                file=f'uploads/benchmark-delete-{i}.jpg', kind=MediaFile.KIND_IMAGE,
+                processing_status=MediaFile.PROCESSING_READY,
+            )),
+            'pending': self.bulk_ids(PrayerRequest, pools['pending'], lambda i: PrayerRequest(
+                name='Benchmark', message=f'Approve me {i}', notified_at=timezone.now(),
+            )),
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def bulk_ids(model, count, make):
+        rows = model.objects.bulk_create(make(i) for i in range(count))
+        return [row.pk for row in rows]
+
+    @staticmethod
+    def make_image(rng):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), tuple(rng.randrange(256) for _ in range(3))).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def take(self, pool):
+        with self._lock:
+            return self._pools[pool].pop() if self._pools[pool] else None
+
+    def staff_session(self):
+        """A logged-in session key for requests to a live server"""
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(self.staff.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = self.staff.get_session_auth_hash()
+        session.save()
+        return session.session_key
+
+
+# Drivers: send a Request, return a Response
+
+class TestClientDriver:
+    """In-process requests through the full middleware stack, with query counts."""
+
+    counts_queries = True
+
+    def __init__(self, work):
+        self.client = Client()
+        self.staff_client = Client()
+        self.staff_client.force_login(work.staff)
+
+    def send(self, request):
+        client = self.staff_client if request.staff else self.client
+        kwargs = {'headers': request.headers}
+        if request.content_type:
+            kwargs['content_type'] = request.content_type
+        args = (request.path,) if request.data is None else (request.path, request.data)
+        response = getattr(client, request.method)(*args, **kwargs)
+        if response.streaming:
+            body = next(iter(response.streaming_content), b'')
+            response.close()
+        else:
+            body = response.content
+        return Response(response.status_code, response.headers, body)
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPDriver:
+    """Requests to a running server over one keep-alive connection."""
+
+    counts_queries = False
+
+    def __init__(self, url, staff_session):
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        # Django accepts a CSRF token equal to the cookie it came with
+        self.csrf_token = get_random_string(32)
+        self.cookie = f'{settings.CSRF_COOKIE_NAME}={self.csrf_token}'
+        self.staff_cookie = f'{self.cookie}; {settings.SESSION_COOKIE_NAME}={staff_session}'
+        self.connection = None
+
+    def send(self, request):
+        headers = {
+            **request.headers,
+            'Cookie': self.staff_cookie if request.staff else self.cookie,
+            'X-CSRFToken': self.csrf_token,
+        }
+        body = request.data
+        if isinstance(body, dict):
+            body = encode_multipart(BOUNDARY, {**body, 'csrfmiddlewaretoken': self.csrf_token})
+            headers['Content-Type'] = MULTIPART_CONTENT
+        elif body is not None:
+            headers['Content-Type'] = request.content_type
+        try:
+            if self.connection is None:
+                self.connection = self.connection_class(self.netloc, timeout=30)
+            self.connection.request(request.method.upper(), self.prefix + request.path, body, headers)
+            response = self.connection.getresponse()
+            content = response.readline() if request.stream else response.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.close()
+            return Response(0, {}, str(e).encode())
+        if request.stream or response.will_close:
+            self.close()
+        return Response(response.status, response.headers, content)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a database and drive every route in mainapp.urls with a concurrent '
+        'read/write mix, reporting throughput, p50/p95/p99 latency and queries per '
+        'route. Runs in-process against a scratch database by default; to load a '
+        'running server, seed a file with --database DB --seed-only, start the server '
+        'with DB_NAME=DB and RATE_LIMITS_ENABLED=0, then run again with --url and the '
+        'same --database. Save results with --output and flag regressions with --compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small', help='Rows to seed.')
+        for name in ('prayers', 'media', 'messages'):
+            parser.add_argument(f'--{name}', type=int, help=f'Override the number of seeded {name}.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients.')
+        parser.add_argument('--rounds', type=int, default=50, help='Scenarios per client.')
+        parser.add_argument('--mix', choices=list(MIXES), default='typical', help='Share of writes.')
+        parser.add_argument('--route', action='append', dest='routes', help='Only these scenarios or URL names.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for data and request order.')
+        parser.add_argument('--database', help='SQLite file to seed and keep (reused if already seeded).')
+        parser.add_argument('--seed-only', action='store_true', help='Seed --database and exit.')
+        parser.add_argument('--url', help='Base URL of a running server to load instead of the test client.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--compare', help='Earlier --output to compare with; fails on regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown (0.2 = 20%%).')
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f'No benchmark scenario for: {", ".join(missing)}.')
+        if (options['url'] or options['seed_only']) and not options['database']:
+            raise CommandError('--url and --seed-only need --database, the file the server uses.')
+        if options['concurrency'] < 1 or options['rounds'] < 1:
+            raise CommandError('--concurrency and --rounds must be at least 1.')
+        scenarios = self.select(options['routes'])
+        counts = {name: options[name] if options[name] is not None else count for name, count in SCALES[options['scale']].items()}
+
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        overrides = {
+            'MEDIA_ROOT': media_root,
+            'ALLOWED_HOSTS': ['testserver'],
+            'EMAIL_BACKEND': 'django.core.mail.backends.dummy.EmailBackend',
+            # One client sends everything; measure the views, not the 429s
+            'RATE_LIMITS': {'ENABLED': False},
+        }
+        try:
+            with override_settings(**overrides), scratch_database(name=options['database']):
+                if not PrayerRequest.objects.exists():
+                    started = time.perf_counter()
+                    seed_database(**counts, seed=options['seed'])
+                    self.stdout.write(f'Seeded {counts} in {time.perf_counter() - started:.1f}s')
+                if options['seed_only']:
+                    return
+                result = self.run(scenarios, counts, options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.report(result)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+        if options['compare']:
+            with open(options['compare']) as f:
+                regressions = compare_results(json.load(f), result, options['tolerance'])
+            for line in regressions:
+                self.stderr.write(f'Regression: {line}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}.')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
+
+    def select(self, routes):
+        if not routes:
+            return SCENARIOS
+        scenarios = [s for s in SCENARIOS if s.label in routes or set(s.routes) & set(routes)]
+        if not scenarios:
+            raise CommandError(f'No scenario matches {", ".join(routes)}.')
+        return scenarios
+
+    def plan(self, scenarios, concurrency, rounds, mix, seed):
+        """The scenarios each client runs, in order; the same seed gives the same plan."""
+        by_kind = {kind: [s for s in scenarios if s.kind == kind] for kind in ('read', 'write')}
+        plans = []
+        for client in range(concurrency):
+            rng = random.Random(f'{seed}:{client}')
+            plan = []
+            for _ in range(rounds):
+                kind = 'write' if rng.random() < MIXES[mix] else 'read'
+                choices = by_kind[kind] or by_kind['write' if kind == 'read' else 'read']
+                plan.append(rng.choices(choices, weights=[s.weight for s in choices])[0])
+            plans.append(plan)
+        return plans
+
+    def run(self, scenarios, counts, options):
+        plans = self.plan(scenarios, options['concurrency'], options['rounds'], options['mix'], options['seed'])
+        pools = defaultdict(int)
+        for plan in plans:
+            for scenario in plan:
+                if scenario.pool:
+                    pools[scenario.pool] += 1
+        work = Workload(pools, options['seed'])
+        if options['url']:
+            staff_session = work.staff_session()
+            make_driver = lambda: HTTPDriver(options['url'], staff_session)
+        else:
+            make_driver = lambda: TestClientDriver(work)
+        connections.close_all()
+
+        records = defaultdict(lambda: {'latencies': [], 'errors': 0, 'queries': []})
+        lock = threading.Lock()
+        start_gate = threading.Barrier(len(plans))
+
+        def worker(index, plan):
+            rng = random.Random(f'{options["seed"]}:{index}:requests')
+            driver = make_driver()
+            local = defaultdict(lambda: {'latencies': [], 'errors': 0, 'queries': []})
+            start_gate.wait()
+            for scenario in plan:
+                steps = scenario.run(work, rng)
+                response = None
+                while True:
+                    try:
+                        request = steps.send(response)
+                    except StopIteration:
+                        break
+                    response, elapsed, queries = self.timed(driver, request)
+                    record = local[request.label]
+                    record['latencies'].append(elapsed)
+                    if queries is not None:
+                        record['queries'].append(queries)
+                    if not 200 <= response.status < 400:
+                        record['errors'] += 1
+                        steps.close()  # Later steps depend on this one
+                        break
+            driver.close()
+            with lock:
+                for label, record in local.items():
+                    records[label]['latencies'] += record['latencies']
+                    records[label]['errors'] += record['errors']
+                    records[label]['queries'] += record['queries']
+
+        workers = [threading.Thread(target=worker, args=(i, plan)) for i, plan in enumerate(plans)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        everything = {'latencies': [], 'errors': 0, 'queries': []}
+        for record in records.values():
+            for key in everything:
+                everything[key] += record[key]
+        return {
+            'meta': self.meta(counts, options),
+            'total': self.summary(everything, elapsed),
+            'routes': {label: self.summary(record, elapsed) for label, record in sorted(records.items())},
+        }
+
+    @staticmethod
+    def timed(driver, request):
+        if not driver.counts_queries:
+            started = time.perf_counter()
+            response = driver.send(request)
+            return response, time.perf_counter() - started, None
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            started = time.perf_counter()
+            response = driver.send(request)
+            elapsed = time.perf_counter() - started
+        return response, elapsed, sum(len(queries) for queries in captured)
+
+    @staticmethod
+    def summary(record, seconds):
+        result = summarize(record['latencies'], record['errors'], seconds)
+        queries = record['queries']
+        result['queries_mean'] = sum(queries) / len(queries) if queries else None
+        result['queries_max'] = max(queries) if queries else None
+        return result
+
+    def meta(self, counts, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+            ).stdout.strip()
+        except OSError:
+            commit = ''
+        return {
+            'target': options['url'] or 'test-client',
+            'rows': counts,
+            'concurrency': options['concurrency'],
+            'rounds': options['rounds'],
+            'mix': options['mix'],
+            'seed': options['seed'],
+            'routes': options['routes'],
+            'commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'started_at': timezone.now().isoformat(),
+        }
+
+    def report(self, result):
+        self.stdout.write(
+            f"{'route':<28} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>9}"
+        )
+        for label, route in [*result['routes'].items(), ('total', result['total'])]:
+            queries = '' if route['queries_mean'] is None else f"{route['queries_mean']:.1f}/{route['queries_max']}"
+            self.stdout.write(
+                f"{label:<28} {route['requests']:>8} {route['errors']:>6} {route['p50_ms']:>8.1f} "
+                f"{route['p95_ms']:>8.1f} {route['p99_ms']:>8.1f} {queries:>9}"
+            )
+        total = result['total']
+        self.stdout.write(self.style.SUCCESS(
+            f"{total['requests_per_second']:.0f} req/s over {total['seconds']:.2f}s, {total['errors']} failed"
+        ))
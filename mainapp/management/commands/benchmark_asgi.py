@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from mainapp.benchmarking import scratch_database, summarize
+from mainapp.models import MediaFile, PrayerRequest
+
+# Environment for each deployment profile, as set by wsgi.py / asgi.py
+PROFILES = {
+    'wsgi': {'DJANGO_ASYNC_VIEWS': '0'},
+    'asgi': {'DJANGO_ASYNC_VIEWS': '1', 'DB_CONN_MAX_AGE': '0'},
+}
+
+HEADERS = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/sec and latency of the AJAX endpoints (submit, increment, '
+        'delete prayer, delete media) under the WSGI profile with sync views and the '
+        'ASGI profile with async views. Each profile runs in its own process against '
+        'a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients.')
+        parser.add_argument('--rounds', type=int, default=25, help='Rounds of the four endpoints per client.')
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES), help='Default: both.')
+        parser.add_argument('--json', action='store_true', dest='as_json', help='Print the results as JSON.')
+        parser.add_argument('--run', choices=sorted(PROFILES), help='(internal) run one profile in this process.')
+
+    def handle(self, *args, concurrency, rounds, profile, as_json, run, **options):
+        if run:
+            self.check_profile(run)
+            self.stdout.write(json.dumps(self.run_profile(run, concurrency, rounds), sort_keys=True))
+            return
+
+        results = {name: self.spawn(name, concurrency, rounds) for name in profile or ['wsgi', 'asgi']}
+        if as_json:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}  {result['requests']} requests, {result['errors']} failed: "
+                f"{result['requests_per_second']:.0f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                f"p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+            )
+        if len(results) == 2 and results['wsgi']['requests_per_second']:
+            ratio = results['asgi']['requests_per_second'] / results['wsgi']['requests_per_second']
+            self.stdout.write(self.style.SUCCESS(f'asgi/wsgi throughput: {ratio:.2f}x'))
+
+    def spawn(self, name, concurrency, rounds):
+        """Run a profile in a fresh process, so its settings and URLconf are the real ones."""
+        env = {**os.environ, **PROFILES[name]}
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_asgi',
+            '--run', name, '--concurrency', str(concurrency), '--rounds', str(rounds),
+        ]
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode:
+            raise CommandError(f'{name} benchmark failed:\n{completed.stderr}')
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+    def check_profile(self, name):
+        if settings.ASYNC_VIEWS != (PROFILES[name]['DJANGO_ASYNC_VIEWS'] == '1'):
+            raise CommandError(f'Run with DJANGO_ASYNC_VIEWS={PROFILES[name]["DJANGO_ASYNC_VIEWS"]}.')
+
+    def run_profile(self, name, concurrency, rounds):
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            with override_settings(
+                MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'], RATE_LIMITS={'ENABLED': False},
+            ), scratch_database():
+                clients = self.seed(concurrency, rounds)
+                connections.close_all()
+                if name == 'asgi':
+                    return asyncio.run(self.run_async(clients))
+                return self.run_threads(clients)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def seed(self, concurrency, rounds):
+        """Per-client request lists: a prayer to pray for plus rows each client may delete."""
+        target = PrayerRequest.objects.create(name='Seed', message='Benchmark', approved=True)
+        total = concurrency * rounds
+        prayers = PrayerRequest.objects.bulk_create(
+            PrayerRequest(name='Seed', message=f'Delete me {i}', approved=True) for i in range(total)
+        )
+        media = MediaFile.objects.bulk_create(
+            MediaFile(file=f'uploads/benchmark-{i}.jpg', kind=MediaFile.KIND_IMAGE) for i in range(total)
+        )
+        if prayers[0].pk is None or media[0].pk is None:
+            raise CommandError('The database backend must return primary keys from bulk_create().')
+
+        clients = []
+        for client in range(concurrency):
+            requests = []
+            for i in range(client * rounds, (client + 1) * rounds):
+                requests += [
+                    ('post', reverse('submit_prayer_ajax'), {'name': 'Anna', 'message': f'Request {i}'}),
+                    ('post', reverse('increment_prayer', args=[target.pk]), None),
+                    ('delete', reverse('delete_prayer', args=[prayers[i].pk]), None),
+                    ('delete', reverse('delete_gallery_media', args=[media[i].pk]), None),
+                ]
+            clients.append(requests)
+        return clients
+
+    def run_threads(self, clients):
+        latencies, errors = [], []
+        lock = threading.Lock()
+        start_gate = threading.Barrier(len(clients))
+
+        def worker(requests):
+            client = Client()
+            local_latencies, local_errors = [], 0
+            start_gate.wait()
+            for method, url, data in requests:
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data, headers=HEADERS)
+                local_latencies.append(time.perf_counter() - started)
+                local_errors += response.status_code != 200
+            connections.close_all()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        workers = [threading.Thread(target=worker, args=(requests,)) for requests in clients]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return summarize(latencies, sum(errors), time.perf_counter() - started)
+
+    async def run_async(self, clients):
+        latencies, errors = [], []
+
+        async def worker(requests):
+            client = AsyncClient()
+            for method, url, data in requests:
+                started = time.perf_counter()
+                response = await getattr(client, method)(url, data, headers=HEADERS)
+                latencies.append(time.perf_counter() - started)
+                errors.append(response.status_code != 200)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(requests) for requests in clients))
+        return summarize(latencies, sum(errors), time.perf_counter() - started)
@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from mainapp.benchmarking import percentile, scratch_database
+from mainapp.models import PrayerRequest
+from mainapp.ratelimit import Rate, parse_rate
+
+STORES = {
+    'local': ('mainapp.ratelimit.LocalRateLimitStore', {}),
+    'cache': ('mainapp.ratelimit.CacheRateLimitStore', {'alias': 'default'}),
+    'sqlite': ('mainapp.ratelimit.SQLiteRateLimitStore', {'location': '{directory}/ratelimit.sqlite3'}),
+}
+
+# High enough that every benchmarked request is allowed: the cost of a pass
+ALLOW_ALL = '1000000/s'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what rate limiting costs allowed requests: the time of one bucket '
+        'check in each store, and the latency of POST increment_prayer with the '
+        'limits off and on. Runs against a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', action='append', choices=sorted(STORES), help='Default: all.')
+        parser.add_argument('--checks', type=int, default=20000, help='Bucket checks per store.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per configuration and round.')
+        parser.add_argument('--rounds', type=int, default=10, help='Rounds, alternating the configurations.')
+        parser.add_argument('--clients', type=int, default=1000, help='Distinct client addresses.')
+
+    def handle(self, *args, store, checks, requests, rounds, clients, **options):
+        directory = tempfile.mkdtemp(prefix='benchmark-ratelimit-')
+        try:
+            stores = {
+                name: (backend, {key: value.format(directory=directory) for key, value in defaults.items()})
+                for name, (backend, defaults) in STORES.items() if name in (store or STORES)
+            }
+            self.stdout.write('Bucket check, allowed:')
+            for name, (backend, store_options) in stores.items():
+                seconds = self.time_checks(backend, store_options, checks, clients)
+                self.stdout.write(f'  {name:8} {seconds / checks * 1e6:7.2f} us/check')
+
+            self.stdout.write(f'POST increment_prayer, p50 over {rounds} x {requests} requests:')
+            configurations = {'off': {'ENABLED': False}}
+            for name, (backend, store_options) in stores.items():
+                configurations[name] = {
+                    'BACKEND': backend, 'OPTIONS': store_options, 'RATES': {'prayer_increment': ALLOW_ALL},
+                }
+            latencies = self.time_requests(configurations, requests, rounds, clients)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        baseline = percentile([value for values in latencies['off'] for value in values], 0.5)
+        for name, rounds_latencies in latencies.items():
+            p50 = percentile([value for values in rounds_latencies for value in values], 0.5)
+            line = f'  {name:8} {p50 * 1000:7.3f} ms'
+            if name != 'off':
+                # Round by round against the run of 'off' next to it, which saw the same drift
+                overhead = percentile([
+                    percentile(values, 0.5) - percentile(off, 0.5)
+                    for values, off in zip(rounds_latencies, latencies['off'])
+                ], 0.5)
+                line += f'  {overhead * 1e6:+7.1f} us ({overhead / baseline * 100:+.1f}%)'
+            self.stdout.write(line)
+
+    def time_checks(self, backend, options, checks, clients):
+        limiter_store = import_string(backend)(**options)
+        rate = Rate(*parse_rate(ALLOW_ALL))
+        keys = [f'prayer_increment:10.0.{i // 256}.{i % 256}' for i in range(clients)]
+        started = time.perf_counter()
+        for i in range(checks):
+            if limiter_store.consume(keys[i % clients], rate):
+                raise CommandError('A benchmarked check was refused.')
+        return time.perf_counter() - started
+
+    def time_requests(self, configurations, requests, rounds, clients):
+        latencies = {name: [] for name in configurations}  # name -> one list per round
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver']), scratch_database():
+                prayer = PrayerRequest.objects.create(name='Seed', message='Benchmark', approved=True)
+                url = reverse('increment_prayer', args=[prayer.pk])
+                client = Client()
+                for _ in range(rounds):
+                    # Alternate, so drift (WAL growth, caches) hits every configuration alike
+                    for name, limits in configurations.items():
+                        latencies[name].append([])
+                        with override_settings(RATE_LIMITS=limits):
+                            for i in range(requests):
+                                address = f'10.1.{i % clients // 256}.{i % clients % 256}'
+                                started = time.perf_counter()
+                                response = client.post(url, REMOTE_ADDR=address)
+                                latencies[name][-1].append(time.perf_counter() - started)
+                                if response.status_code != 200:
+                                    raise CommandError(f'{name}: got {response.status_code}.')
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        return latencies
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.assets import AssetError, brotli, build, build_dir, remove_stale
+
+
+class Command(BaseCommand):
+    help = 'Bundle, minify, fingerprint and pre-compress the site CSS/JS (run before collectstatic).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Directory to write to (default: ASSET_BUILD_DIR).')
+        parser.add_argument(
+            '--clean', action='store_true',
+            help='Remove earlier builds that the new manifest no longer references.',
+        )
+
+    def handle(self, *args, output, clean, **options):
+        output = output or build_dir()
+        try:
+            manifest = build(output)
+        except AssetError as e:
+            raise CommandError(str(e))
+        for name, file_name in sorted(manifest.items()):
+            self.stdout.write(f'{name:<14} -> {file_name}')
+        if clean:
+            for name in remove_stale(output, manifest):
+                self.stdout.write(f'removed {name}')
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('brotli is not installed; only .gz files were written.'))
+        self.stdout.write(self.style.SUCCESS(f'Built {len(manifest)} bundle(s) in {output}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from mainapp import views  # noqa: F401 - registers the cached page names
+from mainapp.caching import cache_stats, clear_page_cache, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counts for cached pages and fragments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters afterwards.')
+        parser.add_argument('--clear', action='store_true', help='Also drop every cached page.')
+
+    def handle(self, *args, reset, clear, **options):
+        for name, counts in cache_stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = f"{counts['hits'] / total:.1%}" if total else '-'
+            self.stdout.write(f"{name:<20} hits={counts['hits']:<8} misses={counts['misses']:<8} hit rate={ratio}")
+        if reset:
+            reset_cache_stats()
+        if clear:
+            clear_page_cache()
+            self.stdout.write(self.style.SUCCESS('Cleared cached pages.'))
@@ -0,0 +1,113 @@
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mainapp.models import ChunkedUpload, MediaBlob, MediaFile
+from mainapp.storage import CAS_PREFIX, CAS_TEMP_DIR
+
+# "<stem>_640w.webp" / "<stem>_poster.jpg" belong to the blob "<stem>.*"
+DERIVED_SUFFIX = re.compile(r'^(?P<stem>.+)_(?:\d+w|poster)$')
+
+
+def walk_files(root, relative=''):
+    """Yield ``(name, DirEntry)`` for every file below ``root/relative``, lazily."""
+    try:
+        entries = os.scandir(os.path.join(root, relative))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            name = f'{relative}/{entry.name}' if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(root, name)
+            elif entry.is_file(follow_symlinks=False):
+                yield name, entry
+
+
+class Command(BaseCommand):
+    help = 'Delete media files on disk that no MediaFile, blob or upload references any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list what would be deleted.')
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Leave files modified within this many seconds alone (default: 3600).',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, dry_run, min_age, batch_size, **options):
+        self.root = str(settings.MEDIA_ROOT)
+        self.chunked_dir = getattr(settings, 'CHUNKED_UPLOAD_DIR', 'chunked')
+        self.dry_run = dry_run
+        cutoff = time.time() - min_age
+        removed = freed = 0
+
+        batch = []
+        for directory in (CAS_PREFIX, 'uploads', self.chunked_dir):
+            for name, entry in walk_files(self.root, directory):
+                if entry.stat().st_mtime > cutoff:
+                    continue
+                batch.append((name, entry))
+                if len(batch) >= batch_size:
+                    count, size = self.sweep(batch)
+                    removed, freed = removed + count, freed + size
+                    batch = []
+        if batch:
+            count, size = self.sweep(batch)
+            removed, freed = removed + count, freed + size
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {removed} file(s), {freed} bytes.'))
+
+    def sweep(self, batch):
+        """Delete the unreferenced files in one batch; returns (count, bytes)."""
+        live = self.live_names([name for name, _ in batch])
+        removed = freed = 0
+        for name, entry in batch:
+            if name in live:
+                continue
+            size = entry.stat().st_size
+            if self.dry_run:
+                self.stdout.write(name)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def live_names(self, names):
+        live = set(MediaBlob.objects.filter(name__in=names).values_list('name', flat=True))
+        live.update(MediaFile.objects.filter(file__in=names).values_list('file', flat=True))
+        live.update(MediaFile.objects.filter(poster__in=names).values_list('poster', flat=True))
+
+        owners = {}
+        parts = {}
+        for name in names:
+            if name.startswith(f'{CAS_TEMP_DIR}/'):
+                continue  # Abandoned partial write
+            if name.startswith(f'{self.chunked_dir}/'):
+                upload_id = os.path.splitext(os.path.basename(name))[0]
+                parts[upload_id] = name
+                continue
+            match = DERIVED_SUFFIX.match(os.path.splitext(name)[0])
+            if match:
+                owners.setdefault(match['stem'], []).append(name)
+
+        for stem in MediaBlob.objects.filter(stem__in=owners).values_list('stem', flat=True):
+            live.update(owners[stem])
+        if parts:
+            active = ChunkedUpload.objects.filter(
+                pk__in=[pk for pk in parts if _is_uuid(pk)], status=ChunkedUpload.STATUS_UPLOADING
+            ).values_list('pk', flat=True)
+            live.update(parts[str(pk)] for pk in active)
+        return live
+
+
+def _is_uuid(value):
+    return bool(re.fullmatch(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', value))
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.imaging import (
+    build_variants_at, can_have_variants, delete_variants, imaging_available, variant_widths,
+)
+from mainapp.models import MediaFile
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive image variants for existing gallery uploads, in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: one per CPU core).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Rows queued per batch; bounds memory on large tables.',
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild variants even for files that already have them.',
+        )
+
+    def handle(self, *args, workers, batch_size, force, **options):
+        if not imaging_available():
+            raise CommandError('Pillow is not installed; cannot generate image variants.')
+
+        queryset = MediaFile.objects.order_by('pk').only('pk', 'file', 'variants')
+        media_root = str(settings.MEDIA_ROOT)
+        widths = variant_widths()
+        done = failed = 0
+
+        # Spawned workers only resize files; all database writes stay in this
+        # process, so SQLite never sees concurrent writers or forked handles.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as pool:
+            last_pk = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                futures = {}
+                for media in batch:
+                    if not can_have_variants(media.file.name) or (media.variants and not force):
+                        continue
+                    if force:
+                        delete_variants(media.variants)
+                    future = pool.submit(build_variants_at, media_root, media.file.name, widths)
+                    futures[future] = media.pk
+
+                for future in as_completed(futures):
+                    pk = futures[future]
+                    try:
+                        variants = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'MediaFile {pk}: {type(e).__name__}: {e}')
+                        continue
+                    MediaFile.objects.filter(pk=pk).update(variants=variants)
+                    done += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} file(s); {failed} failed.'))
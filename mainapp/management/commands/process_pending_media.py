@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.media_processing import process_media
+from mainapp.models import MediaFile
+
+
+class Command(BaseCommand):
+    help = 'Extract posters/metadata and variants for media still waiting to be processed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retry-failed', action='store_true',
+            help='Also reprocess media whose previous attempt failed or had no decoder.',
+        )
+
+    def handle(self, *args, retry_failed, **options):
+        statuses = [MediaFile.PROCESSING_PENDING]
+        if retry_failed:
+            statuses += [MediaFile.PROCESSING_FAILED, MediaFile.PROCESSING_UNAVAILABLE]
+
+        ids = MediaFile.objects.filter(processing_status__in=statuses).values_list('pk', flat=True)
+        processed = 0
+        for media_id in ids.iterator():
+            process_media(media_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} media file(s).'))
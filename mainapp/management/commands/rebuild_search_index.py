@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.search import SEARCH_INDEXES, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Re-index prayers and contact messages for full-text search, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', action='append', choices=sorted(model._meta.label_lower for model in SEARCH_INDEXES),
+            help='Only rebuild this index (default: all of them).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Rows indexed per transaction; keeps the write lock short.',
+        )
+
+    def handle(self, *args, model, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        backend = get_search_backend()
+        for indexed in SEARCH_INDEXES:
+            if model and indexed._meta.label_lower not in model:
+                continue
+            count = backend.rebuild(indexed, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'Indexed {count} {indexed._meta.verbose_name_plural}.'))
@@ -0,0 +1,88 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.jobqueue import DatabaseJobQueue, get_job_queue, job_queue_setting, worker_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs from the Job table until stopped (SIGINT/SIGTERM let '
+        'running jobs finish). Use several threads for I/O-bound jobs and several '
+        'processes for CPU-bound ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes.')
+        parser.add_argument(
+            '--lane', action='append', dest='lanes',
+            help='Only run jobs from this lane (repeatable). Default: every lane, by priority.',
+        )
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, threads, processes, lanes, burst, **options):
+        job_queue = get_job_queue()
+        if not isinstance(job_queue, DatabaseJobQueue):
+            raise CommandError('runworker needs JOB_QUEUE BACKEND = mainapp.jobqueue.DatabaseJobQueue.')
+        unknown = set(lanes or ()) - set(job_queue_setting('LANES'))
+        if unknown:
+            raise CommandError(f'Unknown lane(s): {", ".join(sorted(unknown))}.')
+        if threads < 1 or processes < 1:
+            raise CommandError('--threads and --processes must be at least 1.')
+
+        if processes > 1:
+            self.supervise(processes, threads, lanes, burst)
+            return
+
+        stop = threading.Event()
+        previous = {signum: signal.signal(signum, lambda *_: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.run_worker(job_queue, stop, threads, lanes, burst)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def run_worker(self, job_queue, stop, threads, lanes, burst):
+        requeued = job_queue.requeue_stale()
+        if requeued:
+            self.stderr.write(f'Requeued {requeued} job(s) abandoned by a dead worker.')
+        self.stdout.write(f'Worker {worker_name()}: {threads} thread(s), lanes: {", ".join(lanes or ["all"])}')
+
+        done = []
+
+        def work(i):
+            done.append(job_queue.work(stop, f'{worker_name()}:{i}', lanes, burst))
+
+        pool = [threading.Thread(target=work, args=(i,), name=f'runworker-{i}') for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        # Wake regularly so signals are handled promptly
+        while any(thread.is_alive() for thread in pool):
+            for thread in pool:
+                thread.join(timeout=0.5)
+        self.stdout.write(self.style.SUCCESS(f'Ran {sum(done)} job(s).'))
+
+    def supervise(self, processes, threads, lanes, burst):
+        """Run single-process workers as children and pass signals on to them."""
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runworker', '--threads', str(threads)]
+        for lane in lanes or ():
+            command += ['--lane', lane]
+        if burst:
+            command.append('--burst')
+        children = [subprocess.Popen(command) for _ in range(processes)]
+
+        def forward(signum, frame):
+            for child in children:
+                child.send_signal(signum)
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, forward)
+        failed = sum(child.wait() != 0 for child in children)
+        if failed:
+            raise CommandError(f'{failed} worker process(es) failed.')
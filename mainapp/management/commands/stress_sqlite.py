@@ -0,0 +1,100 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from mainapp.benchmarking import scratch_database, summarize
+from mainapp.models import PrayerRequest
+
+# SQLite as Django configures it without any tuning, for comparison
+BASELINE_PROFILE = {
+    'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL'},
+    'options': {'timeout': 5},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer submit_prayer_ajax and increment_prayer from concurrent threads against '
+        'a scratch SQLite database, with the tuned profile and with SQLite defaults.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=100, help='Requests per thread.')
+        parser.add_argument(
+            '--profile', action='append', choices=['tuned', 'baseline'],
+            help='Profile(s) to run (default: both).',
+        )
+
+    def handle(self, *args, threads, requests, profile, **options):
+        results = {}
+        for name in profile or ['baseline', 'tuned']:
+            results[name] = self.run_profile(name, threads, requests)
+            self.report(name, results[name])
+        if 'baseline' in results and 'tuned' in results and results['baseline']['requests_per_second']:
+            speedup = results['tuned']['requests_per_second'] / results['baseline']['requests_per_second']
+            self.stdout.write(self.style.SUCCESS(f'tuned/baseline write throughput: {speedup:.2f}x'))
+        return None
+
+    def run_profile(self, name, threads, requests):
+        overrides = {
+            'PRAYER_COUNTER': {'BACKEND': 'mainapp.counters.DirectPrayerCounter'},
+            'RATE_LIMITS': {'ENABLED': False},
+        }
+        database = {'CONN_MAX_AGE': None if name == 'tuned' else 0}
+        if name == 'baseline':
+            overrides['SQLITE_PRAGMAS'] = BASELINE_PROFILE['pragmas']
+            database['OPTIONS'] = dict(BASELINE_PROFILE['options'])
+        with override_settings(**overrides), scratch_database(**database):
+            seed = PrayerRequest.objects.create(name='Seed', message='Stress test', approved=True)
+            connection.close()
+            return self.hammer(seed.pk, threads, requests)
+
+    def hammer(self, prayer_id, threads, requests):
+        submit_url = reverse('submit_prayer_ajax')
+        increment_url = reverse('increment_prayer', args=[prayer_id])
+        latencies, errors = [], []
+        lock = threading.Lock()
+        start_gate = threading.Barrier(threads)
+
+        def worker(index):
+            client = Client(SERVER_NAME='localhost')
+            local_latencies, local_errors = [], 0
+            start_gate.wait()
+            for i in range(requests):
+                started = time.perf_counter()
+                if i % 2:
+                    response = client.post(increment_url)
+                else:
+                    response = client.post(
+                        submit_url, {'name': f'Thread {index}', 'message': f'Request {i}'},
+                        headers={'X-Requested-With': 'XMLHttpRequest'},
+                    )
+                local_latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    local_errors += 1
+            connections['default'].close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return summarize(latencies, sum(errors), elapsed)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f"{name:<9} {result['requests']} requests in {result['seconds']:.2f}s: "
+            f"{result['requests_per_second']:.0f} writes/s, {result['errors']} failed, "
+            f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+        )
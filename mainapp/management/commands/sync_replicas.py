@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from mainapp.db_routers import routing_setting
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the primary SQLite database onto each SQLite replica. Stands in for '
+        'replication when trying out read/write routing locally; with --interval '
+        'the replicas lag the primary by up to that many seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep syncing every N seconds.')
+
+    def handle(self, *args, interval, **options):
+        primary = connections[routing_setting('PRIMARY')].settings_dict
+        replicas = [connections[alias].settings_dict for alias in routing_setting('REPLICAS')]
+        if not replicas:
+            raise CommandError('No replicas configured (set DB_REPLICAS).')
+        for settings_dict in [primary, *replicas]:
+            if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('sync_replicas only works with SQLite databases.')
+
+        while True:
+            started = time.monotonic()
+            for replica in replicas:
+                copy_database(primary['NAME'], replica['NAME'])
+            self.stdout.write(f'Synced {len(replicas)} replica(s) in {time.monotonic() - started:.3f}s')
+            if not interval:
+                break
+            time.sleep(interval)
+
+
+def copy_database(source, target):
+    """Consistent online copy via SQLite's backup API (safe while the primary is written)."""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
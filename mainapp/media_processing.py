@@ -0,0 +1,88 @@
+"""
+Post-upload processing for gallery media.
+
+``process_media`` runs on the local job queue after a ``MediaFile`` is
+saved: photos get responsive variants, videos get their duration,
+dimensions and a poster frame. Upload requests only pay for enqueueing.
+"""
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from mainapp.imaging import generate_variants_for
+from mainapp.models import MediaFile
+from mainapp.video import VideoProcessingError, decoder_available, extract_poster, probe_video
+
+logger = logging.getLogger(__name__)
+
+
+def poster_name(source_name):
+    """``uploads/clip.mp4`` -> ``uploads/clip_poster.jpg``"""
+    return f'{os.path.splitext(source_name)[0]}_poster.jpg'
+
+
+def process_video(media):
+    """Return the fields to store for a video ``MediaFile``."""
+    if not decoder_available():
+        return {'processing_status': MediaFile.PROCESSING_UNAVAILABLE}
+    try:
+        path = media.file.path
+    except NotImplementedError:
+        # Remote storage without local paths; nothing to hand to ffmpeg.
+        return {'processing_status': MediaFile.PROCESSING_UNAVAILABLE}
+
+    info = probe_video(path)
+    duration = info['duration'] or 0
+    frame = extract_poster(path, at_seconds=min(1.0, duration / 2))
+
+    name = poster_name(media.file.name)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    name = default_storage.save(name, ContentFile(frame))
+    return {
+        'duration': info['duration'],
+        'width': info['width'],
+        'height': info['height'],
+        'poster': name,
+        'processing_status': MediaFile.PROCESSING_READY,
+    }
+
+
+def processed_twin(media):
+    """Another ``MediaFile`` sharing this one's stored file that is already processed."""
+    return (
+        MediaFile.objects.filter(file=media.file.name, processing_status=MediaFile.PROCESSING_READY)
+        .exclude(pk=media.pk)
+        .only('variants', 'poster', 'duration', 'width', 'height')
+        .first()
+    )
+
+
+def process_media(media_id):
+    """Build derived data for one ``MediaFile``; safe to call more than once."""
+    media = MediaFile.objects.filter(pk=media_id).first()
+    if media is None or not media.file or not media.file.storage.exists(media.file.name):
+        return
+
+    twin = processed_twin(media)
+    if twin is not None:
+        # Deduplicated upload: the variants and poster already exist on disk
+        MediaFile.objects.filter(pk=media_id).update(
+            variants=twin.variants, poster=twin.poster.name or '',
+            duration=twin.duration, width=twin.width, height=twin.height,
+            processing_status=MediaFile.PROCESSING_READY,
+        )
+        return
+
+    fields = {'processing_status': MediaFile.PROCESSING_READY}
+    try:
+        if media.is_video():
+            fields = process_video(media)
+        elif media.is_image():
+            generate_variants_for(media)
+    except VideoProcessingError:
+        logger.warning('Could not process video %s', media.file.name, exc_info=True)
+        fields = {'processing_status': MediaFile.PROCESSING_FAILED}
+    MediaFile.objects.filter(pk=media_id).update(**fields)
@@ -0,0 +1,187 @@
+"""
+Serve files under MEDIA_ROOT.
+
+Replaces ``django.conf.urls.static.static()`` for media: supports single
+byte ranges (so seeking in a gallery video doesn't restart the download),
+strong ETags and conditional GETs, and long-lived caching for
+content-addressed files, which never change under the same name.
+
+The transfer itself can be handed to the front server:
+
+    MEDIA_SENDFILE = {
+        'BACKEND': 'x-accel-redirect',  # nginx; or 'x-sendfile' (Apache, lighttpd); or None
+        'INTERNAL_URL': '/protected-media/',  # nginx "internal" location aliasing MEDIA_ROOT
+    }
+
+Without a front server the response streams the open file. It exposes
+``fileno()``, so WSGI servers with a ``wsgi.file_wrapper`` (gunicorn,
+uWSGI) send it with ``os.sendfile`` rather than copying through Python.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from mainapp.metrics import MEDIA_SERVED
+from mainapp.storage import CAS_PREFIX, CAS_TEMP_DIR
+
+# cas/ab/cd/<sha256>.<ext> — the name is the content hash, so it is the ETag
+CAS_NAME = re.compile(rf'^{CAS_PREFIX}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/(?P<sha256>[0-9a-f]{{64}})\.\w+$')
+RANGE_HEADER = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def sendfile_backend():
+    return (getattr(settings, 'MEDIA_SENDFILE', None) or {}).get('BACKEND') or None
+
+
+def resolve_media_path(name):
+    """Absolute path of a servable file, or Http404."""
+    name = name.lstrip('/')
+    private = (getattr(settings, 'CHUNKED_UPLOAD_DIR', 'chunked'), CAS_TEMP_DIR)
+    if any(name == prefix or name.startswith(f'{prefix}/') for prefix in private):
+        raise Http404('Not found')
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(path):
+        raise Http404('Not found')
+    return path
+
+
+def file_etag(name, stat):
+    match = CAS_NAME.match(name)
+    if match:
+        return f'"{match["sha256"]}"'
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def cache_control(name):
+    if CAS_NAME.match(name) or name.startswith(f'{CAS_PREFIX}/'):
+        # Variants and posters of a blob are named after it and rebuilt identically
+        return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 24 * 60 * 60)}"
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` inclusive for a single satisfiable byte range.
+
+    Returns None when the header should be ignored (absent, malformed or
+    several ranges, which we answer with the whole file) and raises
+    ValueError when the range can't be satisfied.
+    """
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if not match or (not match['start'] and not match['end']):
+        return None
+    if not match['start']:
+        length = int(match['end'])
+        if length == 0 or size == 0:
+            raise ValueError('Empty suffix range')
+        return max(0, size - length), size - 1
+    start = int(match['start'])
+    end = int(match['end']) if match['end'] else size - 1
+    if match['end'] and start > end:
+        return None
+    if start >= size:
+        raise ValueError('Range starts past the end of the file')
+    return start, min(end, size - 1)
+
+
+def if_range_matches(request, etag, last_modified):
+    """A range is only honoured if If-Range (when sent) still names this file."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return if_range == http_date(last_modified)
+
+
+class FileRange:
+    """Reads at most ``length`` bytes of an open file from its current position."""
+
+    def __init__(self, fh, length):
+        self.file = fh
+        self.name = fh.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, name):
+    """Build the response for GET/HEAD of media file ``name``."""
+    path = resolve_media_path(name)
+    stat = os.stat(path)
+    etag = file_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        conditional['ETag'] = etag
+        conditional['Cache-Control'] = cache_control(name)
+        return conditional
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range and not if_range_matches(request, etag, last_modified):
+        byte_range = None
+
+    backend = sendfile_backend()
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if backend:
+        # The front server reads the file and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if backend == 'x-accel-redirect':
+            prefix = settings.MEDIA_SENDFILE.get('INTERNAL_URL', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name.lstrip('/'))
+        else:
+            response['X-Sendfile'] = path
+        del response['Content-Length']
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = stat.st_size
+    else:
+        fh = open(path, 'rb')
+        if byte_range:
+            start, end = byte_range
+            fh.seek(start)
+            response = FileResponse(FileRange(fh, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(fh, content_type=content_type)
+
+    if request.method == 'GET':
+        MEDIA_SERVED.inc(byte_range[1] - byte_range[0] + 1 if byte_range else stat.st_size, via=backend or 'django')
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control(name)
+    return response
@@ -0,0 +1,473 @@
+"""
+Application metrics in the Prometheus text format, served at ``/metrics``.
+
+Counters, histograms and gauges are declared once at module level here
+and updated where things happen (``MetricsMiddleware`` for requests, the
+model signals for submissions and uploads, ``media_serving`` for bytes
+served). Some values are read when scraped instead (``collect=``): the
+job queue depth and the page cache hit counts, which already live in a
+shared store.
+
+Each process keeps its own values; the store decides how a scrape sees
+the values of the other processes:
+
+    METRICS = {
+        'ENABLED': True,
+        'BACKEND': 'mainapp.metrics.FileMetricsStore',   # or LocalMetricsStore
+        'OPTIONS': {'directory': '/run/church_website/metrics', 'flush_interval': 1},
+        'ALLOWED_IPS': ['127.0.0.1', '::1'],   # besides staff users
+        'TOKEN': '',                           # or "Authorization: Bearer <TOKEN>"
+    }
+
+``LocalMetricsStore`` only knows its own process: fine for runserver or
+a single worker. ``FileMetricsStore`` writes a snapshot of each process's
+values to ``<directory>/<pid>.json`` (at most every ``flush_interval``
+seconds, at the latest ``flush_interval`` after a change, and at exit),
+and a scrape sums the snapshots, so any worker can
+answer for all of them. Counters of processes that have exited are folded
+into ``archive.json`` so totals never go backwards; gauges only count
+live processes. Use an empty directory per host; clear it on deploy to
+reset the counters.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from math import inf
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from mainapp.instrumentation import install_hooks, measure_request
+
+DEFAULT_METRICS = {
+    'ENABLED': True,
+    'BACKEND': 'mainapp.metrics.LocalMetricsStore',
+    'OPTIONS': {},
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+    'TOKEN': '',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Seconds; Prometheus' defaults, which suit page views
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def metrics_setting(name):
+    return {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}[name]
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def sample_name(name, labels):
+    """``name{a="1",b="2"}``: the key of one time series"""
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+def format_value(value):
+    if value == inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+# Stores
+
+class LocalMetricsStore:
+    """Values of this process, in memory."""
+
+    def __init__(self, **options):
+        self.options = options
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters = {}  # family -> {sample: value}
+        self._gauges = {}
+
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # A forked worker starts from zero; its parent reports its own
+            self._pid = os.getpid()
+            self._counters, self._gauges = {}, {}
+
+    def _values(self, table, family):
+        self._check_fork()
+        table = self._counters if table == 'counters' else self._gauges
+        return table.setdefault(family, {})
+
+    def inc(self, family, samples):
+        """Add to counter samples: ``samples`` is ``{sample: amount}``."""
+        with self._lock:
+            values = self._values('counters', family)
+            for sample, amount in samples.items():
+                values[sample] = values.get(sample, 0) + amount
+        self.changed()
+
+    def set(self, family, sample, value):
+        with self._lock:
+            self._values('gauges', family)[sample] = value
+        self.changed()
+
+    def changed(self):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': {family: dict(values) for family, values in self._counters.items()},
+                'gauges': {family: dict(values) for family, values in self._gauges.items()},
+            }
+
+    def collect(self):
+        """``{'counters': ..., 'gauges': ...}`` for every process this store sees."""
+        return self.snapshot()
+
+
+def merge(total, snapshot, tables=('counters', 'gauges')):
+    for table in tables:
+        for family, values in snapshot.get(table, {}).items():
+            merged = total.setdefault(table, {}).setdefault(family, {})
+            for sample, value in values.items():
+                merged[sample] = merged.get(sample, 0) + value
+    return total
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class FileMetricsStore(LocalMetricsStore):
+    """Per-process snapshots in a shared directory, summed when scraped."""
+
+    archive_name = 'archive.json'
+
+    def __init__(self, directory=None, flush_interval=1.0, **options):
+        super().__init__(**options)
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'church_website_metrics')
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        self._pending_pid = None  # The process with a delayed flush scheduled
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self._flush_at_exit)
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, f'{pid or os.getpid()}.json')
+
+    def changed(self):
+        waited = time.monotonic() - self._last_flush
+        if waited >= self.flush_interval:
+            self.flush()
+        else:
+            self._flush_later(self.flush_interval - waited)
+
+    def _flush_later(self, delay):
+        # Else the last changes before a worker goes quiet wait for its next one
+        with self._flush_lock:
+            if self._pending_pid == os.getpid():
+                return
+            # A timer doesn't follow a fork, so a child's is its own
+            self._pending_pid = os.getpid()
+        timer = threading.Timer(delay, self._flush_pending)
+        timer.daemon = True
+        timer.start()
+
+    def _flush_pending(self):
+        with self._flush_lock:
+            self._pending_pid = None
+        self._flush_at_exit()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self._write(self.path(), self.snapshot())
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except OSError:
+            pass  # The directory was removed
+
+    @staticmethod
+    def _write(path, data):
+        # Readers never see a half-written file
+        fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def collect(self):
+        self.flush()
+        self.compact()
+        total = merge({}, self._read(os.path.join(self.directory, self.archive_name)))
+        for path in glob.glob(os.path.join(self.directory, '[0-9]*.json')):
+            merge(total, self._read(path))
+        return total
+
+    def compact(self):
+        """Fold the counters of exited processes into the archive."""
+        dead = [
+            path for path in glob.glob(os.path.join(self.directory, '[0-9]*.json'))
+            if not pid_alive(int(os.path.basename(path).split('.')[0]))
+        ]
+        if not dead:
+            return
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, self.archive_name)
+            archive = self._read(archive_path)
+            for path in dead:
+                if os.path.exists(path):
+                    merge(archive, self._read(path), tables=('counters',))
+            self._write(archive_path, archive)
+            for path in dead:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store():
+    """Return the process-wide store configured by ``METRICS``."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(metrics_setting('BACKEND'))(**metrics_setting('OPTIONS'))
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_metrics_store(setting, **kwargs):
+    global _store
+    if setting == 'METRICS':
+        _store = None
+
+
+# Metrics
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name} is already registered.')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        """Every metric, for every process, in the text exposition format."""
+        collected = get_metrics_store().collect()
+        lines = []
+        for metric in self.metrics.values():
+            lines += [f'# HELP {metric.name} {metric.documentation}', f'# TYPE {metric.name} {metric.type}']
+            if metric.collect is not None:
+                samples = metric.collected_samples()
+            else:
+                samples = collected.get(metric.table, {}).get(metric.name, {})
+            lines += [f'{sample} {format_value(value)}' for sample, value in samples.items()]
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+    table = 'counters'
+
+    def __init__(self, name, documentation, labels=(), collect=None, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Called at scrape time instead of storing values: returns a number,
+        # or a list of (labels dict, number)
+        self.collect = collect
+        self._samples = {}  # label values -> sample names, formatted once
+        registry.register(self)
+
+    def label_pairs(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f'{self.name} takes the labels {", ".join(self.labels) or "(none)"}.')
+        return [(name, labels[name]) for name in self.labels]
+
+    def samples(self, labels):
+        key = tuple(labels.get(name) for name in self.labels)
+        names = self._samples.get(key)
+        if names is None:
+            names = self._samples[key] = self.sample_names(self.label_pairs(labels))
+        return names
+
+    def sample_names(self, pairs):
+        return sample_name(self.name, pairs)
+
+    def collected_samples(self):
+        value = self.collect()
+        if not isinstance(value, list):
+            value = [({}, value)]
+        return {sample_name(self.name, self.label_pairs(labels)): number for labels, number in value}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        get_metrics_store().inc(self.name, {self.samples(labels): amount})
+
+
+class Gauge(Metric):
+    type = 'gauge'
+    table = 'gauges'
+
+    def set(self, value, **labels):
+        get_metrics_store().set(self.name, self.samples(labels), value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labels, **kwargs)
+        self.buckets = (*sorted(buckets), inf)
+
+    def sample_names(self, pairs):
+        buckets = [sample_name(f'{self.name}_bucket', [*pairs, ('le', format_value(bound))]) for bound in self.buckets]
+        return buckets, sample_name(f'{self.name}_sum', pairs), sample_name(f'{self.name}_count', pairs)
+
+    def observe(self, value, **labels):
+        buckets, total, count = self.samples(labels)
+        # Buckets are stored cumulatively, as exposed
+        samples = {name: int(value <= bound) for name, bound in zip(buckets, self.buckets)}
+        samples[total] = value
+        samples[count] = 1
+        get_metrics_store().inc(self.name, samples)
+
+
+def job_queue_depth():
+    from mainapp.jobqueue import get_job_queue
+
+    return get_job_queue().qsize()
+
+
+def page_cache_requests():
+    from mainapp.caching import cache_stats
+
+    return [
+        ({'name': name, 'outcome': outcome}, count)
+        for name, outcomes in cache_stats().items() for outcome, count in outcomes.items()
+    ]
+
+
+HTTP_REQUESTS = Counter('http_requests_total', 'Responses by view, method and status.', ['view', 'method', 'status'])
+HTTP_LATENCY = Histogram('http_request_duration_seconds', 'Time to build a response, by view.', ['view'])
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent in database queries per request, by view.', ['view'])
+DB_QUERIES = Counter('http_request_db_queries_total', 'Database queries run by requests, by view.', ['view'])
+MEDIA_SERVED = Counter('media_served_bytes_total', 'Media bytes sent, by Django or the front server.', ['via'])
+MEDIA_UPLOADS = Counter('media_uploads_total', 'New gallery files, by kind.', ['kind'])
+MEDIA_UPLOADED = Counter('media_uploaded_bytes_total', 'Bytes of new gallery files, by kind.', ['kind'])
+PRAYERS_SUBMITTED = Counter('prayers_submitted_total', 'New prayer requests.', ['approved'])
+PRAYER_DUPLICATES = Counter(
+    'prayer_duplicates_total', 'Repeated prayer submissions: replayed, merged or rejected.', ['outcome'],
+)
+PRAYERS_PRAYED = Counter('prayer_increments_total', 'Clicks on "Pray".')
+RATE_LIMITED = Counter('rate_limited_total', 'Requests refused with 429, by limit.', ['limit'])
+JOB_QUEUE_DEPTH = Gauge('job_queue_depth', 'Jobs waiting to run.', collect=job_queue_depth)
+PAGE_CACHE_REQUESTS = Counter(
+    'page_cache_requests_total', 'Page and fragment cache lookups, by outcome.', ['name', 'outcome'],
+    collect=page_cache_requests,
+)
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+def scrape_allowed(request):
+    """Staff, the bearer of ``TOKEN``, or a direct request from ``ALLOWED_IPS``"""
+    token = metrics_setting('TOKEN')
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    # Behind a proxy every request comes from the proxy's address
+    proxied = 'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers
+    return not proxied and request.META.get('REMOTE_ADDR') in metrics_setting('ALLOWED_IPS')
+
+
+class MetricsMiddleware:
+    """Count each response and record its latency and database time, by view."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        install_hooks()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with measure_request() as stats:
+            response = self.get_response(request)
+            db_time, queries = stats.db_time, stats.query_count
+        self.record(request, response, time.perf_counter() - started, db_time, queries)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with measure_request() as stats:
+            response = await self.get_response(request)
+            db_time, queries = stats.db_time, stats.query_count
+        self.record(request, response, time.perf_counter() - started, db_time, queries)
+        return response
+
+    def record(self, request, response, duration, db_time, queries):
+        match = request.resolver_match
+        # Unmatched paths share one label, so scanners can't add series
+        view = match.view_name if match else 'unresolved'
+        method = request.method if request.method in KNOWN_METHODS else 'other'
+        HTTP_REQUESTS.inc(view=view, method=method, status=response.status_code)
+        HTTP_LATENCY.observe(duration, view=view)
+        DB_TIME.observe(db_time, view=view)
+        if queries:
+            DB_QUERIES.inc(queries, view=view)
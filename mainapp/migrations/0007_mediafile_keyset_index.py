@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0006_contactmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['uploaded_at', 'id'], name='mainapp_med_uploade_7eecbc_idx'),
+        ),
+    ]
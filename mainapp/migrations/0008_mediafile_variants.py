@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0007_mediafile_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0008_mediafile_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, help_text='Seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='poster',
+            field=models.FileField(blank=True, editable=False, upload_to='uploads/'),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('unavailable', 'No decoder available')], default='pending', editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0010_chunkedupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='kind',
+            field=models.CharField(blank=True, choices=[('image', 'Image'), ('video', 'Video'), ('other', 'Other')], editable=False, max_length=5),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='mime_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='size_bytes',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['kind', 'uploaded_at', 'id'], name='mainapp_med_kind_cd8736_idx'),
+        ),
+    ]
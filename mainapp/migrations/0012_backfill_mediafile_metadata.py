@@ -0,0 +1,37 @@
+from django.db import migrations
+
+from mainapp import sniffing
+
+
+def backfill_metadata(apps, schema_editor):
+    MediaFile = apps.get_model('mainapp', 'MediaFile')
+    batch = []
+    fields = ['kind', 'mime_type', 'size_bytes', 'content_hash', 'width', 'height']
+    for media in MediaFile.objects.filter(content_hash='').iterator(chunk_size=200):
+        if not media.file:
+            continue
+        try:
+            with media.file.storage.open(media.file.name, 'rb') as fh:
+                info = sniffing.inspect_file(fh, media.file.name)
+        except OSError:
+            info = sniffing.describe_by_name(media.file.name)
+        for field, value in info.items():
+            if value is not None:
+                setattr(media, field, value)
+        batch.append(media)
+        if len(batch) >= 200:
+            MediaFile.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        MediaFile.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0011_mediafile_content_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_metadata, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:34
+
+import os
+
+import mainapp.storage
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def create_blobs(apps, schema_editor):
+    """One blob per stored file, counting the MediaFile rows that share it"""
+    MediaFile = apps.get_model('mainapp', 'MediaFile')
+    MediaBlob = apps.get_model('mainapp', 'MediaBlob')
+    rows = (
+        MediaFile.objects.exclude(file='')
+        .values('file')
+        .annotate(refs=Count('id'), content_hash=Max('content_hash'), size_bytes=Max('size_bytes'))
+        .order_by()
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=500):
+        batch.append(MediaBlob(
+            name=row['file'], stem=os.path.splitext(row['file'])[0],
+            content_hash=row['content_hash'] or '', size_bytes=row['size_bytes'],
+            ref_count=row['refs'],
+        ))
+        if len(batch) >= 500:
+            MediaBlob.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        MediaBlob.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0012_backfill_mediafile_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('stem', models.CharField(db_index=True, max_length=255)),
+                ('content_hash', models.CharField(blank=True, db_index=True, max_length=64)),
+                ('size_bytes', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Media Blob',
+                'verbose_name_plural': 'Media Blobs',
+            },
+        ),
+        migrations.AlterField(
+            model_name='mediafile',
+            name='file',
+            field=models.FileField(storage=mainapp.storage.get_media_storage, upload_to='uploads/'),
+        ),
+        migrations.RunPython(create_blobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# Mirrors mainapp.search.SEARCH_INDEXES and SQLiteFTSBackend as of this migration
+INDEXES = {
+    'mainapp_prayerrequest': ('name', 'message'),
+    'mainapp_contactmessage': ('name', 'email', 'subject', 'message'),
+}
+TOKENIZER = 'porter unicode61 remove_diacritics 2'
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts_tables(apps, schema_editor):
+    """FTS5 tables for SQLiteFTSBackend, filled from the existing rows"""
+    if not fts5_available(schema_editor.connection):
+        return  # Use mainapp.search.DatabaseSearchBackend here
+    for table, columns in INDEXES.items():
+        column_list = ', '.join(columns)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5({column_list}, tokenize='{TOKENIZER}')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {table}_fts (rowid, {column_list}) SELECT id, {column_list} FROM {table}"
+        )
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in INDEXES:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0013_mediablob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    """Staff have already seen what's there; digests start with new arrivals"""
+    apps.get_model('mainapp', 'ContactMessage').objects.update(notified_at=F('created_at'))
+    apps.get_model('mainapp', 'PrayerRequest').objects.update(notified_at=F('submitted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0015_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='prayerrequest',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(condition=models.Q(('notified_at__isnull', True)), fields=['created_at'], name='contact_awaiting_digest'),
+        ),
+        migrations.AddIndex(
+            model_name='prayerrequest',
+            index=models.Index(condition=models.Q(('approved', False), ('notified_at__isnull', True)), fields=['submitted_at'], name='prayer_awaiting_digest'),
+        ),
+    ]
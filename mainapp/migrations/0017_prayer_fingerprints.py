@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0016_notification_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('request_hash', models.CharField(max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='prayerrequest',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='prayerrequest',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='prayerrequest',
+            name='simhash',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='prayerrequest',
+            index=models.Index(fields=['name_key', 'submitted_at'], name='prayer_name_recent'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='prayer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mainapp.prayerrequest'),
+        ),
+    ]
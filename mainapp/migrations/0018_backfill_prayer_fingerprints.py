@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from mainapp import fingerprints
+
+
+def backfill_fingerprints(apps, schema_editor):
+    PrayerRequest = apps.get_model('mainapp', 'PrayerRequest')
+    batch = []
+    fields = ['name_key', 'fingerprint', 'simhash']
+    for prayer in PrayerRequest.objects.filter(fingerprint='').only('name', 'message').iterator(chunk_size=2000):
+        prayer.name_key = fingerprints.normalize(prayer.name)[:100]
+        prayer.fingerprint = fingerprints.fingerprint(prayer.message)
+        prayer.simhash = fingerprints.simhash(prayer.message)
+        batch.append(prayer)
+        if len(batch) >= 2000:
+            PrayerRequest.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        PrayerRequest.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0017_prayer_fingerprints'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
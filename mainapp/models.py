@@ -1,17 +1,101 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
+from mainapp import fingerprints, sniffing
+from mainapp.storage import get_media_storage
+
 class MediaFile(models.Model):
-    file = models.FileField(upload_to='uploads/')
+    IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']
+    VIDEO_EXTENSIONS = ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm']
+
+    KIND_IMAGE = sniffing.KIND_IMAGE
+    KIND_VIDEO = sniffing.KIND_VIDEO
+    KIND_OTHER = sniffing.KIND_OTHER
+    KIND_CHOICES = [
+        (KIND_IMAGE, 'Image'),
+        (KIND_VIDEO, 'Video'),
+        (KIND_OTHER, 'Other'),
+    ]
+
+    PROCESSING_PENDING = 'pending'
+    PROCESSING_READY = 'ready'
+    PROCESSING_FAILED = 'failed'
+    PROCESSING_UNAVAILABLE = 'unavailable'
+    PROCESSING_STATUS = [
+        (PROCESSING_PENDING, 'Pending'),
+        (PROCESSING_READY, 'Ready'),
+        (PROCESSING_FAILED, 'Failed'),
+        (PROCESSING_UNAVAILABLE, 'No decoder available'),
+    ]
+
+    # Stored by content hash and shared between identical uploads (MediaBlob)
+    file = models.FileField(upload_to='uploads/', storage=get_media_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Sniffed from the content once, at upload (see populate_file_metadata)
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES, blank=True, editable=False)
+    mime_type = models.CharField(max_length=100, blank=True, editable=False)
+    size_bytes = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    # Resized copies written by mainapp.imaging, smallest first
+    variants = models.JSONField(default=list, blank=True, editable=False)
+    # Filled in by mainapp.media_processing after upload
+    processing_status = models.CharField(
+        max_length=12, choices=PROCESSING_STATUS, default=PROCESSING_PENDING, editable=False
+    )
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    duration = models.FloatField(null=True, blank=True, editable=False, help_text='Seconds')
+    poster = models.FileField(upload_to='uploads/', blank=True, editable=False)
 
     class Meta:
         ordering = ['-uploaded_at']  # Newest first by default
         verbose_name = 'Media File'
         verbose_name_plural = 'Media Files'
+        indexes = [
+            models.Index(fields=['uploaded_at', 'id']),  # Gallery keyset pagination
+            models.Index(fields=['kind', 'uploaded_at', 'id']),  # Images/videos filter
+        ]
 
     def __str__(self):
         return self.file.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the blob signals notice when an existing row gets a new file
+        instance._stored_file_name = instance.__dict__.get('file')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.content_hash:
+            self.populate_file_metadata()
+        super().save(*args, **kwargs)
+
+    def derived_file_names(self):
+        """Variants and poster generated from this file"""
+        names = [v['name'] for v in self.variants or []]
+        if self.poster:
+            names.append(self.poster.name)
+        return names
+
+    def populate_file_metadata(self):
+        """Sniff kind, MIME type, size, hash and image size from the file's bytes"""
+        try:
+            if self.file._committed:
+                with self.file.storage.open(self.file.name, 'rb') as fh:
+                    info = sniffing.inspect_file(fh, self.file.name)
+            else:
+                # A fresh upload that hasn't been written to storage yet;
+                # hand the digest on so the storage needn't hash it again
+                info = sniffing.inspect_file(self.file.file, self.file.name)
+                self.file.file.sha256 = info['content_hash']
+        except OSError:
+            info = sniffing.describe_by_name(self.file.name)
+        for field, value in info.items():
+            if value is not None:
+                setattr(self, field, value)
     
     def filename(self):
         """Returns just the filename without path"""
@@ -23,14 +107,96 @@ class MediaFile(models.Model):
     
     def is_image(self):
         """Check if the file is an image"""
-        image_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']
-        return self.file_extension() in image_extensions
+        if self.kind:
+            return self.kind == self.KIND_IMAGE
+        return self.file_extension() in self.IMAGE_EXTENSIONS
+    is_image.boolean = True
     
     def is_video(self):
         """Check if the file is a video"""
-        video_extensions = ['mp4', 'avi', 'mov', 'wmv', 'flv', 'webm']
-        return self.file_extension() in video_extensions
+        if self.kind:
+            return self.kind == self.KIND_VIDEO
+        return self.file_extension() in self.VIDEO_EXTENSIONS
+    is_video.boolean = True
+
+    def duration_display(self):
+        """Duration as m:ss"""
+        if not self.duration:
+            return ''
+        minutes, seconds = divmod(int(round(self.duration)), 60)
+        return f'{minutes}:{seconds:02d}'
+
+    def variants_of_type(self, mime_type):
+        return [v for v in self.variants or [] if v.get('mime_type') == mime_type]
+
+    def webp_srcset(self):
+        """srcset of the WebP variants for the <picture> source"""
+        return self._srcset(self.variants_of_type('image/webp'))
+
+    def fallback_srcset(self):
+        """srcset of the JPEG/PNG variants for browsers without WebP"""
+        return self._srcset([v for v in self.variants or [] if v.get('mime_type') != 'image/webp'])
+
+    def thumbnail_url(self):
+        """Smallest JPEG/PNG variant, or the original when there are none"""
+        fallbacks = [v for v in self.variants or [] if v.get('mime_type') != 'image/webp']
+        if fallbacks:
+            return self.file.storage.url(fallbacks[0]['name'])
+        return self.file.url
+
+    def _srcset(self, variants):
+        return ', '.join(f"{self.file.storage.url(v['name'])} {v['width']}w" for v in variants)
     
+class MediaBlob(models.Model):
+    """A stored media file and how many MediaFile rows reference it"""
+    name = models.CharField(max_length=255, unique=True)
+    # name without extension; derived files are stored as "<stem>_*"
+    stem = models.CharField(max_length=255, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    size_bytes = models.PositiveBigIntegerField(null=True, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Media Blob'
+        verbose_name_plural = 'Media Blobs'
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} reference{'s' if self.ref_count != 1 else ''})"
+
+
+class ChunkedUpload(models.Model):
+    """A resumable upload in progress; see mainapp.uploads"""
+    STATUS_UPLOADING = 'uploading'
+    STATUS_COMPLETE = 'complete'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_COMPLETE, 'Complete'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    media = models.ForeignKey(MediaFile, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} ({self.progress}%)"
+
+    @property
+    def progress(self):
+        return round(100 * self.offset / self.size, 1) if self.size else 0.0
+
+
 class ContactMessage(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -38,9 +204,15 @@ class ContactMessage(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
+    notified_at = models.DateTimeField(null=True, blank=True, editable=False)  # sent in a digest
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Only the few messages still waiting for a digest are indexed
+            models.Index(fields=['created_at'], condition=models.Q(notified_at__isnull=True),
+                         name='contact_awaiting_digest'),
+        ]
     
     def __str__(self):
         return f"Message from {self.name} - {self.subject}"
@@ -58,6 +230,11 @@ class PrayerRequest(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
     prayer_count = models.PositiveIntegerField(default=0)  # Add this field
+    notified_at = models.DateTimeField(null=True, blank=True, editable=False)  # sent in a digest
+    # For spotting repeated submissions (mainapp.submissions), set on save
+    name_key = models.CharField(max_length=100, blank=True, editable=False)
+    fingerprint = models.CharField(max_length=16, blank=True, editable=False)
+    simhash = models.BigIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['-submitted_at']
@@ -66,15 +243,34 @@ class PrayerRequest(models.Model):
         indexes = [
             models.Index(fields=['approved', 'submitted_at']),
             models.Index(fields=['submitted_at']),
+            models.Index(fields=['submitted_at'], condition=models.Q(approved=False, notified_at__isnull=True),
+                         name='prayer_awaiting_digest'),
+            # Recent prayers of one name: the duplicate check's candidates
+            models.Index(fields=['name_key', 'submitted_at'], name='prayer_name_recent'),
         ]
 
     def __str__(self):
         return f"Prayer from {self.name} ({'Approved' if self.approved else 'Pending'})"
     
-    def increment_prayer_count(self):
-        """Increment prayer count and save"""
-        self.prayer_count += 1
-        self.save()
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'name', 'message'} & set(update_fields):
+            self.update_fingerprints()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'name_key', 'fingerprint', 'simhash'}
+        super().save(*args, **kwargs)
+    
+    def update_fingerprints(self):
+        self.name_key = fingerprints.normalize(self.name)[:100]
+        self.fingerprint = fingerprints.fingerprint(self.message)
+        self.simhash = fingerprints.simhash(self.message)
+    
+    def increment_prayer_count(self, amount=1):
+        """Atomically add to the prayer count without rewriting the row"""
+        PrayerRequest.objects.filter(pk=self.pk).update(
+            prayer_count=models.F('prayer_count') + amount
+        )
+        self.refresh_from_db(fields=['prayer_count'])
     
     def get_short_message(self, length=100):
         if len(self.message) <= length:
@@ -91,4 +287,51 @@ class PrayerRequest(models.Model):
     
     @classmethod
     def get_pending_prayers(cls):
-        return cls.objects.filter(approved=False)
\ No newline at end of file
+        return cls.objects.filter(approved=False)
+
+class IdempotencyKey(models.Model):
+    """A client-chosen key for one submission, so retrying it can't submit twice"""
+    key = models.CharField(max_length=64, unique=True)
+    # Name and message fingerprint: a key reused for other content isn't a retry
+    request_hash = models.CharField(max_length=32)
+    prayer = models.ForeignKey(PrayerRequest, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.key
+
+
+class Job(models.Model):
+    """A queued call to a module-level function; see mainapp.jobqueue"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    func = models.CharField(max_length=255)  # dotted path
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    lane = models.CharField(max_length=20, default='default')
+    priority = models.SmallIntegerField(default=0)  # lower runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['priority', 'run_at', 'id']
+        indexes = [
+            # Answers the workers' "next due job" query
+            models.Index(fields=['status', 'priority', 'run_at', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.func} ({self.get_status_display()}, attempt {self.attempts}/{self.max_attempts})"
@@ -0,0 +1,146 @@
+"""
+Prayer moderation queue.
+
+Moderators page through prayers by status and approve, unapprove or
+delete many at once. Each bulk action is a single ``UPDATE ... WHERE id IN``
+or ``DELETE ... WHERE id IN`` statement. Those bypass ``save()``/``delete()`` and
+so the model signals, so this module does their work itself, once per
+action instead of once per row:
+
+* the cached prayer list is dropped (``invalidate_prayer_list``), and
+  the API list gets a new version (``touch_prayer_list``)
+* deleted prayers are removed from the search index, and their
+  idempotency keys deleted with them
+* open prayer walls get a ``prayer`` event for each newly approved prayer
+  and a ``delete`` event for each one unapproved or deleted
+
+Pages are keyset-paginated on ``(submitted_at, id)``. With a status filter
+the ``(approved, submitted_at)`` index answers every page directly,
+however long the backlog. Sizes come from settings:
+
+    MODERATION_PAGE_SIZE = 50
+    MODERATION_MAX_PAGE_SIZE = 200   # also the most rows one action may touch
+"""
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from mainapp.api import touch_prayer_list
+from mainapp.caching import invalidate_prayer_list
+from mainapp.events import get_broker, prayer_data
+from mainapp.models import IdempotencyKey, PrayerRequest
+from mainapp.search import get_search_backend
+
+MODERATION_KEYSET = ('submitted_at', 'id')
+
+STATUS_PENDING = 'pending'
+STATUS_APPROVED = 'approved'
+STATUS_ALL = 'all'
+STATUSES = (STATUS_PENDING, STATUS_APPROVED, STATUS_ALL)
+
+ACTIONS = ('approve', 'unapprove', 'delete')
+
+
+class ModerationError(ValueError):
+    """Raised for an unknown action or an oversized selection."""
+
+
+def moderation_status(requested):
+    """?status=pending|approved|all; pending by default, as that's the queue"""
+    return requested if requested in STATUSES else STATUS_PENDING
+
+
+def moderation_queryset(status):
+    queryset = PrayerRequest.objects.all()
+    if status == STATUS_PENDING:
+        queryset = queryset.filter(approved=False)
+    elif status == STATUS_APPROVED:
+        queryset = queryset.filter(approved=True)
+    return queryset
+
+
+def moderation_page_size(requested=None):
+    """Page size from ?limit=, clamped to MODERATION_MAX_PAGE_SIZE"""
+    default = getattr(settings, 'MODERATION_PAGE_SIZE', 50)
+    try:
+        size = int(requested) if requested else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, max_selection()))
+
+
+def max_selection():
+    return getattr(settings, 'MODERATION_MAX_PAGE_SIZE', 200)
+
+
+def parse_ids(values):
+    """Distinct integer ids from a multi-valued form field; junk is ignored."""
+    ids = set()
+    for value in values:
+        try:
+            ids.add(int(value))
+        except (TypeError, ValueError):
+            continue
+    return sorted(ids)
+
+
+def bulk_moderate(action, ids):
+    """
+    Apply ``action`` to the prayers in ``ids`` with one statement.
+
+    Returns the number of prayers that changed; rows already in the target
+    state, or gone, are left alone and not counted.
+    """
+    if action not in ACTIONS:
+        raise ModerationError(f'Unknown action {action!r}.')
+    if len(ids) > max_selection():
+        raise ModerationError(f'Select at most {max_selection()} prayers at a time.')
+    if not ids:
+        return 0
+
+    # Read the affected ids on the primary too: they must match what we write
+    using = router.db_for_write(PrayerRequest)
+    queryset = PrayerRequest.objects.using(using).filter(pk__in=ids)
+    with transaction.atomic(using=using):
+        if action == 'delete':
+            changed = _bulk_delete(queryset)
+        else:
+            changed = _bulk_set_approved(queryset, approved=action == 'approve')
+        if changed:
+            transaction.on_commit(lambda: _announce(action, changed), using=using)
+    return len(changed)
+
+
+def _bulk_set_approved(queryset, approved):
+    # Only rows whose status flips need an event
+    changed = list(queryset.exclude(approved=approved).order_by('pk').values_list('pk', flat=True))
+    if changed:
+        # update() skips auto_now, so stamp updated_at as save() would
+        queryset.filter(pk__in=changed).update(approved=approved, updated_at=timezone.now())
+    return changed
+
+
+def _bulk_delete(queryset):
+    changed = list(queryset.order_by('pk').values_list('pk', flat=True))
+    if changed:
+        # Idempotency keys are the only rows referencing a prayer; deleting
+        # them first is the whole cascade, so there is no reason to load
+        # every row the way QuerySet.delete() does when receivers are
+        # connected.
+        IdempotencyKey.objects.using(queryset.db).filter(prayer_id__in=changed)._raw_delete(queryset.db)
+        queryset._raw_delete(queryset.db)
+        get_search_backend().remove(PrayerRequest, changed, using=queryset.db)
+    return changed
+
+
+def _announce(action, ids):
+    invalidate_prayer_list()
+    touch_prayer_list()
+    broker = get_broker()
+    if action == 'approve':
+        approved = PrayerRequest.objects.using(router.db_for_write(PrayerRequest)).filter(pk__in=ids)
+        for prayer in approved.order_by('submitted_at', 'pk'):
+            broker.publish('prayer', prayer_data(prayer))
+    else:
+        for prayer_id in ids:
+            broker.publish('delete', {'id': prayer_id})
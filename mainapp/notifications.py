@@ -0,0 +1,222 @@
+"""
+Email notifications, sent from background jobs (mainapp.jobqueue).
+
+New contact-form messages and prayers awaiting moderation are reported to
+``MANAGERS`` in digests rather than one email each. Every submission
+schedules ``send_notification_digest`` with ``enqueue_once``, so a burst of
+500 submissions (a spam run, a busy Sunday) still means one queued job and,
+``INTERVAL`` seconds later, one email listing them all. The job marks what
+it reports with ``notified_at`` before sending and clears the marks again
+if sending fails, so the retry reports the same items and nothing is
+reported twice.
+
+    NOTIFICATION_DIGEST = {
+        'INTERVAL': 600,        # seconds from the first new item to the digest
+        'MAX_ITEMS': 100,       # per email; the rest follow in the next digest
+        'SITE_URL': 'https://www.example.org',  # for links to the admin
+        'POOL_SIZE': 2,         # open mail connections kept per process
+        'POOL_MAX_IDLE': 60,    # seconds before an idle connection is closed
+    }
+
+Mail goes through ``EMAIL_BACKEND``: SMTP in production, the console or
+file backend (``EMAIL_FILE_PATH``) when running locally. SMTP connections
+are pooled, so consecutive digests don't each pay for the TCP, TLS and
+login handshakes.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils import timezone
+
+from mainapp.jobqueue import get_job_queue, job
+from mainapp.models import ContactMessage, PrayerRequest
+
+DEFAULT_NOTIFICATION_DIGEST = {
+    'INTERVAL': 600,
+    'MAX_ITEMS': 100,
+    'SITE_URL': '',
+    'POOL_SIZE': 2,
+    'POOL_MAX_IDLE': 60,
+}
+
+
+def digest_setting(name):
+    return {**DEFAULT_NOTIFICATION_DIGEST, **getattr(settings, 'NOTIFICATION_DIGEST', {})}[name]
+
+
+# Connection pool
+
+class ConnectionPool:
+    """Open email connections reused across sends in this process."""
+
+    def __init__(self, size=2, max_idle=60):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []  # (connection, returned at)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                connection, returned_at = self._idle.pop()
+                if now - returned_at < self.max_idle:
+                    return connection
+                self._close(connection)
+        connection = get_connection()
+        connection.open()
+        return connection
+
+    def release(self, connection, broken=False):
+        """Give ``connection`` back, or close it if it failed or the pool is full."""
+        if not broken:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append((connection, time.monotonic()))
+                    return
+        self._close(connection)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass  # Already dropped by the server
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(digest_setting('POOL_SIZE'), digest_setting('POOL_MAX_IDLE'))
+    return _pool
+
+
+@receiver(setting_changed)
+def _reset_connection_pool(setting, **kwargs):
+    global _pool
+    if setting in ('NOTIFICATION_DIGEST', 'EMAIL_BACKEND') and _pool is not None:
+        _pool.clear()
+        _pool = None
+
+
+def send_pooled(message):
+    pool = get_connection_pool()
+    connection = pool.acquire()
+    try:
+        message.connection = connection
+        message.send()
+    except Exception:
+        pool.release(connection, broken=True)
+        raise
+    pool.release(connection)
+
+
+# Digests
+
+def contact_message_body(message):
+    return (
+        f"From: {message.name} <{message.email}>\n"
+        f"Received: {message.created_at:%b %d, %Y %H:%M}\n\n"
+        f"{message.message}\n"
+    )
+
+
+def admin_url(path):
+    return digest_setting('SITE_URL').rstrip('/') + path
+
+
+def claim(queryset, limit):
+    """Mark up to ``limit`` unreported rows as reported; return their ids."""
+    ids = list(queryset.filter(notified_at__isnull=True).values_list('pk', flat=True)[:limit])
+    if ids:
+        # Concurrent digests only get the rows they marked themselves
+        queryset.filter(pk__in=ids, notified_at__isnull=True).update(notified_at=timezone.now())
+    return ids
+
+
+def digest_body(messages, prayers, more):
+    sections = []
+    if messages:
+        lines = [f'New contact messages ({len(messages)})', '']
+        for message in messages:
+            lines += [
+                f'== {message.subject}',
+                contact_message_body(message),
+                admin_url(reverse('admin:mainapp_contactmessage_change', args=[message.pk])),
+                '',
+            ]
+        sections.append('\n'.join(lines))
+    if prayers:
+        lines = [f'Prayers awaiting approval ({len(prayers)})', '']
+        for prayer in prayers:
+            lines.append(f'- {prayer.name} ({prayer.submitted_at:%b %d, %H:%M}): {prayer.message[:200]}')
+        lines += ['', f'Moderate: {admin_url(reverse("manage_prayers"))}']
+        sections.append('\n'.join(lines))
+    if more:
+        sections.append(f'...and {more} more, in the next digest.')
+    return '\n\n'.join(sections)
+
+
+@job(max_attempts=5)
+def send_notification_digest():
+    """Job: email everything new since the last digest to ``MANAGERS``."""
+    if not settings.MANAGERS:
+        return
+    limit = digest_setting('MAX_ITEMS')
+    pending_prayers = PrayerRequest.objects.filter(approved=False)
+    with transaction.atomic():
+        message_ids = claim(ContactMessage.objects.all(), limit)
+        prayer_ids = claim(pending_prayers, limit - len(message_ids))
+    if not message_ids and not prayer_ids:
+        return
+
+    messages = list(ContactMessage.objects.filter(pk__in=message_ids).order_by('created_at'))
+    prayers = list(PrayerRequest.objects.filter(pk__in=prayer_ids).order_by('submitted_at'))
+    more = (
+        ContactMessage.objects.filter(notified_at__isnull=True).count()
+        + pending_prayers.filter(notified_at__isnull=True).count()
+    )
+    subject = ', '.join(
+        part for part in (
+            f'{len(messages)} contact message(s)' if messages else '',
+            f'{len(prayers)} prayer(s) to approve' if prayers else '',
+        ) if part
+    )
+    email = EmailMessage(
+        f'{settings.EMAIL_SUBJECT_PREFIX}{subject}',
+        digest_body(messages, prayers, more),
+        settings.SERVER_EMAIL,
+        [address for _, address in settings.MANAGERS],
+    )
+    try:
+        send_pooled(email)
+    except Exception:
+        # Report them again on the retry
+        ContactMessage.objects.filter(pk__in=message_ids).update(notified_at=None)
+        PrayerRequest.objects.filter(pk__in=prayer_ids).update(notified_at=None)
+        raise
+    if more:
+        schedule_digest()
+
+
+def schedule_digest():
+    """Make sure a digest is on its way; cheap to call for every submission."""
+    get_job_queue().enqueue_once(send_notification_digest, digest_setting('INTERVAL'))
@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination.
+
+Offset pagination gets slower the deeper you page because the database has
+to walk and discard every skipped row. Keyset pagination instead remembers
+the sort key of the last row shown and asks for rows strictly after it,
+which an index on the same columns answers in constant time on any page.
+"""
+import base64
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor can't be decoded."""
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str | None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    """Encode a row's sort-key values into an opaque, URL-safe cursor."""
+    payload = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields, model):
+    """Decode a cursor produced by ``encode_cursor`` back into field values."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Malformed cursor.') from e
+    if not isinstance(raw, list) or len(raw) != len(fields):
+        raise InvalidCursor('Malformed cursor.')
+
+    values = []
+    for field_name, value in zip(fields, raw):
+        field = model._meta.get_field(field_name)
+        if field.get_internal_type() == 'DateTimeField':
+            value = parse_datetime(value) if isinstance(value, str) else None
+        elif isinstance(value, (int, str)) and not isinstance(value, bool):
+            # What the column can hold, or the query itself would fail
+            try:
+                value = field.to_python(value)
+            except (ValidationError, ValueError):
+                value = None
+        else:
+            value = None
+        if value is None:
+            raise InvalidCursor('Malformed cursor.')
+        values.append(value)
+    return values
+
+
+def _after(fields, values):
+    """
+    Build the "strictly after this row" filter for a descending ordering.
+
+    For ``('uploaded_at', 'id')`` this is
+    ``uploaded_at < v0 OR (uploaded_at = v0 AND id < v1)``.
+    """
+    condition = Q()
+    for i, field_name in enumerate(fields):
+        clause = Q(**{f'{field_name}__lt': values[i]})
+        for prior_name, prior_value in zip(fields[:i], values[:i]):
+            clause &= Q(**{prior_name: prior_value})
+        condition |= clause
+    return condition
+
+
+def paginate_keyset(queryset, fields, cursor=None, page_size=24):
+    """
+    Return one ``KeysetPage`` of ``queryset`` ordered by ``fields`` descending.
+
+    ``fields`` must end in a unique column (normally ``'id'``) so that rows
+    sharing a timestamp are neither skipped nor repeated.
+    """
+    fields = tuple(fields)
+    queryset = queryset.order_by(*[f'-{name}' for name in fields])
+    if cursor:
+        values = decode_cursor(cursor, fields, queryset.model)
+        queryset = queryset.filter(_after(fields, values))
+
+    # Fetch one extra row to learn whether another page exists.
+    rows = list(queryset[:page_size + 1])
+    items = rows[:page_size]
+    next_cursor = None
+    if len(rows) > page_size:
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, name) for name in fields])
+    return KeysetPage(items=items, next_cursor=next_cursor)
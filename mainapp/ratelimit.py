@@ -0,0 +1,364 @@
+"""
+Rate limits for the write endpoints: one script can't flood the SQLite writer.
+
+Each limit is a token bucket per client: ``'20/h'`` allows a burst of 20
+requests, then one more every 3 minutes as the bucket refills. Views opt in
+with ``@rate_limit('<limit>')``; requests over the limit get a 429 with a
+``Retry-After`` header and never reach the view or the database.
+
+    RATE_LIMITS = {
+        'ENABLED': True,
+        'BACKEND': 'mainapp.ratelimit.SQLiteRateLimitStore',  # shared by all workers
+        'OPTIONS': {'location': BASE_DIR / 'ratelimit.sqlite3'},
+        'PROXY_COUNT': 1,      # proxies in front that append to X-Forwarded-For
+        'KEY': 'ip',           # or 'user', or 'session'; see below
+        'RATES': {
+            'prayer_submit': '20/h',
+            'prayer_increment': '60/m',
+            'contact': '10/h',
+            'upload': '30/h',
+            'delete': '30/m',
+        },
+    }
+
+A bucket is kept as a single timestamp, the time at which it will be full
+again (the "generic cell rate algorithm"), so a check reads and writes one
+value per request whatever the rate. Stores:
+
+- ``LocalRateLimitStore``: a dict in this process. Each worker counts on its
+  own, so with N workers a client gets up to N times the rate.
+- ``CacheRateLimitStore``: a Django cache (``OPTIONS: {'alias': ...}``)
+  shared by the workers. Caches have no compare-and-set, so concurrent
+  requests of one client may occasionally both pass.
+- ``SQLiteRateLimitStore``: its own SQLite file, separate from the
+  application database so rejected requests never take its write lock.
+  A check is one atomic UPSERT, exact across processes.
+
+Clients are told apart by IP address (IPv6 by /64, which one host
+usually has to itself). Behind a reverse proxy every request comes from
+the proxy, so set ``PROXY_COUNT`` to the number of proxies that append to
+``X-Forwarded-For``; the client is the address they saw. Set a rate to
+``None`` to lift that limit.
+
+Everyone behind one NAT shares that address and so a bucket. ``KEY``
+can narrow it:
+
+- ``'ip'``: the address only.
+- ``'user'``: signed-in users get a bucket of their own account, wherever
+  they are; everyone else is keyed by address.
+- ``'session'``: as ``'user'``, and anonymous visitors with a session get
+  a bucket per session and address. Only sessions the server created
+  count, but a script that collects sessions gets a bucket for each, so
+  use it where shared addresses are the bigger problem.
+"""
+import functools
+import ipaddress
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.module_loading import import_string
+
+from mainapp.metrics import RATE_LIMITED
+
+DEFAULT_RATE_LIMITS = {
+    'ENABLED': True,
+    'BACKEND': 'mainapp.ratelimit.LocalRateLimitStore',
+    'OPTIONS': {},
+    'PROXY_COUNT': 0,
+    'KEY': 'ip',
+    'RATES': {},
+}
+
+UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+KEYS = ('ip', 'user', 'session')
+
+
+def rate_limit_setting(name):
+    return {**DEFAULT_RATE_LIMITS, **getattr(settings, 'RATE_LIMITS', {})}[name]
+
+
+def parse_rate(rate):
+    """``'20/h'`` or ``'5/10m'`` -> (requests, seconds)"""
+    match = RATE_PATTERN.match(rate.replace(' ', ''))
+    if not match or not int(match[1]):
+        raise ImproperlyConfigured(f'Invalid rate {rate!r}: use "<requests>/<period>", e.g. "20/h" or "5/10m".')
+    return int(match[1]), int(match[2] or 1) * UNITS[match[3]]
+
+
+class Rate:
+    """A bucket of ``capacity`` tokens, refilled at one per ``interval`` seconds."""
+
+    def __init__(self, requests, period):
+        self.capacity = requests
+        self.interval = period / requests
+        # How far ahead of now a bucket's "full again" time may run
+        self.tolerance = self.interval * requests
+
+
+def advance(tat, now, rate):
+    """
+    New "full again" time after taking a token, or None when the bucket is empty.
+
+    ``tat`` is the stored time (None for a new client).
+    """
+    tat = max(tat or now, now) + rate.interval
+    return tat if tat - now <= rate.tolerance else None
+
+
+def retry_after(tat, now, rate):
+    """Seconds until a bucket whose "full again" time is ``tat`` has a token"""
+    return max(tat + rate.interval - now - rate.tolerance, 0)
+
+
+# Stores
+
+class LocalRateLimitStore:
+    """Buckets of this process, least recently used dropped past ``max_keys``."""
+
+    def __init__(self, max_keys=10000, **options):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> "full again" time
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate):
+        """Take a token; return 0 if there was one, else the seconds to wait."""
+        now = time.time()
+        with self._lock:
+            tat = self._buckets.get(key)
+            new_tat = advance(tat, now, rate)
+            if new_tat is None:
+                return retry_after(tat, now, rate)
+            self._buckets[key] = new_tat
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0
+
+    async def aconsume(self, key, rate):
+        return self.consume(key, rate)
+
+
+class CacheRateLimitStore:
+    """Buckets in a Django cache shared by the workers."""
+
+    def __init__(self, alias='default', prefix='ratelimit', **options):
+        self.alias = alias
+        self.prefix = prefix
+
+    def consume(self, key, rate):
+        cache = caches[self.alias]
+        key = f'{self.prefix}:{key}'
+        now = time.time()
+        tat = cache.get(key)
+        new_tat = advance(tat, now, rate)
+        if new_tat is None:
+            return retry_after(tat, now, rate)
+        # Once full again the bucket is the same as no bucket
+        cache.set(key, new_tat, timeout=math.ceil(new_tat - now) + 1)
+        return 0
+
+    async def aconsume(self, key, rate):
+        return await sync_to_async(self.consume, thread_sensitive=False)(key, rate)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (
+    key TEXT PRIMARY KEY,
+    tat REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Take a token in one statement: the update only happens while the bucket
+# has one, and RETURNING tells whether it did
+CONSUME = """
+INSERT INTO bucket (key, tat) VALUES (:key, :now + :interval)
+ON CONFLICT (key) DO UPDATE SET tat = max(tat, :now) + :interval
+WHERE max(tat, :now) + :interval - :now <= :tolerance
+RETURNING tat
+"""
+
+
+class SQLiteRateLimitStore:
+    """Buckets in a standalone SQLite file shared by the workers."""
+
+    def __init__(self, location=None, busy_timeout=1.0, prune_probability=0.001, **options):
+        self.location = str(location or os.path.join(settings.BASE_DIR, 'ratelimit.sqlite3'))
+        self.busy_timeout = busy_timeout
+        self.prune_probability = prune_probability
+        self._local = threading.local()
+
+    def _connection(self):
+        # Connections can't follow a fork, so they are also keyed by pid
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.location, timeout=self.busy_timeout, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=OFF')  # Losing the last buckets in a crash is fine
+        connection.execute(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def consume(self, key, rate):
+        connection = self._connection()
+        now = time.time()
+        params = {'key': key, 'now': now, 'interval': rate.interval, 'tolerance': rate.tolerance}
+        if connection.execute(CONSUME, params).fetchone() is not None:
+            if random.random() < self.prune_probability:
+                connection.execute('DELETE FROM bucket WHERE tat < ?', (now,))
+            return 0
+        row = connection.execute('SELECT tat FROM bucket WHERE key = ?', (key,)).fetchone()
+        return retry_after(row[0] if row else now, now, rate)
+
+    async def aconsume(self, key, rate):
+        return await sync_to_async(self.consume, thread_sensitive=False)(key, rate)
+
+
+# Limiter
+
+class RateLimiter:
+    """The store and parsed rates configured by ``RATE_LIMITS``."""
+
+    def __init__(self):
+        self.enabled = rate_limit_setting('ENABLED')
+        self.proxy_count = rate_limit_setting('PROXY_COUNT')
+        self.key_by = rate_limit_setting('KEY')
+        if self.key_by not in KEYS:
+            raise ImproperlyConfigured(f'Invalid rate limit KEY {self.key_by!r}: use one of {", ".join(KEYS)}.')
+        self.rates = {
+            name: Rate(*parse_rate(rate)) if rate else None
+            for name, rate in rate_limit_setting('RATES').items()
+        }
+        self.store = import_string(rate_limit_setting('BACKEND'))(**rate_limit_setting('OPTIONS'))
+
+    def client_ip(self, request):
+        address = request.META.get('REMOTE_ADDR', '')
+        if self.proxy_count:
+            forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+            # Addresses further left were sent by the client and can be anything
+            if len(forwarded) >= self.proxy_count and forwarded[-self.proxy_count]:
+                address = forwarded[-self.proxy_count]
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return address
+        if ip.version == 6:
+            if ip.ipv4_mapped:
+                return str(ip.ipv4_mapped)
+            return str(ipaddress.ip_network(f'{ip}/64', strict=False).network_address)
+        return address
+
+    def client(self, request):
+        """Who the bucket belongs to, by ``KEY``"""
+        if self.key_by != 'ip':
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                return f'user:{user.pk}'
+            session = getattr(request, 'session', None)
+            if self.key_by == 'session' and session is not None:
+                session.keys()  # Loads it: an unknown or expired cookie leaves no key
+                if session.session_key:
+                    return f'{self.client_ip(request)}:session:{session.session_key}'
+        return self.client_ip(request)
+
+    def key(self, name, request):
+        return f'{name}:{self.client(request)}'
+
+    async def akey(self, name, request):
+        if self.key_by == 'ip':
+            return self.key(name, request)
+        # The user and session are loaded from the database
+        return await sync_to_async(self.key)(name, request)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+@receiver(setting_changed)
+def _reset_rate_limiter(setting, **kwargs):
+    global _limiter
+    if setting == 'RATE_LIMITS':
+        _limiter = None
+
+
+def too_many_requests(request, wait, as_json):
+    wait = max(math.ceil(wait), 1)
+    if as_json:
+        response = JsonResponse(
+            {'success': False, 'error': 'Too many requests. Please try again later.', 'retry_after': wait},
+            status=429,
+        )
+    else:
+        response = HttpResponse(render_to_string('mainapp/429.html', {'retry_after': wait}, request), status=429)
+    response['Retry-After'] = str(wait)
+    return response
+
+
+def rate_limit(name, methods=('POST',), as_json=False):
+    """
+    Limit the ``methods`` requests of each client to the view by ``RATES[name]``.
+
+    Views sharing a name share the bucket. Works on sync and async views;
+    ``as_json`` answers 429s in the ``{'success': False, 'error': ...}`` shape
+    of the AJAX endpoints instead of a page.
+    """
+    methods = frozenset(methods)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                limiter = get_rate_limiter()
+                rate = limiter.rates.get(name) if limiter.enabled and request.method in methods else None
+                if rate is not None:
+                    wait = await limiter.store.aconsume(await limiter.akey(name, request), rate)
+                    if wait:
+                        RATE_LIMITED.inc(limit=name)
+                        return too_many_requests(request, wait, as_json)
+                return await view(request, *args, **kwargs)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kwargs):
+                limiter = get_rate_limiter()
+                rate = limiter.rates.get(name) if limiter.enabled and request.method in methods else None
+                if rate is not None:
+                    wait = limiter.store.consume(limiter.key(name, request), rate)
+                    if wait:
+                        RATE_LIMITED.inc(limit=name)
+                        return too_many_requests(request, wait, as_json)
+                return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
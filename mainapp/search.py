@@ -0,0 +1,271 @@
+"""
+Full-text search over prayers and contact messages.
+
+``search_fields`` alone turns every admin search into ``LIKE '%term%'``
+scans of the message columns, which get slower with every year of
+prayers. Instead each searchable model has a full-text index, kept in
+step by the model signals (and by bulk moderation, which bypasses them),
+and searches are answered from that index.
+
+The index is reached through a backend chosen with ``SEARCH_BACKEND``:
+
+    SEARCH_BACKEND = {
+        'BACKEND': 'mainapp.search.SQLiteFTSBackend',   # or DatabaseSearchBackend
+        'OPTIONS': {'snippet_tokens': 12},
+    }
+
+``SQLiteFTSBackend`` keeps an FTS5 table per model (``<table>_fts``, one
+row per object, ``rowid`` = primary key) in the same database, so index
+writes commit or roll back with the row they describe. Results are
+ranked by bm25 and come with highlighted snippets. ``DatabaseSearchBackend``
+needs no index at all and works on any database, with ``icontains``
+matching and no ranking; use it where FTS5 isn't available.
+
+Searches are plain words: every word must match, the last one as a prefix
+(so results appear while typing). FTS5 query syntax typed by visitors is
+never passed through. After loading data with signals off (fixtures,
+raw SQL) run ``manage.py rebuild_search_index``.
+"""
+import operator
+import re
+import threading
+from collections import namedtuple
+from functools import reduce
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.dispatch import receiver
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from mainapp.models import ContactMessage, PrayerRequest
+
+DEFAULT_SEARCH_BACKEND = {
+    'BACKEND': 'mainapp.search.SQLiteFTSBackend',
+    'OPTIONS': {},
+}
+
+# Indexed text columns of each searchable model
+SEARCH_INDEXES = {
+    PrayerRequest: ('name', 'message'),
+    ContactMessage: ('name', 'email', 'subject', 'message'),
+}
+
+# Highlight markers: control characters that survive escape() and can't be
+# typed into a form, swapped for <mark> once the snippet is escaped
+MARK_START, MARK_END = '\x02', '\x03'
+
+_WORDS = re.compile(r'\w+')
+
+SearchHit = namedtuple('SearchHit', 'object rank snippet')
+
+
+def search_terms(query):
+    """The words of a visitor's query, lowercased; punctuation is dropped."""
+    return [word.lower() for word in _WORDS.findall(query or '')]
+
+
+def highlight(text):
+    """HTML for a snippet with MARK_START/MARK_END around the matches."""
+    html = escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def indexed_fields(model):
+    try:
+        return SEARCH_INDEXES[model]
+    except KeyError:
+        raise ValueError(f'{model._meta.label} has no search index.') from None
+
+
+class BaseSearchBackend:
+    """Interface shared by all search backends."""
+
+    def __init__(self, snippet_tokens=12, **options):
+        self.snippet_tokens = snippet_tokens
+        self.options = options
+
+    def index(self, instance, using=None):
+        """Add or refresh ``instance`` in its model's index."""
+
+    def remove(self, model, ids, using=None):
+        """Drop the objects with primary keys ``ids`` from the index."""
+
+    def filter(self, queryset, query):
+        """``queryset`` narrowed to objects matching ``query``, in its own order."""
+        raise NotImplementedError('subclasses of BaseSearchBackend must provide a filter() method')
+
+    def search(self, queryset, query, limit=20):
+        """The best ``limit`` matches in ``queryset`` as ``SearchHit``s, best first."""
+        raise NotImplementedError('subclasses of BaseSearchBackend must provide a search() method')
+
+    def rebuild(self, model, batch_size=500, using=None):
+        """Re-index every ``model`` row in batches. Returns the number indexed."""
+        return 0
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """No index: ``icontains`` on every word, in the queryset's order, snippets cut in Python."""
+
+    def filter(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        fields = indexed_fields(queryset.model)
+        for term in terms:
+            queryset = queryset.filter(reduce(operator.or_, (Q(**{f'{field}__icontains': term}) for field in fields)))
+        return queryset
+
+    def search(self, queryset, query, limit=20):
+        terms = search_terms(query)
+        # Snippets come from the longest matching text, usually the message
+        fields = sorted(indexed_fields(queryset.model), key=lambda field: field != 'message')
+        hits = []
+        for obj in self.filter(queryset, query)[:limit]:
+            text = next((getattr(obj, field) for field in fields if self._matches(getattr(obj, field), terms)), '')
+            hits.append(SearchHit(obj, None, highlight(self._snippet(text, terms))))
+        return hits
+
+    @staticmethod
+    def _matches(text, terms):
+        return any(term in (text or '').lower() for term in terms)
+
+    def _snippet(self, text, terms):
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        words = text.split()
+        first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+        start = max(0, first - self.snippet_tokens // 3)
+        window = ' '.join(words[start:start + self.snippet_tokens])
+        window = pattern.sub(lambda m: f'{MARK_START}{m.group(0)}{MARK_END}', window)
+        return ('…' if start else '') + window + ('…' if start + self.snippet_tokens < len(words) else '')
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """An FTS5 table per model, ranked with bm25."""
+
+    tokenizer = 'porter unicode61 remove_diacritics 2'
+
+    def table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def install(self, model, using=None):
+        """Create ``model``'s FTS5 table if it doesn't exist yet."""
+        columns = ', '.join(indexed_fields(model))
+        with connections[using or router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table(model)} "
+                f"USING fts5({columns}, tokenize='{self.tokenizer}')"
+            )
+
+    def match_expression(self, query):
+        """Each word quoted, so nothing a visitor types is read as FTS5 syntax."""
+        terms = search_terms(query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"' for term in terms) + '*'
+
+    # Keeping the index in step
+
+    def index(self, instance, using=None):
+        model = type(instance)
+        fields = indexed_fields(model)
+        values = [getattr(instance, field) or '' for field in fields]
+        with connections[using or router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table(model)} WHERE rowid = %s', [instance.pk])
+            cursor.execute(
+                f"INSERT INTO {self.table(model)} (rowid, {', '.join(fields)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(fields))})",
+                [instance.pk, *values],
+            )
+
+    def remove(self, model, ids, using=None):
+        ids = list(ids)
+        if not ids:
+            return
+        with connections[using or router.db_for_write(model)].cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.table(model)} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids
+            )
+
+    def rebuild(self, model, batch_size=500, using=None):
+        using = using or router.db_for_write(model)
+        fields = indexed_fields(model)
+        self.install(model, using)
+        table = self.table(model)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+
+        indexed, last_pk = 0, 0
+        insert = f"INSERT INTO {table} (rowid, {', '.join(fields)}) VALUES (%s, {', '.join(['%s'] * len(fields))})"
+        while True:
+            # One short transaction per batch keeps the write lock brief
+            rows = list(
+                model._default_manager.using(using).filter(pk__gt=last_pk)
+                .order_by('pk').values_list('pk', *fields)[:batch_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic(using=using), connections[using].cursor() as cursor:
+                cursor.executemany(insert, [[pk, *(value or '' for value in values)] for pk, *values in rows])
+            indexed += len(rows)
+            last_pk = rows[-1][0]
+
+        with connections[using].cursor() as cursor:
+            # Merge the index b-trees written batch by batch
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+        return indexed
+
+    # Searching
+
+    def filter(self, queryset, query):
+        match = self.match_expression(query)
+        if match is None:
+            return queryset.none()
+        table = self.table(queryset.model)
+        return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [match]))
+
+    def search(self, queryset, query, limit=20):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+        model = queryset.model
+        table = self.table(model)
+        # Restrict the index to rows of the queryset (e.g. approved prayers)
+        # inside the same statement, so the limit applies after filtering.
+        inner_sql, inner_params = queryset.order_by().values('pk').query.sql_with_params()
+        sql = (
+            f"SELECT rowid, rank, snippet({table}, -1, %s, %s, %s, %s) FROM {table} "
+            f"WHERE {table} MATCH %s AND rowid IN ({inner_sql}) ORDER BY rank LIMIT %s"
+        )
+        params = [MARK_START, MARK_END, '…', self.snippet_tokens, match, *inner_params, limit]
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        objects = queryset.in_bulk([pk for pk, _, _ in rows])
+        return [SearchHit(objects[pk], rank, highlight(snippet)) for pk, rank, snippet in rows if pk in objects]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """Return the process-wide backend configured by ``SEARCH_BACKEND``."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = {**DEFAULT_SEARCH_BACKEND, **getattr(settings, 'SEARCH_BACKEND', {})}
+                _backend = import_string(config['BACKEND'])(**config['OPTIONS'])
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_search_backend(setting, **kwargs):
+    global _backend
+    if setting == 'SEARCH_BACKEND':
+        _backend = None
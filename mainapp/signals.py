@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from mainapp.api import touch_prayer_counts, touch_prayer_list
+from mainapp.caching import invalidate_prayer_list
+from mainapp.counters import prayer_counts_changed
+from mainapp.events import get_broker, prayer_data
+from mainapp.jobqueue import get_job_queue
+from mainapp.media_processing import process_media
+from mainapp.metrics import MEDIA_UPLOADED, MEDIA_UPLOADS, PRAYERS_SUBMITTED
+from mainapp.models import ContactMessage, MediaFile, PrayerRequest
+from mainapp.notifications import schedule_digest
+from mainapp.search import get_search_backend
+from mainapp.storage import acquire_blob, release_blob, remove_released_files
+
+
+@receiver(post_save, sender=MediaFile)
+def track_media_blob(sender, instance, created, raw=False, **kwargs):
+    """Count references to the stored file so shared uploads outlive their first owner"""
+    if raw:
+        return
+    name = instance.file.name or ''
+    previous = getattr(instance, '_stored_file_name', None) or ''
+    if name == previous:
+        return
+    acquire_blob(name, instance.content_hash, instance.size_bytes)
+    if previous:
+        # Derived files were built from the old file, which nobody may want now
+        release_blob(previous)
+    instance._stored_file_name = name
+
+
+@receiver(post_save, sender=MediaFile)
+def queue_media_processing(sender, instance, created, raw=False, **kwargs):
+    """Build variants/posters off the request path once the upload commits"""
+    if raw or instance.processing_status != MediaFile.PROCESSING_PENDING:
+        return
+    get_job_queue().enqueue_on_commit(process_media, instance.pk)
+
+
+@receiver(post_delete, sender=MediaFile)
+def release_media_blob(sender, instance, **kwargs):
+    """Files go away with the last MediaFile that references them"""
+    name = instance.file.name
+    if not name:
+        return
+    if not release_blob(name, instance.derived_file_names()) and not MediaFile.objects.filter(file=name).exists():
+        # Stored before blobs were tracked and not shared: clean up the same way
+        get_job_queue().enqueue_on_commit(remove_released_files, name, instance.derived_file_names())
+
+
+@receiver(post_save, sender=PrayerRequest)
+def refresh_prayer_list_on_save(sender, instance, raw=False, **kwargs):
+    """A new, edited or (un)approved prayer may change the cached list"""
+    if not raw:
+        invalidate_prayer_list(prayer=instance)
+
+
+@receiver(post_delete, sender=PrayerRequest)
+def refresh_prayer_list_on_delete(sender, instance, **kwargs):
+    invalidate_prayer_list(prayer=instance, deleted=True)
+
+
+@receiver(prayer_counts_changed)
+def refresh_prayer_list_counts(sender, prayer_ids, **kwargs):
+    invalidate_prayer_list(prayer_ids=prayer_ids)
+
+
+@receiver(post_save, sender=PrayerRequest)
+def publish_prayer_saved(sender, instance, created, raw=False, **kwargs):
+    """Show new and edited prayers on open prayer walls; take unapproved ones off"""
+    if raw:
+        return
+    if instance.approved:
+        data = prayer_data(instance)
+        transaction.on_commit(lambda: get_broker().publish('prayer', data))
+    elif not created:
+        transaction.on_commit(lambda: get_broker().publish('delete', {'id': instance.pk}))
+
+
+@receiver(post_delete, sender=PrayerRequest)
+def publish_prayer_deleted(sender, instance, **kwargs):
+    prayer_id = instance.pk
+    transaction.on_commit(lambda: get_broker().publish('delete', {'id': prayer_id}))
+
+
+@receiver(prayer_counts_changed)
+def publish_prayer_counts(sender, prayer_ids, **kwargs):
+    get_broker().counts_changed(prayer_ids)
+
+
+@receiver(prayer_counts_changed)
+def move_api_last_modified(sender, **kwargs):
+    """Counts don't touch updated_at, but API clients polling with If-Modified-Since need new ones"""
+    touch_prayer_counts()
+    touch_prayer_list()
+
+
+@receiver(post_save, sender=PrayerRequest)
+@receiver(post_delete, sender=PrayerRequest)
+def move_api_list_version(sender, raw=False, **kwargs):
+    """Once committed, so a poller can't pair the new version with the old rows"""
+    if not raw:
+        transaction.on_commit(touch_prayer_list)
+
+
+@receiver(post_save, sender=PrayerRequest)
+@receiver(post_save, sender=ContactMessage)
+def update_search_index(sender, instance, raw=False, using=None, **kwargs):
+    """Index writes share the row's transaction, so they can't drift apart"""
+    if not raw:
+        get_search_backend().index(instance, using=using)
+
+
+@receiver(post_delete, sender=PrayerRequest)
+@receiver(post_delete, sender=ContactMessage)
+def remove_from_search_index(sender, instance, using=None, **kwargs):
+    get_search_backend().remove(sender, [instance.pk], using=using)
+
+
+@receiver(post_save, sender=ContactMessage)
+@receiver(post_save, sender=PrayerRequest)
+def schedule_notification_digest(sender, instance, created, raw=False, **kwargs):
+    """New messages, and prayers waiting for approval, go out in the next digest"""
+    if raw or not created or instance.notified_at is not None:
+        return
+    if sender is PrayerRequest and instance.approved:
+        return
+    transaction.on_commit(schedule_digest)
+
+
+@receiver(post_save, sender=PrayerRequest)
+def count_prayer_submission(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        approved = 'true' if instance.approved else 'false'
+        transaction.on_commit(lambda: PRAYERS_SUBMITTED.inc(approved=approved))
+
+
+@receiver(post_save, sender=MediaFile)
+def count_media_upload(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        kind, size = instance.kind or 'other', instance.size_bytes or 0
+
+        def count():
+            MEDIA_UPLOADS.inc(kind=kind)
+            MEDIA_UPLOADED.inc(size, kind=kind)
+
+        transaction.on_commit(count)
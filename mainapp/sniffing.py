@@ -0,0 +1,118 @@
+"""
+Identify uploaded media from its content rather than its filename.
+
+``inspect_file`` reads an upload once, at save time, and returns everything
+the gallery and admin need (kind, MIME type, size, SHA-256 and image
+dimensions) so none of it has to be re-derived per request.
+"""
+import hashlib
+import mimetypes
+
+try:
+    from PIL import Image, UnidentifiedImageError
+except ImportError:  # pragma: no cover - Pillow is an optional dependency
+    Image = None
+
+KIND_IMAGE = 'image'
+KIND_VIDEO = 'video'
+KIND_OTHER = 'other'
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# ISO base media brands (bytes 8-12 of an 'ftyp' box) that are stills
+_IMAGE_BRANDS = {
+    b'avif': 'image/avif', b'avis': 'image/avif',
+    b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heif',
+}
+
+
+def sniff_mime_type(header, filename=''):
+    """
+    Guess a MIME type from the first bytes of a file.
+
+    Falls back to the filename extension for formats without a reliable
+    signature. Returns ``''`` when nothing matches.
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'video/x-msvideo'
+    if header.startswith(b'BM'):
+        return 'image/bmp'
+    if header[4:8] == b'ftyp':
+        brand = header[8:12]
+        if brand in _IMAGE_BRANDS:
+            return _IMAGE_BRANDS[brand]
+        return 'video/quicktime' if brand == b'qt  ' else 'video/mp4'
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm' if b'webm' in header[:64] else 'video/x-matroska'
+    if header.startswith(b'FLV'):
+        return 'video/x-flv'
+    if header.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return 'video/x-ms-wmv'
+    return mimetypes.guess_type(filename)[0] or ''
+
+
+def kind_for_mime_type(mime_type):
+    major = mime_type.split('/', 1)[0]
+    if major == 'image':
+        return KIND_IMAGE
+    if major == 'video':
+        return KIND_VIDEO
+    return KIND_OTHER
+
+
+def image_dimensions(fh):
+    """Width and height from the image header, without decoding pixels."""
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(fh) as image:
+            return image.size
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        return None, None
+
+
+def inspect_file(fh, filename=''):
+    """
+    Describe an open binary file.
+
+    Returns a dict with ``kind``, ``mime_type``, ``size_bytes``,
+    ``content_hash`` (SHA-256 hex) and, for images, ``width``/``height``.
+    The file position is restored to the start afterwards.
+    """
+    fh.seek(0)
+    header = fh.read(64)
+    mime_type = sniff_mime_type(header, filename)
+    kind = kind_for_mime_type(mime_type)
+
+    fh.seek(0)
+    digest = hashlib.sha256()
+    size = 0
+    for block in iter(lambda: fh.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+        size += len(block)
+
+    info = {
+        'kind': kind,
+        'mime_type': mime_type,
+        'size_bytes': size,
+        'content_hash': digest.hexdigest(),
+    }
+    if kind == KIND_IMAGE:
+        fh.seek(0)
+        info['width'], info['height'] = image_dimensions(fh)
+    fh.seek(0)
+    return info
+
+
+def describe_by_name(filename):
+    """Best effort for files that can't be read: go by the extension."""
+    mime_type = mimetypes.guess_type(filename)[0] or ''
+    return {'kind': kind_for_mime_type(mime_type), 'mime_type': mime_type}
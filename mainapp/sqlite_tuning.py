@@ -0,0 +1,84 @@
+"""
+SQLite settings applied to every new database connection.
+
+Out of the box SQLite uses a rollback journal, so a writer blocks every
+reader and concurrent prayer submissions quickly run into "database is
+locked". Each connection Django opens runs the ``SQLITE_PRAGMAS`` profile:
+
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',      # readers and the writer don't block each other
+        'synchronous': 'NORMAL',    # fsync at checkpoints only; safe with WAL
+        'busy_timeout': 20000,      # ms to wait for the write lock
+        'mmap_size': 134217728,     # read pages through the OS cache
+        'cache_size': -32000,       # KiB of page cache per connection
+        'temp_store': 'MEMORY',
+    }
+
+Set it to ``{}`` to leave SQLite's defaults alone. The rest of the profile
+lives in ``DATABASES``: ``transaction_mode: IMMEDIATE`` (writers queue for
+the lock up front instead of failing on upgrade) and ``CONN_MAX_AGE`` /
+``CONN_HEALTH_CHECKS`` so the pragmas are paid once per connection, not
+once per request.
+"""
+import re
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
+}
+
+_NAME = re.compile(r'^[a-z_]+$')
+_VALUE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    return getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+
+
+def pragma_statements(pragmas):
+    """``PRAGMA`` statements for a profile, refusing anything but plain names and values."""
+    statements = []
+    for name, value in pragmas.items():
+        value = str(value)
+        if not _NAME.match(name) or not _VALUE.match(value):
+            raise ValueError(f'Invalid SQLite pragma: {name}={value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def is_in_memory(connection):
+    name = str(connection.settings_dict.get('NAME') or '')
+    return name in ('', ':memory:') or 'mode=memory' in name
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(sqlite_pragmas())
+    if is_in_memory(connection):
+        pragmas.pop('journal_mode', None)  # WAL needs a file
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+
+
+def current_pragmas(connection, names=None):
+    """Read back the effective values, e.g. to verify a deployment."""
+    with connection.cursor() as cursor:
+        values = {}
+        for name in names or sqlite_pragmas():
+            if not _NAME.match(name):
+                raise ValueError(f'Invalid SQLite pragma: {name}')
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            values[name] = row[0] if row else None
+        return values
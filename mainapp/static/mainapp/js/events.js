@@ -0,0 +1,380 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Event card animations
+    const eventCards = document.querySelectorAll('.event-card, .featured-event-card, .regular-event-card');
+
+    const observer = new IntersectionObserver((entries) => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                entry.target.style.opacity = 1;
+                entry.target.style.transform = 'translateY(0)';
+            }
+        });
+    }, { threshold: 0.1 });
+
+    eventCards.forEach(card => {
+        card.style.opacity = 0;
+        card.style.transform = 'translateY(20px)';
+        card.style.transition = 'opacity 0.5s, transform 0.5s';
+        observer.observe(card);
+    });
+
+    // Add to calendar functionality (basic example)
+    document.querySelectorAll('.btn-primary').forEach(button => {
+        if (button.textContent.includes('Calendar')) {
+            button.addEventListener('click', function() {
+                alert('Event added to your calendar!');
+            });
+        }
+    });
+
+    // Share event functionality (basic example)
+    document.querySelectorAll('.btn-outline-primary').forEach(button => {
+        if (button.textContent.includes('Share')) {
+            button.addEventListener('click', function() {
+                alert('Event shared!');
+            });
+        }
+    });
+
+    // Calendar functionality
+    const calendarDays = document.getElementById('calendar-days');
+    const currentMonthYear = document.getElementById('current-month-year');
+    const prevMonthBtn = document.getElementById('prev-month');
+    const nextMonthBtn = document.getElementById('next-month');
+
+    // Set current date to today's date
+    let currentDate = new Date();
+
+    // Function to generate recurring weekly events for a given month
+    function generateRecurringEvents(year, month) {
+        const recurringEvents = [];
+
+        // Get the first and last day of the month
+        const firstDay = new Date(year, month, 1);
+        const lastDay = new Date(year, month + 1, 0);
+
+        // Generate Saturday Mass events (every Saturday)
+        for (let day = 1; day <= lastDay.getDate(); day++) {
+            const date = new Date(year, month, day);
+            if (date.getDay() === 6) { // Saturday (6)
+                recurringEvents.push({
+                    date: new Date(date),
+                    title: 'Saturday Holy Mass',
+                    time: '7:00 AM',
+                    location: 'Cathedral Main Hall',
+                    description: 'Weekly Saturday morning mass for spiritual nourishment and community gathering.',
+                    isRecurring: true
+                });
+            }
+        }
+
+        // Generate Sunday events (Sunday Mass and Sunday School)
+        for (let day = 1; day <= lastDay.getDate(); day++) {
+            const date = new Date(year, month, day);
+            if (date.getDay() === 0) { // Sunday (0)
+                // Sunday Mass
+                recurringEvents.push({
+                    date: new Date(date),
+                    title: 'Sunday Holy Mass',
+                    time: '7:45 AM',
+                    location: 'Cathedral Main Hall',
+                    description: 'Main Sunday service with holy communion, hymns, and sermon.',
+                    isRecurring: true
+                });
+
+                // Sunday School (after mass)
+                recurringEvents.push({
+                    date: new Date(date),
+                    title: 'Sunday School',
+                    time: '9:00 AM - 10:30 AM',
+                    location: 'Education Building',
+                    description: 'Weekly Sunday school classes for children and youth following the morning mass.',
+                    isRecurring: true
+                });
+            }
+        }
+
+        return recurringEvents;
+    }
+
+    // Define special events data
+    const specialEvents = [
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth(), 15),
+            title: 'Youth Group Meeting',
+            time: '4:00 PM - 6:00 PM',
+            location: 'Youth Hall',
+            description: 'Monthly gathering for our youth community with activities, discussions, and prayer.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth(), 20),
+            title: 'Charity Drive',
+            time: '9:00 AM - 12:00 PM',
+            location: 'Cathedral Grounds',
+            description: 'Annual charity event to collect gifts and essentials for families in need within our community.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth(), 23),
+            title: 'Festival of Carols',
+            time: '7:00 PM - 9:00 PM',
+            location: 'Main Hall',
+            description: 'Special evening of Christmas carols performed by our cathedral choir and community members.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth() + 1, 10),
+            title: 'Community Service Day',
+            time: '8:00 AM - 12:00 PM',
+            location: 'Cathedral & Surrounding Area',
+            description: 'Join us for a day of community service and outreach activities.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth() + 1, 15),
+            title: 'Bible Study Workshop',
+            time: '2:00 PM - 4:00 PM',
+            location: 'Conference Room',
+            description: 'Special workshop focusing on biblical teachings and discussions.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth(), currentDate.getDate() + 14),
+            title: 'Elders Meeting',
+            time: '3:00 PM - 5:00 PM',
+            location: 'Conference Room',
+            description: 'Monthly meeting for church elders and leadership.'
+        },
+        {
+            date: new Date(currentDate.getFullYear(), currentDate.getMonth(), currentDate.getDate() + 21),
+            title: 'Community Potluck',
+            time: '6:00 PM - 8:00 PM',
+            location: 'Fellowship Hall',
+            description: 'Monthly community potluck dinner. Bring a dish to share!'
+        }
+    ];
+
+    // Function to get all events for a specific month
+    function getEventsForMonth(year, month) {
+        const recurringEvents = generateRecurringEvents(year, month);
+        const allEvents = [...recurringEvents, ...specialEvents];
+
+        // Filter special events to only include those in the current month
+        const filteredSpecialEvents = specialEvents.filter(event =>
+            event.date.getFullYear() === year && event.date.getMonth() === month
+        );
+
+        return [...recurringEvents, ...filteredSpecialEvents];
+    }
+
+    // Function to generate calendar
+    function generateCalendar() {
+        // Clear previous calendar
+        calendarDays.innerHTML = '';
+
+        // Set month and year header
+        const monthNames = [
+            'January', 'February', 'March', 'April', 'May', 'June',
+            'July', 'August', 'September', 'October', 'November', 'December'
+        ];
+        currentMonthYear.textContent = `${monthNames[currentDate.getMonth()]} ${currentDate.getFullYear()}`;
+
+        // Get events for current month
+        const currentMonthEvents = getEventsForMonth(currentDate.getFullYear(), currentDate.getMonth());
+
+        // Get first day of month and number of days
+        const firstDay = new Date(currentDate.getFullYear(), currentDate.getMonth(), 1);
+        const lastDay = new Date(currentDate.getFullYear(), currentDate.getMonth() + 1, 0);
+        const daysInMonth = lastDay.getDate();
+        const startingDay = firstDay.getDay(); // 0 = Sunday, 1 = Monday, etc.
+
+        // Get previous month's days to fill the first week
+        const prevMonthLastDay = new Date(currentDate.getFullYear(), currentDate.getMonth(), 0).getDate();
+
+        let calendarHTML = '';
+        let dayCount = 1;
+        let nextMonthDayCount = 1;
+
+        // Create calendar rows
+        for (let i = 0; i < 6; i++) {
+            calendarHTML += '<tr>';
+
+            for (let j = 0; j < 7; j++) {
+                if (i === 0 && j < startingDay) {
+                    // Previous month's days
+                    const day = prevMonthLastDay - startingDay + j + 1;
+                    calendarHTML += `<td class="other-month">${day}</td>`;
+                } else if (dayCount > daysInMonth) {
+                    // Next month's days
+                    calendarHTML += `<td class="other-month">${nextMonthDayCount}</td>`;
+                    nextMonthDayCount++;
+                } else {
+                    // Current month's days
+                    const dayDate = new Date(currentDate.getFullYear(), currentDate.getMonth(), dayCount);
+                    const today = new Date();
+                    const isToday = dayDate.toDateString() === today.toDateString();
+
+                    // Check if this day has events
+                    const dayEvents = currentMonthEvents.filter(event =>
+                        event.date.toDateString() === dayDate.toDateString()
+                    );
+
+                    const hasEvents = dayEvents.length > 0;
+                    const todayClass = isToday ? 'today' : '';
+                    const eventClass = hasEvents ? 'has-event' : '';
+
+                    calendarHTML += `<td class="${todayClass} ${eventClass}" data-date="${dayDate.toISOString().split('T')[0]}">`;
+                    calendarHTML += `<div>${dayCount}</div>`;
+
+                    if (hasEvents) {
+                        // Show abbreviated event names for recurring events
+                        dayEvents.forEach(event => {
+                            let eventText = event.title;
+                            if (event.isRecurring) {
+                                // Shorten recurring event names for better display
+                                if (event.title.includes('Saturday')) {
+                                    eventText = 'Sat Mass: 7AM';
+                                } else if (event.title.includes('Sunday Holy Mass')) {
+                                    eventText = 'Sun Mass: 7:45AM';
+                                } else if (event.title.includes('Sunday School')) {
+                                    eventText = 'Sunday School';
+                                }
+                            }
+                            calendarHTML += `<small class="event-indicator d-block">${eventText}</small>`;
+                        });
+                    }
+
+                    calendarHTML += '</td>';
+                    dayCount++;
+                }
+            }
+
+            calendarHTML += '</tr>';
+
+            // Stop if we've displayed all days
+            if (dayCount > daysInMonth && nextMonthDayCount > 7) {
+                break;
+            }
+        }
+
+        calendarDays.innerHTML = calendarHTML;
+
+        // Add click event listeners to all calendar days
+        document.querySelectorAll('.calendar-body td').forEach(day => {
+            day.addEventListener('click', function() {
+                const dateStr = this.getAttribute('data-date');
+                if (dateStr) {
+                    const date = new Date(dateStr);
+
+                    // Get events for the clicked date (including recurring events for that month)
+                    const monthEvents = getEventsForMonth(date.getFullYear(), date.getMonth());
+                    const dayEvents = monthEvents.filter(event =>
+                        event.date.toDateString() === date.toDateString()
+                    );
+
+                    if (dayEvents.length > 0) {
+                        // Show all events for this date in modal
+                        showEventModal(dayEvents, date);
+                    } else {
+                        // Show message for no events
+                        showNoEventsModal(date);
+                    }
+                }
+            });
+        });
+    }
+
+    // Function to show event details in modal
+    function showEventModal(events, date) {
+        const modalTitle = document.getElementById('modal-event-title');
+        const modalDate = document.getElementById('modal-event-date');
+        const modalTime = document.getElementById('modal-event-time');
+        const modalLocation = document.getElementById('modal-event-location');
+        const modalDescription = document.getElementById('modal-event-description');
+
+        // Clear previous content
+        modalTitle.innerHTML = '';
+        modalTime.innerHTML = '';
+        modalLocation.innerHTML = '';
+        modalDescription.innerHTML = '';
+
+        // Set date
+        modalDate.textContent = date.toLocaleDateString('en-US', {
+            weekday: 'long',
+            year: 'numeric',
+            month: 'long',
+            day: 'numeric'
+        });
+
+        if (events.length === 1) {
+            // Single event
+            const event = events[0];
+            modalTitle.textContent = event.title;
+            modalTime.textContent = event.time;
+            modalLocation.textContent = event.location;
+            modalDescription.textContent = event.description;
+        } else {
+            // Multiple events
+            modalTitle.textContent = `${events.length} Events on ${date.toLocaleDateString('en-US', { month: 'long', day: 'numeric' })}`;
+
+            events.forEach((event, index) => {
+                const eventDiv = document.createElement('div');
+                eventDiv.className = 'mb-3 pb-2 border-bottom';
+
+                // Add recurring badge for recurring events
+                const recurringBadge = event.isRecurring ? '<span class="badge bg-info me-2">Weekly</span>' : '';
+
+                eventDiv.innerHTML = `
+                    <h6 class="mb-1">${recurringBadge}${event.title}</h6>
+                    <p class="mb-1"><small><i class="far fa-clock me-1"></i>${event.time}</small></p>
+                    <p class="mb-1"><small><i class="fas fa-map-marker-alt me-1"></i>${event.location}</small></p>
+                    <p class="mb-0"><small>${event.description}</small></p>
+                `;
+                modalDescription.appendChild(eventDiv);
+            });
+        }
+
+        // Show the modal
+        const eventModal = new bootstrap.Modal(document.getElementById('eventModal'));
+        eventModal.show();
+    }
+
+    // Function to show message for dates with no events
+    function showNoEventsModal(date) {
+        const modalTitle = document.getElementById('modal-event-title');
+        const modalDate = document.getElementById('modal-event-date');
+        const modalTime = document.getElementById('modal-event-time');
+        const modalLocation = document.getElementById('modal-event-location');
+        const modalDescription = document.getElementById('modal-event-description');
+
+        // Clear previous content
+        modalTitle.innerHTML = '';
+        modalTime.innerHTML = '';
+        modalLocation.innerHTML = '';
+        modalDescription.innerHTML = '';
+
+        // Set content for no events
+        modalTitle.textContent = 'No Events Scheduled';
+        modalDate.textContent = date.toLocaleDateString('en-US', {
+            weekday: 'long',
+            year: 'numeric',
+            month: 'long',
+            day: 'numeric'
+        });
+        modalDescription.textContent = 'There are no special events scheduled for this date. Regular weekly services may still be available.';
+
+        // Show the modal
+        const eventModal = new bootstrap.Modal(document.getElementById('eventModal'));
+        eventModal.show();
+    }
+
+    // Event listeners for month navigation
+    prevMonthBtn.addEventListener('click', function() {
+        currentDate.setMonth(currentDate.getMonth() - 1);
+        generateCalendar();
+    });
+
+    nextMonthBtn.addEventListener('click', function() {
+        currentDate.setMonth(currentDate.getMonth() + 1);
+        generateCalendar();
+    });
+
+    // Initialize calendar with current date
+    generateCalendar();
+});
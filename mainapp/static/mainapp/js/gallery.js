@@ -0,0 +1,453 @@
+    const deleteUrlTemplate = document.getElementById('galleryGrid').dataset.deleteUrl.replace('/0/', '/');
+// File preview functionality
+function previewFile() {
+    const previewContainer = document.getElementById('previewContainer');
+    const filePreview = document.getElementById('filePreview');
+    const fileInput = document.getElementById('fileInput');
+    const file = fileInput.files[0];
+
+    filePreview.innerHTML = '';
+    previewContainer.style.display = 'none';
+
+    if (file) {
+        previewContainer.style.display = 'block';
+
+        if (file.type.startsWith('image/')) {
+            const reader = new FileReader();
+            reader.onload = function(e) {
+                const img = document.createElement('img');
+                img.src = e.target.result;
+                img.alt = 'File preview';
+                filePreview.appendChild(img);
+            };
+            reader.readAsDataURL(file);
+        } else if (file.type.startsWith('video/')) {
+            const video = document.createElement('video');
+            video.controls = true;
+            video.src = URL.createObjectURL(file);
+            video.style.maxWidth = '100%';
+            filePreview.appendChild(video);
+        }
+    }
+}
+
+// DOM Content Loaded Event
+document.addEventListener('DOMContentLoaded', function() {
+    // Gallery pages: the filter and infinite scroll both load keyset pages
+    // from the server, which filters on the indexed kind column
+    const galleryGrid = document.getElementById('galleryGrid');
+    const sentinel = document.getElementById('gallerySentinel');
+    let loadingPage = false;
+
+    function loadGalleryPage(reset) {
+        if (!galleryGrid || !sentinel || loadingPage || (!reset && !sentinel.dataset.cursor)) {
+            return;
+        }
+        loadingPage = true;
+        const params = new URLSearchParams();
+        if (sentinel.dataset.kind) {
+            params.set('kind', sentinel.dataset.kind);
+        }
+        if (!reset) {
+            params.set('cursor', sentinel.dataset.cursor);
+        }
+        fetch(`${sentinel.dataset.url}?${params}`, {headers: {'X-Requested-With': 'XMLHttpRequest'}})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to load media');
+                }
+                return response.json();
+            })
+            .then(data => {
+                if (reset) {
+                    galleryGrid.innerHTML = data.count ? data.html : `
+                        <div class="col-12">
+                            <div class="empty-gallery">
+                                <i class="fas fa-images fa-3x mb-3"></i>
+                                <h5>Nothing here yet</h5>
+                            </div>
+                        </div>
+                    `;
+                } else {
+                    galleryGrid.insertAdjacentHTML('beforeend', data.html);
+                }
+                sentinel.dataset.cursor = data.next_cursor || '';
+                sentinel.style.display = data.next_cursor ? '' : 'none';
+            })
+            .catch(error => {
+                console.error('Error:', error);
+            })
+            .finally(() => {
+                loadingPage = false;
+            });
+    }
+
+    document.querySelectorAll('[data-filter]').forEach(button => {
+        button.addEventListener('click', function(e) {
+            e.preventDefault();
+            const filter = this.getAttribute('data-filter');
+
+            // Update active button
+            document.querySelectorAll('[data-filter]').forEach(btn => {
+                btn.classList.remove('active');
+            });
+            this.classList.add('active');
+
+            sentinel.dataset.kind = filter === 'all' ? '' : filter;
+            history.replaceState(null, '', this.getAttribute('href'));
+            loadGalleryPage(true);
+        });
+    });
+
+    if (sentinel && 'IntersectionObserver' in window) {
+        new IntersectionObserver(entries => {
+            if (entries[0].isIntersecting) {
+                loadGalleryPage(false);
+            }
+        }, {rootMargin: '400px'}).observe(sentinel);
+    }
+
+    // Delete functionality - Fixed
+    let deleteMediaId = null;
+    let deleteModal = null;
+
+    // Initialize delete modal
+    const deleteModalElement = document.getElementById('deleteModal');
+    if (deleteModalElement) {
+        deleteModal = new bootstrap.Modal(deleteModalElement);
+    }
+
+    // Attach delete button listeners using event delegation
+    document.addEventListener('click', function(e) {
+        // Handle delete button clicks
+        if (e.target.matches('.delete-btn') || e.target.closest('.delete-btn')) {
+            e.preventDefault();
+            const button = e.target.matches('.delete-btn') ? e.target : e.target.closest('.delete-btn');
+
+            if (button) {
+                deleteMediaId = button.getAttribute('data-id');
+                const fileName = button.getAttribute('data-filename');
+
+                const deleteFileNameElement = document.getElementById('deleteFileName');
+                if (deleteFileNameElement && fileName) {
+                    deleteFileNameElement.textContent = `File: ${fileName}`;
+                }
+
+                if (deleteModal) {
+                    deleteModal.show();
+                }
+            }
+        }
+
+        // Handle view button clicks
+        if (e.target.matches('.view-btn') || e.target.closest('.view-btn')) {
+            e.preventDefault();
+            const button = e.target.matches('.view-btn') ? e.target : e.target.closest('.view-btn');
+
+            if (button) {
+                const url = button.getAttribute('data-url');
+
+                const modalImage = document.getElementById('modalImage');
+                const modalVideo = document.getElementById('modalVideo');
+
+                if (modalImage && modalVideo) {
+                    // Reset modal content
+                    modalImage.style.display = 'none';
+                    modalVideo.style.display = 'none';
+                    modalVideo.pause();
+
+                    const kind = button.getAttribute('data-kind');
+                    if (url && (kind === 'video' || (!kind && url.toLowerCase().endsWith('.mp4')))) {
+                        modalVideo.style.display = 'block';
+                        modalVideo.src = url;
+                    } else if (url) {
+                        modalImage.style.display = 'block';
+                        modalImage.src = url;
+                    }
+
+                    const mediaModalElement = document.getElementById('mediaModal');
+                    if (mediaModalElement) {
+                        const modal = new bootstrap.Modal(mediaModalElement);
+                        modal.show();
+                    }
+                }
+            }
+        }
+    });
+
+   const confirmDeleteBtn = document.getElementById('confirmDelete');
+        if (confirmDeleteBtn) {
+            confirmDeleteBtn.addEventListener('click', function() {
+                if (deleteMediaId) {
+                    // Send AJAX request to delete the media - FIXED URL
+                    fetch(`/delete-gallery-media/${deleteMediaId}/`, {
+    method: 'DELETE',
+    headers: {
+        'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+        'Content-Type': 'application/json',
+    },
+})
+                    .then(response => {
+                        if (response.ok) {
+                            return response.json();
+                        } else {
+                            throw new Error('Failed to delete media');
+                        }
+                    })
+                    .then(data => {
+                        // Find and remove the gallery item
+                        const deleteButton = document.querySelector(`.delete-btn[data-id="${deleteMediaId}"]`);
+                        if (deleteButton) {
+                            const galleryItem = deleteButton.closest('.gallery-item');
+                            if (galleryItem) {
+                                galleryItem.style.transition = 'all 0.5s ease';
+                                galleryItem.style.opacity = '0';
+                                galleryItem.style.transform = 'scale(0.8)';
+
+                                setTimeout(() => {
+                                    galleryItem.remove();
+
+                                    // Check if gallery is empty after deletion
+                                    const remainingItems = document.querySelectorAll('.gallery-item');
+                                    if (remainingItems.length === 0) {
+                                        const galleryGrid = document.getElementById('galleryGrid');
+                                        if (galleryGrid) {
+                                            galleryGrid.innerHTML = `
+                                                <div class="col-12">
+                                                    <div class="empty-gallery">
+                                                        <i class="fas fa-images fa-3x mb-3"></i>
+                                                        <h5>No media uploaded yet</h5>
+                                                        <p>Be the first to share a beautiful moment from our parish community</p>
+                                                    </div>
+                                                </div>
+                                            `;
+                                        }
+                                    }
+                                }, 500);
+                            }
+                        }
+
+                        showMessage('Media deleted successfully!', 'success');
+                    })
+                    .catch(error => {
+                        console.error('Error:', error);
+                        showMessage('Failed to delete media. Please try again.', 'error');
+                    })
+                    .finally(() => {
+                        // Close the modal properly
+                        if (deleteModal) {
+                            deleteModal.hide();
+                        }
+                        deleteMediaId = null;
+                    });
+                }
+            });
+        }
+
+    // Form submission handling
+    const uploadForm = document.getElementById('uploadForm');
+    if (uploadForm) {
+        uploadForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+
+            const fileInput = document.getElementById('fileInput');
+            const file = fileInput.files[0];
+
+            if (!file) {
+                showMessage('Please select a file to upload.', 'error');
+                return;
+            }
+
+            // Check file size against the server's upload limit
+            const maxSize = parseInt(this.dataset.maxSize, 10);
+            if (maxSize && file.size > maxSize) {
+                showMessage('This file is too large to upload.', 'error');
+                return;
+            }
+
+            // Check file type
+            const allowedTypes = ['image/jpeg', 'image/jpg', 'image/png', 'video/mp4'];
+            if (!allowedTypes.includes(file.type)) {
+                showMessage('Only JPG, PNG, and MP4 files are allowed.', 'error');
+                return;
+            }
+
+            // Show loading message
+            const submitBtn = this.querySelector('button[type="submit"]');
+            const originalText = submitBtn.innerHTML;
+            submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Uploading...';
+            submitBtn.disabled = true;
+
+            // Large files go through the resumable chunked upload API
+            const chunkSize = parseInt(this.dataset.chunkSize, 10);
+            if (chunkSize && file.size > chunkSize) {
+                chunkedUpload(file, this.dataset.chunkedUrl, chunkSize, fraction => {
+                    submitBtn.innerHTML = `<i class="fas fa-spinner fa-spin me-2"></i>Uploading... ${Math.floor(fraction * 100)}%`;
+                })
+                .then(() => {
+                    showMessage('File uploaded successfully!', 'success');
+                    this.reset();
+                    setTimeout(() => {
+                        window.location.reload();
+                    }, 1500);
+                })
+                .catch(error => {
+                    console.error('Upload error:', error);
+                    showMessage(`${error.message} You can select the same file again to resume.`, 'error');
+                })
+                .finally(() => {
+                    submitBtn.innerHTML = originalText;
+                    submitBtn.disabled = false;
+                });
+                return;
+            }
+
+            // Create FormData and submit to server
+            const formData = new FormData(this);
+
+            fetch(this.action || window.location.pathname, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                }
+            })
+            .then(response => {
+                if (response.ok) {
+                    showMessage('File uploaded successfully!', 'success');
+                    this.reset();
+                    const previewContainer = document.getElementById('previewContainer');
+                    if (previewContainer) {
+                        previewContainer.style.display = 'none';
+                    }
+                    // Reload page to show new media
+                    setTimeout(() => {
+                        window.location.reload();
+                    }, 1500);
+                } else {
+                    response.json().then(data => {
+                        showMessage(data.error || 'Failed to upload file. Please try again.', 'error');
+                    }).catch(() => {
+                        showMessage('Failed to upload file. Please try again.', 'error');
+                    });
+                }
+            })
+            .catch(error => {
+                console.error('Upload error:', error);
+                showMessage('An error occurred while uploading.', 'error');
+            })
+            .finally(() => {
+                // Reset button
+                submitBtn.innerHTML = originalText;
+                submitBtn.disabled = false;
+            });
+        });
+    }
+
+    // Initialize entrance animations
+    document.querySelectorAll('.gallery-item').forEach((item, index) => {
+        item.style.opacity = '0';
+        item.style.transform = 'translateY(20px)';
+
+        setTimeout(() => {
+            item.style.transition = 'all 0.6s ease';
+            item.style.opacity = '1';
+            item.style.transform = 'translateY(0)';
+        }, index * 100);
+    });
+});
+
+// Resumable chunked upload; the session id is remembered so a retry of the
+// same file continues from the last byte the server acknowledged.
+async function chunkedUpload(file, createUrl, chunkSize, onProgress) {
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+    const resumeKey = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        const response = await fetch(`${createUrl}${savedId}/`);
+        if (response.ok) {
+            upload = await response.json();
+            if (upload.status !== 'uploading') {
+                upload = null;
+            }
+        }
+    }
+
+    if (!upload) {
+        const response = await fetch(createUrl, {
+            method: 'POST',
+            headers: {'X-CSRFToken': csrfToken, 'Content-Type': 'application/json'},
+            body: JSON.stringify({filename: file.name, size: file.size}),
+        });
+        upload = await response.json();
+        if (!response.ok) {
+            throw new Error(upload.error || 'Could not start the upload.');
+        }
+        localStorage.setItem(resumeKey, upload.id);
+    }
+
+    let offset = upload.offset;
+    while (offset < file.size) {
+        const response = await fetch(`${createUrl}${upload.id}/`, {
+            method: 'PUT',
+            headers: {
+                'X-CSRFToken': csrfToken,
+                'Upload-Offset': String(offset),
+                'Content-Type': 'application/octet-stream',
+            },
+            body: file.slice(offset, offset + chunkSize),
+        });
+        const data = await response.json();
+        // 409 means the server is at a different offset; continue from there
+        if ((!response.ok && response.status !== 409) || data.status !== 'uploading') {
+            throw new Error(data.error || 'Upload failed.');
+        }
+        offset = data.offset;
+        onProgress(offset / file.size);
+    }
+
+    const response = await fetch(`${createUrl}${upload.id}/complete/`, {
+        method: 'POST',
+        headers: {'X-CSRFToken': csrfToken},
+    });
+    const data = await response.json();
+    localStorage.removeItem(resumeKey);
+    if (!response.ok) {
+        throw new Error(data.error || 'Upload could not be completed.');
+    }
+    return data;
+}
+
+// Message display function
+function showMessage(message, type) {
+    // Remove any existing alerts first
+    document.querySelectorAll('.alert.position-fixed').forEach(alert => {
+        alert.remove();
+    });
+
+    // Create and show a toast message
+    const alertClass = type === 'success' ? 'alert-success' : 'alert-danger';
+    const iconClass = type === 'success' ? 'fas fa-check-circle' : 'fas fa-exclamation-circle';
+
+    const alertHtml = `
+        <div class="alert ${alertClass} alert-dismissible fade show position-fixed"
+             style="top: 100px; right: 20px; z-index: 9999; min-width: 300px;">
+            <i class="${iconClass} me-2"></i>${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert" aria-label="Close"></button>
+        </div>
+    `;
+
+    document.body.insertAdjacentHTML('beforeend', alertHtml);
+
+    // Auto-remove after 5 seconds
+    setTimeout(() => {
+        const alerts = document.querySelectorAll('.alert.position-fixed');
+        alerts.forEach(alert => {
+            if (alert.querySelector('button.btn-close')) {
+                alert.remove();
+            }
+        });
+    }, 5000);
+}
@@ -0,0 +1,23 @@
+// Navbar scroll effect
+window.addEventListener('scroll', function() {
+    const navbar = document.querySelector('.navbar');
+    if (window.scrollY > 50) {
+        navbar.classList.add('navbar-scrolled');
+    } else {
+        navbar.classList.remove('navbar-scrolled');
+    }
+});
+
+// Animation on scroll with traditional timing
+document.addEventListener('DOMContentLoaded', function() {
+    const featureCards = document.querySelectorAll('.feature-card');
+    featureCards.forEach((card, index) => {
+        card.style.animationDelay = `${index * 0.3}s`;
+    });
+
+    // Add subtle animation effects for traditional feel
+    const socialIcons = document.querySelectorAll('.social-icons a');
+    socialIcons.forEach((icon, index) => {
+        icon.style.animationDelay = `${index * 0.1}s`;
+    });
+});
@@ -0,0 +1,10 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // "Select all" toggles every prayer checkbox on the current page
+    const selectAll = document.getElementById('selectAll');
+    if (!selectAll) return;
+
+    const boxes = document.querySelectorAll('#moderationForm input[name="ids"]');
+    selectAll.addEventListener('change', function() {
+        boxes.forEach(box => { box.checked = selectAll.checked; });
+    });
+});
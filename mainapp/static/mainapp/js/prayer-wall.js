@@ -0,0 +1,114 @@
+// Live prayer wall: new prayers, counts and deletions arrive as
+// Server-Sent Events, so nobody has to reload to see them.
+(function() {
+    const section = document.getElementById('prayer-section');
+    if (!section || !section.dataset.eventsUrl || !window.EventSource) {
+        return;
+    }
+
+    const wall = window.prayerWall = { live: false };
+    const source = new EventSource(section.dataset.eventsUrl);
+    source.addEventListener('open', () => { wall.live = true; });
+    source.addEventListener('error', () => { wall.live = false; });
+
+    function findItem(prayerId) {
+        return section.querySelector(`.prayer-item[data-prayer-id="${prayerId}"]`);
+    }
+
+    function prayLabel(count) {
+        return count > 0 ? `Pray (${count})` : 'Pray';
+    }
+
+    function element(tag, className, text) {
+        const el = document.createElement(tag);
+        el.className = className;
+        if (text !== undefined) {
+            el.textContent = text;
+        }
+        return el;
+    }
+
+    function buildItem(prayer) {
+        const item = element('div', 'prayer-item');
+        item.dataset.prayerId = prayer.id;
+
+        const content = element('div', 'prayer-content');
+        content.appendChild(element('p', 'prayer-message', `"${prayer.message}"`));
+        const meta = element('div', 'prayer-meta');
+        meta.appendChild(element('span', 'prayer-name', prayer.name));
+        meta.appendChild(element('span', 'prayer-date', prayer.submitted_at));
+        content.appendChild(meta);
+
+        const actions = element('div', 'prayer-actions');
+        const pray = element('button', 'btn-pray');
+        pray.dataset.prayerId = prayer.id;
+        pray.appendChild(element('i', 'fas fa-pray'));
+        pray.appendChild(document.createTextNode(' '));
+        pray.appendChild(element('span', 'pray-count', prayLabel(prayer.prayer_count)));
+        const remove = element('button', 'btn-delete-prayer');
+        remove.dataset.prayerId = prayer.id;
+        remove.title = 'Delete Prayer';
+        remove.appendChild(element('i', 'fas fa-trash'));
+        actions.appendChild(pray);
+        actions.appendChild(remove);
+
+        item.appendChild(content);
+        item.appendChild(actions);
+        return item;
+    }
+
+    function prayerList() {
+        let list = section.querySelector('.prayer-requests-list');
+        if (!list) {
+            const body = section.querySelector('.prayer-requests-card .card-body');
+            if (!body) {
+                return null;
+            }
+            body.innerHTML = '';
+            list = element('div', 'prayer-requests-list');
+            body.appendChild(list);
+        }
+        return list;
+    }
+
+    source.addEventListener('prayer', event => {
+        const prayer = JSON.parse(event.data);
+        const existing = findItem(prayer.id);
+        if (existing) {
+            existing.querySelector('.prayer-message').textContent = `"${prayer.message}"`;
+            existing.querySelector('.prayer-name').textContent = prayer.name;
+            existing.querySelector('.pray-count').textContent = prayLabel(prayer.prayer_count);
+            return;
+        }
+        const list = prayerList();
+        if (!list) {
+            return;
+        }
+        list.insertBefore(buildItem(prayer), list.firstChild);
+        const card = section.querySelector('.prayer-requests-card');
+        const size = parseInt(card && card.dataset.listSize, 10);
+        while (size && list.children.length > size) {
+            list.lastElementChild.remove();
+        }
+        updatePrayerCount();
+    });
+
+    source.addEventListener('count', event => {
+        const data = JSON.parse(event.data);
+        const item = findItem(data.id);
+        if (item) {
+            item.querySelector('.pray-count').textContent = prayLabel(data.prayer_count);
+        }
+    });
+
+    source.addEventListener('delete', event => {
+        const item = findItem(JSON.parse(event.data).id);
+        if (item) {
+            item.remove();
+            updatePrayerCount();
+        }
+    });
+
+    // We missed events the server no longer has
+    source.addEventListener('reset', () => window.location.reload());
+})();
@@ -0,0 +1,264 @@
+    // Add animation to prayer items when they come into view
+    document.addEventListener('DOMContentLoaded', function() {
+        const prayerItems = document.querySelectorAll('.prayer-item');
+
+        const observer = new IntersectionObserver((entries) => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    entry.target.style.opacity = '1';
+                    entry.target.style.transform = 'translateY(0)';
+                }
+            });
+        }, { threshold: 0.1 });
+
+        prayerItems.forEach(item => {
+            item.style.opacity = '0';
+            item.style.transform = 'translateY(20px)';
+            item.style.transition = 'opacity 0.5s, transform 0.5s';
+            observer.observe(item);
+        });
+
+        // Prayer counter functionality
+        // Replace the existing pray button functionality
+// Delegated, so prayers added live by prayer-wall.js work too
+document.addEventListener('click', function(e) {
+    const button = e.target.closest('.btn-pray');
+    if (button) {
+        const prayerId = button.getAttribute('data-prayer-id');
+        incrementPrayerCount(prayerId, button);
+    }
+});
+
+function incrementPrayerCount(prayerId, buttonElement) {
+    const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    fetch(`/increment-prayer/${prayerId}/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // Update the button text with the new count
+            const prayCount = buttonElement.querySelector('.pray-count');
+            if (prayCount) {
+                prayCount.textContent = `Pray (${data.prayer_count})`;
+            }
+
+            // Add visual feedback
+            buttonElement.style.backgroundColor = 'var(--secondary-color)';
+            buttonElement.style.color = 'var(--dark-color)';
+
+            setTimeout(() => {
+                buttonElement.style.backgroundColor = '';
+                buttonElement.style.color = '';
+            }, 300);
+        } else {
+            showAlert('error', 'Failed to update prayer count.');
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showAlert('error', 'An error occurred. Please try again.');
+    });
+}
+        // Add entrance animations for cards
+        const infoCards = document.querySelectorAll('.info-card, .quick-link-card');
+        infoCards.forEach((card, index) => {
+            card.style.opacity = '0';
+            card.style.transform = 'translateY(30px)';
+
+            setTimeout(() => {
+                card.style.transition = 'all 0.6s ease';
+                card.style.opacity = '1';
+                card.style.transform = 'translateY(0)';
+            }, index * 100);
+        });
+
+        // Delete prayer functionality
+        let prayerToDelete = null;
+        const deleteModal = new bootstrap.Modal(document.getElementById('deletePrayerModal'));
+        const confirmDeleteBtn = document.getElementById('confirmDeleteBtn');
+
+        document.addEventListener('click', function(e) {
+            const button = e.target.closest('.btn-delete-prayer');
+            if (button) {
+                prayerToDelete = button.getAttribute('data-prayer-id');
+                deleteModal.show();
+            }
+        });
+
+        confirmDeleteBtn.addEventListener('click', function() {
+            if (prayerToDelete) {
+                deletePrayer(prayerToDelete);
+                deleteModal.hide();
+            }
+        });
+
+        // AJAX form submission for better user experience
+        const prayerForm = document.getElementById('prayer-form');
+        if (prayerForm) {
+            prayerForm.addEventListener('submit', function(e) {
+                e.preventDefault();
+
+                const formData = new FormData(this);
+                const submitBtn = document.getElementById('submit-btn');
+
+                // Show loading state
+                const originalText = submitBtn.innerHTML;
+                submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i> Submitting...';
+                submitBtn.disabled = true;
+
+                fetch(prayerForm.action, {
+                    method: 'POST',
+                    body: formData,
+                    headers: {
+                        'X-Requested-With': 'XMLHttpRequest',
+                    }
+                })
+                .then(response => {
+                    if (!response.ok) {
+                        // Keep the form and its key: retrying must not submit twice
+                        const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+                        let message = 'An error occurred. Please try again.';
+                        if (response.status === 429) {
+                            message = retryAfter
+                                ? `Too many submissions. Please try again in ${formatWait(retryAfter)}.`
+                                : 'Too many submissions. Please try again later.';
+                        }
+                        showAlert('error', message);
+                        submitBtn.innerHTML = originalText;
+                        submitBtn.disabled = false;
+                        return;
+                    }
+                    if (!(window.prayerWall && window.prayerWall.live)) {
+                        // Reload the page to show the new prayer
+                        window.location.reload();
+                        return;
+                    }
+                    // The new prayer arrives through the live event stream
+                    prayerForm.reset();
+                    // A fresh key, so the next prayer isn't taken for a retry of this one
+                    const keyField = prayerForm.elements['idempotency_key'];
+                    if (keyField && window.crypto && crypto.randomUUID) {
+                        keyField.value = crypto.randomUUID().replace(/-/g, '');
+                    }
+                    submitBtn.innerHTML = originalText;
+                    submitBtn.disabled = false;
+                    showAlert('success', 'Your sacred message has been submitted successfully!');
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                    showAlert('error', 'An error occurred. Please try again.');
+                    submitBtn.innerHTML = originalText;
+                    submitBtn.disabled = false;
+                });
+            });
+        }
+    });
+
+    function formatWait(seconds) {
+        if (seconds < 60) {
+            return `${seconds} second${seconds === 1 ? '' : 's'}`;
+        }
+        const minutes = Math.ceil(seconds / 60);
+        return `${minutes} minute${minutes === 1 ? '' : 's'}`;
+    }
+
+    function deletePrayer(prayerId) {
+        const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
+
+        const deleteUrl = document.getElementById('prayer-section').dataset.deleteUrl;
+        fetch(deleteUrl.replace('0', prayerId), {
+            method: 'DELETE',
+            headers: {
+                'X-CSRFToken': csrfToken,
+                'X-Requested-With': 'XMLHttpRequest',
+            }
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (data.success) {
+                // Remove the prayer item from the DOM
+                const prayerItem = document.querySelector(`.prayer-item[data-prayer-id="${prayerId}"]`);
+                if (prayerItem) {
+                    prayerItem.style.opacity = '0';
+                    prayerItem.style.transform = 'translateY(-20px)';
+                    setTimeout(() => {
+                        prayerItem.remove();
+                        updatePrayerCount();
+                        showAlert('success', data.message);
+                    }, 300);
+                }
+            } else {
+                showAlert('error', data.error || 'Failed to delete prayer.');
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            showAlert('error', 'An error occurred. Please try again.');
+        });
+    }
+
+    function updatePrayerCount() {
+        const prayerItems = document.querySelectorAll('.prayer-item');
+        const prayerCount = document.querySelector('.prayer-count');
+        if (prayerCount) {
+            prayerCount.textContent = `${prayerItems.length} prayer${prayerItems.length !== 1 ? 's' : ''}`;
+        }
+
+        // If no prayers left, show empty state
+        if (prayerItems.length === 0) {
+            const prayersList = document.querySelector('.prayer-requests-list');
+            if (prayersList) {
+                prayersList.innerHTML = `
+                    <div class="empty-prayers">
+                        <i class="fas fa-pray"></i>
+                        <p>No prayer requests yet. Be the first to share your prayer intention.</p>
+                    </div>
+                `;
+            }
+        }
+    }
+
+    function showAlert(type, message) {
+        // Remove existing alerts
+        const existingAlerts = document.querySelectorAll('.alert');
+        existingAlerts.forEach(alert => alert.remove());
+
+        const alertDiv = document.createElement('div');
+        alertDiv.className = `alert alert-${type === 'success' ? 'success' : 'danger'} alert-dismissible fade show`;
+        alertDiv.innerHTML = `
+            ${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+        `;
+
+        const messagesContainer = document.querySelector('.messages-container');
+        if (messagesContainer) {
+            messagesContainer.appendChild(alertDiv);
+        } else {
+            // Create messages container if it doesn't exist
+            const sectionHeader = document.querySelector('.section-header');
+            if (sectionHeader) {
+                const newMessagesContainer = document.createElement('div');
+                newMessagesContainer.className = 'messages-container';
+                newMessagesContainer.appendChild(alertDiv);
+                sectionHeader.parentNode.insertBefore(newMessagesContainer, sectionHeader.nextSibling);
+            }
+        }
+
+        // Auto remove after 5 seconds
+        setTimeout(() => {
+            if (alertDiv.parentElement) {
+                alertDiv.remove();
+            }
+        }, 5000);
+    }
@@ -0,0 +1,179 @@
+"""
+Responsive versions of the site's own images, built during collectstatic.
+
+The photos under ``static/images`` are multi-megabyte camera JPEGs shown in
+cards a few hundred pixels wide. With ``OptimizedStaticFilesStorage`` as the
+``staticfiles`` storage, ``collectstatic`` additionally
+
+* recompresses each JPEG/PNG in place (kept only when it comes out smaller),
+* writes AVIF (when Pillow supports it), WebP and JPEG/PNG copies at
+  ``STATIC_IMAGE_WIDTHS`` (``images/youth_960w.webp`` ...), and
+* records what it wrote, with dimensions, in ``responsive-images.json``.
+
+``{% picture 'images/youth.jpg' %}`` reads that manifest to render a
+``<picture>`` element. Before collectstatic has run it renders a plain
+``<img>``, so development works unchanged.
+"""
+import hashlib
+import json
+import logging
+import os
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import StaticFilesStorage, staticfiles_storage
+from django.core.files.base import ContentFile
+
+from mainapp.imaging import VARIANT_FORMATS, _encode, _fallback_format
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError, features
+except ImportError:  # pragma: no cover - Pillow is an optional dependency
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'responsive-images.json'
+DEFAULT_STATIC_IMAGE_WIDTHS = (480, 960, 1600)
+DEFAULT_STATIC_IMAGE_PREFIXES = ('images/',)
+OPTIMIZABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+AVIF_FORMAT = ('avif', 'image/avif', {'quality': 55, 'speed': 8})
+
+
+def avif_available():
+    return Image is not None and features.check('avif')
+
+
+def static_image_widths():
+    return tuple(getattr(settings, 'STATIC_IMAGE_WIDTHS', DEFAULT_STATIC_IMAGE_WIDTHS))
+
+
+def is_optimizable(name):
+    prefixes = tuple(getattr(settings, 'STATIC_IMAGE_PREFIXES', DEFAULT_STATIC_IMAGE_PREFIXES))
+    stem, extension = posixpath.splitext(name)
+    return (
+        Image is not None
+        and name.startswith(prefixes)
+        and extension.lower() in OPTIMIZABLE_EXTENSIONS
+        # Our own output, e.g. images/youth_960w.jpg
+        and not stem.rsplit('_', 1)[-1].rstrip('w').isdigit()
+    )
+
+
+def _encode_as(image, pillow_format):
+    if pillow_format == 'AVIF':
+        extension, mime_type, options = AVIF_FORMAT
+        buffer = BytesIO()
+        image.save(buffer, 'AVIF', **options)
+        return extension, mime_type, buffer.getvalue()
+    return _encode(image, pillow_format)
+
+
+def optimize_image(storage, name, previous=None):
+    """
+    Recompress ``name`` in ``storage`` and write its width variants.
+
+    Returns the manifest entry. ``previous`` is the entry from the last run;
+    if the file is still the one we produced then, nothing is redone, so
+    running collectstatic again never recompresses twice.
+    """
+    with storage.open(name, 'rb') as fh:
+        data = fh.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if previous and previous.get('sha256') == digest and all(
+        storage.exists(source['name']) for sources in previous['sources'].values() for source in sources
+    ):
+        return previous
+
+    original = Image.open(BytesIO(data))
+    original = ImageOps.exif_transpose(original)
+    original.load()
+    fallback_format = _fallback_format(original)
+
+    # Keep the original name working, just lighter
+    _, _, recompressed = _encode(original, fallback_format)
+    if len(recompressed) < len(data):
+        storage.delete(name)
+        storage.save(name, ContentFile(recompressed))
+        digest = hashlib.sha256(recompressed).hexdigest()
+
+    formats = (['AVIF'] if avif_available() else []) + ['WEBP', fallback_format]
+    widths = [w for w in sorted(set(static_image_widths())) if w < original.width] or [original.width]
+    sources = {}
+    for width in widths:
+        resized = original.copy()
+        resized.thumbnail((width, original.height), Image.LANCZOS)
+        for pillow_format in formats:
+            extension, mime_type, encoded = _encode_as(resized, pillow_format)
+            variant = f'{posixpath.splitext(name)[0]}_{resized.width}w.{extension}'
+            if storage.exists(variant):
+                storage.delete(variant)
+            storage.save(variant, ContentFile(encoded))
+            sources.setdefault(mime_type, []).append({'name': variant, 'width': resized.width})
+
+    return {
+        'sha256': digest,
+        'width': original.width,
+        'height': original.height,
+        'fallback': VARIANT_FORMATS[fallback_format][1],
+        'sources': sources,
+    }
+
+
+class OptimizedStaticFilesStorage(StaticFilesStorage):
+    """``StaticFilesStorage`` that builds responsive images in ``post_process``."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        manifest = self.load_manifest()
+        for name in sorted(paths):
+            if not is_optimizable(name):
+                continue
+            try:
+                manifest[name] = optimize_image(self, name, manifest.get(name))
+            except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+                # Leave the file as collected rather than failing the deploy
+                logger.warning('Could not optimize %s', name, exc_info=True)
+                continue
+            yield name, name, True
+        self.save_manifest(manifest)
+
+    def load_manifest(self):
+        try:
+            with self.open(MANIFEST_NAME) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        if self.exists(MANIFEST_NAME):
+            self.delete(MANIFEST_NAME)
+        self.save(MANIFEST_NAME, ContentFile(json.dumps(manifest, indent=2, sort_keys=True).encode()))
+        _manifest_cache.clear()
+
+
+_manifest_cache = {}
+
+
+def responsive_image(name):
+    """The manifest entry for static image ``name``, or None if it wasn't processed."""
+    if settings.DEBUG:
+        # runserver serves from the source directories, where variants don't exist
+        return None
+    try:
+        path = staticfiles_storage.path(MANIFEST_NAME)
+        mtime = os.stat(path).st_mtime_ns
+    except (OSError, NotImplementedError):
+        return None
+    cached = _manifest_cache.get(path)
+    if not cached or cached[0] != mtime:
+        try:
+            with open(path, encoding='utf-8') as fh:
+                cached = (mtime, json.load(fh))
+        except (OSError, ValueError):
+            return None
+        _manifest_cache[path] = cached
+    return cached[1].get(name)
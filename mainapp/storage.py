@@ -0,0 +1,152 @@
+"""
+Content-addressed storage for gallery uploads.
+
+Uploads are stored under the SHA-256 of their bytes
+(``cas/3f/a2/3fa2...e1.jpg``), so the same photo uploaded by several people
+is kept on disk once. Each stored file has a ``MediaBlob`` row counting the
+``MediaFile`` rows that point at it; the file and its derived variants are
+only removed when the last reference goes away.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from mainapp.jobqueue import get_job_queue, job
+
+CAS_PREFIX = 'cas'
+CAS_TEMP_DIR = f'{CAS_PREFIX}/tmp'
+
+# A blob touched this recently may be about to gain a reference from an
+# upload that is still committing, so release() leaves it for gc_media.
+DEFAULT_RELEASE_GRACE_SECONDS = 60
+
+
+def get_media_storage():
+    """Storage for MediaFile.file, configurable as STORAGES['media']."""
+    return storages['media'] if 'media' in storages.backends else storages['default']
+
+
+def content_sha256(content):
+    """SHA-256 of a Django ``File``, reusing a digest computed earlier if present."""
+    precomputed = getattr(content, 'sha256', None)
+    if precomputed:
+        return precomputed
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def cas_name(sha256, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'{CAS_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def blob_stem(name):
+    """Storage name without extension; derived files are named ``<stem>_*``."""
+    return os.path.splitext(name)[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by content hash and never stores the
+    same bytes twice.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = cas_name(content_sha256(content), name)
+        if self.exists(name):
+            # Already stored; refresh the mtime so a concurrent release()
+            # sees the blob as in use.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def _save(self, name, content):
+        # Write under a unique temporary name and rename into place, so two
+        # simultaneous uploads of the same bytes can't produce "_abc123"
+        # suffixed duplicates; the second rename just replaces identical data.
+        temp_name = super()._save(f'{CAS_TEMP_DIR}/{uuid.uuid4().hex}', content)
+        final_path = self.path(name)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(self.path(temp_name), final_path)
+        return name
+
+
+def acquire_blob(name, content_hash='', size_bytes=None):
+    """Record one more reference to the stored file ``name``."""
+    from mainapp.models import MediaBlob
+
+    if not name:
+        return
+    for _ in range(3):
+        if MediaBlob.objects.filter(name=name).update(ref_count=F('ref_count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(
+                    name=name, stem=blob_stem(name), content_hash=content_hash,
+                    size_bytes=size_bytes, ref_count=1,
+                )
+            return
+        except IntegrityError:
+            continue  # Created concurrently; increment it instead.
+
+
+def release_blob(name, derived_names=()):
+    """
+    Drop one reference to ``name``.
+
+    When it was the last one the blob row is deleted and a job is queued to
+    remove the file and ``derived_names`` from disk. Returns True if the
+    blob was freed.
+    """
+    from mainapp.models import MediaBlob
+
+    if not name:
+        return False
+    with transaction.atomic():
+        MediaBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        freed, _ = MediaBlob.objects.filter(name=name, ref_count=0).delete()
+    if not freed:
+        return False
+
+    # Unlinking a large video can take a while; don't hold up the request
+    get_job_queue().enqueue_on_commit(remove_released_files, name, list(derived_names))
+    return True
+
+
+@job(lane='low')
+def remove_released_files(name, derived_names=()):
+    """Job: delete a released file and its derived files, unless it's in use again."""
+    from mainapp.models import MediaBlob
+
+    if MediaBlob.objects.filter(name=name).exists():
+        return  # Re-acquired in the meantime.
+    storage = get_media_storage()
+    try:
+        grace = getattr(settings, 'MEDIA_RELEASE_GRACE_SECONDS', DEFAULT_RELEASE_GRACE_SECONDS)
+        if time.time() - os.path.getmtime(storage.path(name)) < grace:
+            return  # Possibly being re-uploaded right now; gc_media will decide.
+    except (OSError, NotImplementedError):
+        pass
+    for file_name in [name, *derived_names]:
+        try:
+            storage.delete(file_name)
+        except OSError:
+            pass
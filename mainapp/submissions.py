@@ -0,0 +1,163 @@
+"""
+Prayer submissions that can't be counted twice.
+
+Double-clicks, retried requests and impatient resubmits used to create
+one row each. ``submit_prayer`` is the single entry point of the home and
+services forms and the AJAX endpoint, and catches them two ways:
+
+- Idempotency keys. Each rendered form carries a random hidden
+  ``idempotency_key`` (AJAX clients may send an ``Idempotency-Key``
+  header instead). The first submission stores the key with the prayer;
+  a retry with the same key and content gets that prayer back. A key
+  reused for different content starts a new submission.
+- Near-duplicates. A prayer from the same (normalized) name within
+  ``WINDOW`` whose message has the same fingerprint, or a simhash within
+  ``MAX_DISTANCE`` bits, is the same prayer again (see
+  ``mainapp.fingerprints``). Simhashes are only compared when both
+  messages have at least ``MIN_SHINGLES`` word pairs: in a short prayer one
+  changed word ("my father" for "my sister") is most of what it says, so
+  short prayers only match exact repeats. The ``(name_key, submitted_at)`` index
+  narrows the search to that name's recent prayers, so the check costs
+  one indexed query however many prayers are stored.
+
+What happens to a duplicate is up to ``POLICY``: ``'merge'`` answers as if
+it was accepted and returns the existing prayer, ``'reject'`` raises
+``DuplicatePrayer`` so the visitor is told.
+
+    DUPLICATE_PRAYERS = {
+        'WINDOW': 24 * 60 * 60,   # seconds
+        'MAX_DISTANCE': 10,       # of 64 simhash bits; 0 for exact repeats only
+        'MIN_SHINGLES': 16,       # shorter messages only match exact repeats
+        'POLICY': 'merge',        # or 'reject'
+        'KEY_TTL': 24 * 60 * 60,  # seconds idempotency keys are kept
+    }
+"""
+import hashlib
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from mainapp.fingerprints import distance, shingle_count
+from mainapp.jobqueue import get_job_queue, job
+from mainapp.metrics import PRAYER_DUPLICATES
+from mainapp.models import IdempotencyKey, PrayerRequest
+
+DEFAULT_DUPLICATE_PRAYERS = {
+    'WINDOW': 24 * 60 * 60,
+    'MAX_DISTANCE': 10,
+    'MIN_SHINGLES': 16,
+    'POLICY': 'merge',
+    'KEY_TTL': 24 * 60 * 60,
+}
+
+CREATED = 'created'
+REPLAYED = 'replayed'
+MERGED = 'merged'
+
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Candidates examined per check; more from one name in a window is a flood
+MAX_CANDIDATES = 50
+
+
+def duplicate_setting(name):
+    return {**DEFAULT_DUPLICATE_PRAYERS, **getattr(settings, 'DUPLICATE_PRAYERS', {})}[name]
+
+
+class DuplicatePrayer(Exception):
+    def __init__(self, prayer):
+        super().__init__(f'Prayer {prayer.pk} was already submitted.')
+        self.prayer = prayer
+
+
+def clean_key(key):
+    """The key if it is well-formed, else None (and it is ignored)"""
+    return key if key and KEY_PATTERN.match(key) else None
+
+
+def request_key(request):
+    """The submission's idempotency key: the header, or the form's hidden field"""
+    return request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+
+
+def request_hash(prayer):
+    return hashlib.blake2b(f'{prayer.name_key}\0{prayer.fingerprint}'.encode(), digest_size=16).hexdigest()
+
+
+def find_duplicate(prayer):
+    """A recent prayer from the same name with the same or a nearly same message"""
+    since = timezone.now() - timedelta(seconds=duplicate_setting('WINDOW'))
+    max_distance = duplicate_setting('MAX_DISTANCE')
+    min_shingles = duplicate_setting('MIN_SHINGLES')
+    # A short message's simhash is too coarse to tell a new prayer from an edit
+    near = shingle_count(prayer.message) >= min_shingles
+    candidates = PrayerRequest.objects.filter(
+        name_key=prayer.name_key, submitted_at__gte=since,
+    ).order_by('-submitted_at')[:MAX_CANDIDATES]
+    for candidate in candidates:
+        if candidate.fingerprint == prayer.fingerprint:
+            return candidate
+        if (near and distance(candidate.simhash, prayer.simhash) <= max_distance
+                and shingle_count(candidate.message) >= min_shingles):
+            return candidate
+    return None
+
+
+def submit_prayer(name, message, approved=True, key=None):
+    """
+    Save a new prayer unless it repeats one; return ``(prayer, outcome)``.
+
+    ``outcome`` is ``CREATED``, ``REPLAYED`` (a retry with the same key) or
+    ``MERGED`` (a near-duplicate). Raises ``DuplicatePrayer`` instead of
+    merging when ``POLICY`` is ``'reject'``.
+    """
+    prayer = PrayerRequest(name=name, message=message, approved=approved)
+    prayer.update_fingerprints()
+    key = clean_key(key)
+    incoming = request_hash(prayer)
+    try:
+        with transaction.atomic():
+            if key:
+                stored = IdempotencyKey.objects.select_related('prayer').filter(key=key).first()
+                if stored is not None and stored.request_hash == incoming:
+                    PRAYER_DUPLICATES.inc(outcome=REPLAYED)
+                    return stored.prayer, REPLAYED
+                if stored is not None:
+                    key = None  # Reused for something else: not a retry
+            duplicate = find_duplicate(prayer)
+            if duplicate is None:
+                prayer.save()
+                outcome = CREATED
+            elif duplicate_setting('POLICY') == 'reject':
+                raise DuplicatePrayer(duplicate)
+            else:
+                prayer, outcome = duplicate, MERGED
+            if key:
+                IdempotencyKey.objects.create(key=key, request_hash=incoming, prayer=prayer)
+                transaction.on_commit(schedule_key_pruning)
+    except DuplicatePrayer:
+        PRAYER_DUPLICATES.inc(outcome='rejected')
+        raise
+    except IntegrityError:
+        if not key:
+            raise
+        # A concurrent retry with the same key committed first
+        stored = IdempotencyKey.objects.select_related('prayer').get(key=key)
+        outcome, prayer = REPLAYED, stored.prayer
+    if outcome != CREATED:
+        PRAYER_DUPLICATES.inc(outcome=outcome)
+    return prayer, outcome
+
+
+@job(lane='low')
+def prune_idempotency_keys():
+    """Job: forget keys older than ``KEY_TTL``; retries come within seconds."""
+    cutoff = timezone.now() - timedelta(seconds=duplicate_setting('KEY_TTL'))
+    IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+
+
+def schedule_key_pruning():
+    get_job_queue().enqueue_once(prune_idempotency_keys, duplicate_setting('KEY_TTL'))
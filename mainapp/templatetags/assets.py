@@ -0,0 +1,54 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from mainapp.assets import bundle_paths
+from mainapp.static_images import responsive_image
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheet(name):
+    """<link> for the CSS bundle ``name`` (see mainapp.assets)"""
+    return format_html_join(
+        '\n', '<link rel="stylesheet" href="{}">', ((static(path),) for path in bundle_paths(f'{name}.css'))
+    )
+
+
+@register.simple_tag
+def script(name, defer=False):
+    """<script> for the JS bundle ``name``"""
+    tag = '<script src="{}" defer></script>' if defer else '<script src="{}"></script>'
+    return format_html_join('\n', tag, ((static(path),) for path in bundle_paths(f'{name}.js')))
+
+
+@register.simple_tag
+def picture(name, alt='', sizes='100vw', **attrs):
+    """
+    <picture> with AVIF/WebP/JPEG srcsets for static image ``name``, as
+    built by collectstatic (mainapp.static_images); a plain <img> otherwise.
+    Extra keyword arguments become attributes of the <img>, e.g.
+    ``class='event-img' loading='eager' fetchpriority='high'``.
+    """
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    entry = responsive_image(name)
+    if not entry:
+        return format_html('<img src="{}" alt="{}"{}>', static(name), alt, _attributes(attrs))
+
+    def srcset(mime_type):
+        return ', '.join(f"{static(s['name'])} {s['width']}w" for s in entry['sources'].get(mime_type, []))
+
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((mime_type, srcset(mime_type), sizes) for mime_type in ('image/avif', 'image/webp') if mime_type in entry['sources']),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}"{}></picture>',
+        sources, static(name), srcset(entry['fallback']), sizes, entry['width'], entry['height'], alt, _attributes(attrs),
+    )
+
+
+def _attributes(attrs):
+    return format_html_join('', ' {}="{}"', ((key.replace('_', '-'), value) for key, value in attrs.items()))
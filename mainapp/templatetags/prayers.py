@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from mainapp.caching import prayer_list_fragment
+
+register = template.Library()
+
+
+@register.simple_tag
+def prayer_list():
+    """The "recent prayers" card; cached and invalidated in mainapp.caching"""
+    return mark_safe(prayer_list_fragment())
@@ -1,3 +1,1572 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mainapp import assets, async_views, static_images
+from mainapp.api import LIST_VERSION_KEY
+from mainapp.benchmarking import compare_results
+from mainapp.caching import cache_stats
+from mainapp.events import RESET, CacheBroker, Event, astream_events, get_broker, stream_events
+from mainapp.db_routers import PIN_COOKIE, ReadYourWritesMiddleware, is_pinned, use_primary
+from mainapp.counters import BufferedPrayerCounter, CachePrayerCounter, DirectPrayerCounter, get_prayer_counter
+from mainapp.instrumentation import InstrumentationMiddleware
+from mainapp.jobqueue import get_job_queue, job
+from mainapp.metrics import FileMetricsStore, pid_alive
+from mainapp.fingerprints import distance, normalize, simhash
+from mainapp.models import ChunkedUpload, ContactMessage, IdempotencyKey, Job, MediaBlob, MediaFile, PrayerRequest
+from mainapp.moderation import bulk_moderate
+from mainapp.pagination import InvalidCursor, decode_cursor, encode_cursor, paginate_keyset
+from mainapp.ratelimit import (
+    CacheRateLimitStore, LocalRateLimitStore, Rate, SQLiteRateLimitStore, get_rate_limiter, parse_rate,
+)
+from mainapp.search import get_search_backend
+from mainapp.sqlite_tuning import current_pragmas, pragma_statements
+from mainapp.submissions import find_duplicate, prune_idempotency_keys
+from mainapp.uploads import UploadError, create_upload, finalize_upload, part_path, write_chunk
+
+
+def run_in_threads(target, threads=8):
+    """Run ``target`` concurrently, each thread with its own DB connection."""
+    errors = []
+
+    def worker():
+        try:
+            target()
+        except Exception as e:  # pragma: no cover - surfaced by the assertion below
+            errors.append(e)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors
+
+
+class PrayerCounterConcurrencyTests(TransactionTestCase):
+    threads = 8
+    clicks_per_thread = 25
+
+    def setUp(self):
+        self.prayer = PrayerRequest.objects.create(name='Mary', message='Pray for my family', approved=True)
+
+    def assertNoLostIncrements(self, counter):
+        def click():
+            for _ in range(self.clicks_per_thread):
+                counter.increment(self.prayer.pk)
+
+        errors = run_in_threads(click, self.threads)
+        counter.flush()
+        self.assertEqual(errors, [])
+        self.prayer.refresh_from_db()
+        self.assertEqual(self.prayer.prayer_count, self.threads * self.clicks_per_thread)
+
+    def test_direct_counter_loses_no_increments(self):
+        self.assertNoLostIncrements(DirectPrayerCounter())
+
+    def test_buffered_counter_loses_no_increments(self):
+        counter = BufferedPrayerCounter(flush_interval=0.01, max_pending=7)
+        try:
+            self.assertNoLostIncrements(counter)
+        finally:
+            counter.close()
+
+    def test_cache_counters_never_take_a_value_twice(self):
+        cache.clear()
+        first, second = CachePrayerCounter(flush_interval=60), CachePrayerCounter(flush_interval=60)
+        self.addCleanup(second.close)
+        self.addCleanup(first.close)
+        for counter in (first, second, first, second):
+            counter.increment(self.prayer.pk)
+
+        # Both flush the shared key at once: the second waits for the first
+        interleaved = {}
+        take = first._take
+
+        def take_while_second_flushes(key):
+            interleaved.update(second._take_pending())
+            return take(key)
+
+        with mock.patch.object(first, '_take', take_while_second_flushes):
+            taken = first._take_pending()
+        self.assertEqual((taken, interleaved, second._take_pending()), ({self.prayer.pk: 4}, {}, {}))
+
+        # Without the lock (it expired), whoever decrements second gives it back
+        key = first.make_key(self.prayer.pk)
+        cache.set(key, 3, None)
+        get, stolen = cache.get, []
+
+        def get_then_steal(*args, **kwargs):
+            value = get(*args, **kwargs)
+            if not stolen:
+                stolen.append(None)
+                stolen[0] = second._take(key)
+            return value
+
+        with mock.patch.object(cache, 'get', get_then_steal):
+            self.assertEqual(first._take(key), 0)
+        self.assertEqual((stolen, cache.get(key)), ([3], 0))
+
+    def test_increment_does_not_touch_updated_at(self):
+        updated_at = self.prayer.updated_at
+        self.prayer.increment_prayer_count()
+        self.assertEqual(self.prayer.prayer_count, 1)
+        self.prayer.refresh_from_db()
+        self.assertEqual(self.prayer.updated_at, updated_at)
+
+
+class IncrementPrayerViewTests(TestCase):
+    def setUp(self):
+        self.prayer = PrayerRequest.objects.create(name='John', message='Pray for healing', approved=True)
+
+    def test_returns_new_count(self):
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        self.client.post(url)
+        response = self.client.post(url)
+        self.assertEqual(response.json(), {'success': True, 'prayer_count': 2})
+
+    def test_unknown_prayer_is_404(self):
+        response = self.client.post(reverse('increment_prayer', args=[self.prayer.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PRAYER_COUNTER={
+        'BACKEND': 'mainapp.counters.BufferedPrayerCounter',
+        'OPTIONS': {'flush_interval': 60, 'max_pending': 1000},
+    })
+    def test_buffered_count_includes_pending_clicks(self):
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        for _ in range(3):
+            response = self.client.post(url)
+        self.assertEqual(response.json()['prayer_count'], 3)
+        self.prayer.refresh_from_db()
+        self.assertEqual(self.prayer.prayer_count, 0)
+        get_prayer_counter().flush()
+        self.prayer.refresh_from_db()
+        self.assertEqual(self.prayer.prayer_count, 3)
+
+
+class GalleryPaginationTests(TestCase):
+    def setUp(self):
+        media = [MediaFile.objects.create(file=f'uploads/photo{i}.jpg') for i in range(7)]
+        # Give several rows the same timestamp so the id tie-breaker matters.
+        MediaFile.objects.filter(pk__in=[m.pk for m in media[2:5]]).update(uploaded_at=media[2].uploaded_at)
+        self.expected = list(MediaFile.objects.order_by('-uploaded_at', '-id').values_list('pk', flat=True))
+
+    def test_pages_cover_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page = paginate_keyset(MediaFile.objects.all(), ('uploaded_at', 'id'), cursor=cursor, page_size=3)
+            seen += [m.pk for m in page.items]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_cursor_values_must_fit_their_columns(self):
+        for values in (['2024-01-01T00:00:00', 'x'], ['2024-01-01T00:00:00', True], ['yesterday', 1]):
+            with self.assertRaises(InvalidCursor):
+                paginate_keyset(MediaFile.objects.all(), ('uploaded_at', 'id'), cursor=encode_cursor(values))
+        values = decode_cursor(encode_cursor(['2024-01-01T00:00:00', '5']), ('uploaded_at', 'id'), MediaFile)
+        self.assertEqual(values[1], 5)
+        response = self.client.get(reverse('gallery_page'), {'cursor': encode_cursor(['2024-01-01T00:00:00', 'x'])})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_prayer_list'), {'cursor': encode_cursor(['2024-01-01T00:00:00', 'x'])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_gallery_page_endpoint(self):
+        response = self.client.get(reverse('gallery_page'), {'limit': 4})
+        data = response.json()
+        self.assertEqual(data['count'], 4)
+        response = self.client.get(reverse('gallery_page'), {'cursor': data['next_cursor'], 'limit': 4})
+        self.assertEqual(response.json()['count'], 3)
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('gallery_page'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PrayerModerationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('moderator', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+        events_override = override_settings(PRAYER_EVENTS={'OPTIONS': {'coalesce_interval': 0}})
+        events_override.enable()
+        self.addCleanup(events_override.disable)
+
+    def test_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(reverse('manage_prayers'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/admin/login/', response['Location'])
+
+    def test_status_filter_and_keyset_pages(self):
+        PrayerRequest.objects.bulk_create(
+            PrayerRequest(name='Anna', message=f'Pending {i}') for i in range(5)
+        )
+        PrayerRequest.objects.create(name='Ben', message='Already approved', approved=True)
+
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('manage_prayers'), {'cursor': cursor or '', 'limit': 2})
+            self.assertEqual(response.status_code, 200)
+            seen += [prayer.pk for prayer in response.context['prayers']]
+            cursor = response.context['next_cursor']
+            if not cursor:
+                break
+        pending = PrayerRequest.objects.filter(approved=False).order_by('-submitted_at', '-id')
+        self.assertEqual(seen, [prayer.pk for prayer in pending])
+
+        response = self.client.get(reverse('manage_prayers'), {'status': 'approved'})
+        self.assertEqual([prayer.name for prayer in response.context['prayers']], ['Ben'])
+        self.assertEqual(self.client.get(reverse('manage_prayers'), {'cursor': 'junk'}).status_code, 302)
+
+    def test_bulk_actions_are_single_statements(self):
+        prayers = [PrayerRequest.objects.create(name='Anna', message=f'Pending {i}') for i in range(3)]
+        ids = [prayer.pk for prayer in prayers]
+        url = reverse('manage_prayers') + '?status=pending'
+
+        with get_broker().subscribe() as subscription:
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {'action': 'approve', 'ids': ids})
+            self.assertRedirects(response, url, fetch_redirect_response=False)
+            self.assertEqual(PrayerRequest.objects.filter(approved=True).count(), 3)
+            updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "mainapp_prayerrequest"')]
+            self.assertEqual(len(updates), 1)
+            self.assertEqual({subscription.get(timeout=1).data['id'] for _ in ids}, set(ids))
+
+            # Already approved rows are left alone
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {'action': 'approve', 'ids': ids[:1]})
+            self.assertIsNone(subscription.get(timeout=0.1))
+
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {'action': 'delete', 'ids': ids[:2]})
+            deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE FROM "mainapp_prayerrequest"')]
+            self.assertEqual(len(deletes), 1)
+            self.assertEqual(list(PrayerRequest.objects.values_list('pk', flat=True)), ids[2:])
+            self.assertEqual([subscription.get(timeout=1).type for _ in range(2)], ['delete', 'delete'])
+
+    def test_bulk_approve_refreshes_prayer_list(self):
+        cache.clear()
+        prayer = PrayerRequest.objects.create(name='Anna', message='Waiting for approval')
+        self.assertNotContains(self.client.get(reverse('services')), 'Waiting for approval')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('manage_prayers'), {'action': 'approve', 'ids': [prayer.pk]})
+        self.assertContains(self.client.get(reverse('services')), 'Waiting for approval')
+
+    @override_settings(MODERATION_MAX_PAGE_SIZE=2)
+    def test_rejects_oversized_selection(self):
+        ids = [PrayerRequest.objects.create(name='Anna', message=str(i)).pk for i in range(3)]
+        response = self.client.post(reverse('manage_prayers'), {'action': 'delete', 'ids': ids}, follow=True)
+        self.assertContains(response, 'Select at most 2 prayers')
+        self.assertEqual(PrayerRequest.objects.count(), 3)
+
+
+class FullTextSearchTests(TestCase):
+    def search(self, query, queryset=None):
+        queryset = PrayerRequest.objects.all() if queryset is None else queryset
+        return get_search_backend().search(queryset, query)
+
+    def test_index_follows_saves_and_deletes(self):
+        prayer = PrayerRequest.objects.create(name='Anna', message='Healing for my <b>mother</b>', approved=True)
+        [hit] = self.search('mother')
+        self.assertEqual(hit.object, prayer)
+        self.assertIn('<mark>mother</mark>', hit.snippet)
+        self.assertIn('&lt;b&gt;', hit.snippet)  # Stored text is escaped, only our marks are HTML
+
+        prayer.message = 'Strength for my father'
+        prayer.save()
+        self.assertEqual(self.search('mother'), [])
+        self.assertEqual([hit.object for hit in self.search('fath')], [prayer])  # Prefix of the last word
+
+        prayer.delete()
+        self.assertEqual(self.search('father'), [])
+
+    def test_ranking_and_query_syntax_is_ignored(self):
+        once = PrayerRequest.objects.create(name='Anna', message='Peace in the world and a new job')
+        often = PrayerRequest.objects.create(name='Ben', message='Peace, peace, peace for our family')
+        self.assertEqual([hit.object for hit in self.search('peace')], [often, once])
+        self.assertEqual([hit.object for hit in self.search('peace AND "job')], [once])
+        self.assertEqual(self.search('***'), [])
+
+    def test_public_search_only_shows_approved_prayers(self):
+        PrayerRequest.objects.create(name='Anna', message='Pray for rain', approved=True)
+        PrayerRequest.objects.create(name='Ben', message='Pray for rain soon', approved=False)
+        response = self.client.get(reverse('prayer_search'), {'q': 'rain'})
+        self.assertEqual([hit.object.name for hit in response.context['hits']], ['Anna'])
+        self.assertContains(response, '<mark>rain</mark>')
+
+    def test_admin_search_and_bulk_delete_use_the_index(self):
+        staff = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(staff)
+        ContactMessage.objects.create(name='Cara', email='cara@example.com', subject='Baptism', message='Dates in May?')
+        ContactMessage.objects.create(name='Dan', email='dan@example.com', subject='Choir', message='Practice times')
+        response = self.client.get(reverse('admin:mainapp_contactmessage_changelist'), {'q': 'baptism'})
+        self.assertEqual([message.name for message in response.context['cl'].result_list], ['Cara'])
+
+        prayer = PrayerRequest.objects.create(name='Anna', message='Comfort in grief')
+        self.client.post(reverse('manage_prayers'), {'action': 'delete', 'ids': [prayer.pk]})
+        self.assertEqual(self.search('grief'), [])
+
+    def test_rebuild_command(self):
+        # bulk_create sends no signals, so these rows start out unindexed
+        PrayerRequest.objects.bulk_create(PrayerRequest(name='Anna', message=f'Blessing {i}') for i in range(5))
+        self.assertEqual(self.search('blessing'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', '--batch-size', '2', '--model', 'mainapp.prayerrequest', stdout=out)
+        self.assertIn('Indexed 5', out.getvalue())
+        self.assertEqual(len(self.search('blessing')), 5)
+
+    @override_settings(SEARCH_BACKEND={'BACKEND': 'mainapp.search.DatabaseSearchBackend'})
+    def test_database_backend(self):
+        prayer = PrayerRequest.objects.create(name='Anna', message='Safe travels for our pilgrims')
+        [hit] = self.search('PILGRIM travels')
+        self.assertEqual(hit.object, prayer)
+        self.assertIn('<mark>pilgrim</mark>s', hit.snippet)
+
+
+class PrayerAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            PrayerRequest.objects.create(name=f'Name {i}', message=f'Message {i}', approved=True)
+        PrayerRequest.objects.create(name='Pending', message='Not approved yet')
+
+    def test_cursor_pages_and_sparse_fields(self):
+        url, seen = reverse('api_prayer_list') + '?page_size=2&fields=id,name', []
+        while url:
+            data = self.client.get(url).json()
+            self.assertTrue(all(set(row) == {'id', 'name'} for row in data['results']))
+            seen += [row['name'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [f'Name {i}' for i in reversed(range(5))])
+
+        self.assertEqual(self.client.get(reverse('api_prayer_list'), {'fields': 'id,email'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_prayer_list'), {'cursor': 'junk'}).status_code, 404)
+        pending = PrayerRequest.objects.get(approved=False)
+        self.assertEqual(self.client.get(reverse('api_prayer_detail', args=[pending.pk])).status_code, 404)
+
+    def test_not_modified_is_a_cache_read(self):
+        response = self.client.get(reverse('api_prayer_list'))
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(reverse('api_prayer_list'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        # Another page or field selection is another representation
+        other = self.client.get(reverse('api_prayer_list'), {'fields': 'id'}, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(other.status_code, 200)
+
+    def test_validators_change_with_counts_and_edits(self):
+        # Last-Modified has one-second resolution, so start from an older edit
+        PrayerRequest.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        prayer = PrayerRequest.objects.filter(approved=True).first()
+        detail = self.client.get(reverse('api_prayer_detail', args=[prayer.pk]))
+        listing = self.client.get(reverse('api_prayer_list'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('increment_prayer', args=[prayer.pk]))
+        for url, response in ((reverse('api_prayer_list'), listing), (reverse('api_prayer_detail', args=[prayer.pk]), detail)):
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+
+        # updated_at didn't move, but Last-Modified did
+        modified_since = self.client.get(
+            reverse('api_prayer_list'), headers={'If-Modified-Since': listing['Last-Modified']}
+        )
+        self.assertEqual(modified_since.status_code, 200)
+
+        prayer.approved = False
+        with self.captureOnCommitCallbacks(execute=True):
+            prayer.save()
+        self.assertEqual(self.client.get(reverse('api_prayer_list'), headers={'If-None-Match': listing['ETag']}).status_code, 200)
+
+    def test_list_version_moves_with_bulk_moderation_and_survives_a_cache_miss(self):
+        listing = self.client.get(reverse('api_prayer_list'))
+        pending = PrayerRequest.objects.get(approved=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_moderate('approve', [pending.pk])
+        approved = self.client.get(reverse('api_prayer_list'), headers={'If-None-Match': listing['ETag']})
+        self.assertEqual(approved.status_code, 200)
+        self.assertIn('Pending', [row['name'] for row in approved.json()['results']])
+
+        # Without the cache the version is rebuilt from the rows, the same each time
+        cache.delete(LIST_VERSION_KEY)
+        rebuilt = self.client.get(reverse('api_prayer_list'))
+        cache.delete(LIST_VERSION_KEY)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_prayer_list'), headers={'If-None-Match': rebuilt['ETag']})
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_prayer_list'), headers={'If-None-Match': rebuilt['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+# Jobs must be module-level functions, so the job queue tests' jobs live here
+JOB_LOG = []
+
+
+def record_job(value):
+    JOB_LOG.append(value)
+
+
+@job(lane='high')
+def urgent_job(value):
+    JOB_LOG.append(value)
+
+
+@job(max_attempts=2)
+def failing_job():
+    raise RuntimeError('SMTP server unavailable')
+
+
+DATABASE_JOB_QUEUE = {'BACKEND': 'mainapp.jobqueue.DatabaseJobQueue', 'OPTIONS': {'workers': 0}}
+
+
+@override_settings(JOB_QUEUE=DATABASE_JOB_QUEUE)
+class DatabaseJobQueueTests(TestCase):
+    def setUp(self):
+        JOB_LOG.clear()
+        self.job_queue = get_job_queue()
+
+    def run_jobs(self):
+        return self.job_queue.run_due('test-worker')
+
+    def test_jobs_run_by_lane_priority(self):
+        self.job_queue.enqueue(record_job, 'default')
+        self.job_queue.enqueue(urgent_job, value='high')
+        self.assertEqual(list(Job.objects.values_list('lane', 'priority')), [('high', 0), ('default', 10)])
+        self.assertEqual(self.job_queue.qsize(), 2)
+
+        self.assertEqual(self.run_jobs(), 2)
+        self.assertEqual(JOB_LOG, ['high', 'default'])
+        self.assertFalse(Job.objects.exists())  # Done jobs are deleted
+
+    def test_only_module_level_functions(self):
+        with self.assertRaises(ValueError):
+            self.job_queue.enqueue(lambda: None)
+
+    def test_retries_with_backoff_then_fails(self):
+        self.job_queue.enqueue(failing_job)
+        with self.assertLogs('mainapp.jobqueue', 'WARNING'):
+            self.run_jobs()
+        queued = Job.objects.get()
+        self.assertEqual((queued.status, queued.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertGreater(queued.run_at, timezone.now())  # Backing off
+        self.assertIn('SMTP server unavailable', queued.last_error)
+
+        self.assertEqual(self.run_jobs(), 0)  # Not due yet
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('mainapp.jobqueue', 'ERROR'):
+            self.run_jobs()
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+
+    def test_abandoned_jobs_are_requeued(self):
+        self.job_queue.enqueue(record_job, 'again')
+        Job.objects.update(status=Job.STATUS_RUNNING, locked_by='dead', locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.run_jobs(), 0)
+        self.assertEqual(self.job_queue.requeue_stale(), 1)
+        self.run_jobs()
+        self.assertEqual(JOB_LOG, ['again'])
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+@override_settings(
+    JOB_QUEUE=DATABASE_JOB_QUEUE,
+    MANAGERS=[('Office', 'office@example.com')],
+    NOTIFICATION_DIGEST={'INTERVAL': 600, 'MAX_ITEMS': 100, 'SITE_URL': 'https://parish.example'},
+)
+class NotificationDigestTests(TestCase):
+    def setUp(self):
+        self.job_queue = get_job_queue()
+
+    def run_digests(self):
+        """Run queued digests as they fall due; return how many emails went out."""
+        sent = len(mail.outbox)
+        while Job.objects.filter(status=Job.STATUS_QUEUED).exists():
+            Job.objects.update(run_at=timezone.now())
+            self.job_queue.run_due('test-worker')
+        return len(mail.outbox) - sent
+
+    def test_contact_form_is_reported_in_a_digest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('contact'), {
+                'name': 'Anna', 'email': 'anna@example.com', 'subject': 'Baptism', 'message': 'Which Sundays are free?',
+            })
+        self.assertRedirects(response, reverse('contact'))
+        self.assertEqual(len(mail.outbox), 0)
+        digest = Job.objects.get()
+        self.assertEqual(digest.func, 'mainapp.notifications.send_notification_digest')
+        self.assertGreater(digest.run_at, timezone.now())  # Waits for more to arrive
+
+        self.assertEqual(self.run_digests(), 1)
+        self.assertEqual(mail.outbox[0].to, ['office@example.com'])
+        self.assertIn('Which Sundays are free?', mail.outbox[0].body)
+        self.assertIn('https://parish.example/admin/mainapp/contactmessage/', mail.outbox[0].body)
+        self.assertIsNotNone(ContactMessage.objects.get().notified_at)
+
+    def test_burst_of_submissions_sends_a_handful_of_digests(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(450):
+                ContactMessage.objects.create(name='Spam', email='spam@example.com', subject=f'Offer {i}', message='Buy')
+            for i in range(50):
+                PrayerRequest.objects.create(name='Visitor', message=f'Prayer {i}')
+            PrayerRequest.objects.create(name='Staff', message='Already approved', approved=True)
+        self.assertEqual(Job.objects.count(), 1)
+
+        self.assertEqual(self.run_digests(), 5)  # MAX_ITEMS per email
+        self.assertFalse(ContactMessage.objects.filter(notified_at__isnull=True).exists())
+        self.assertEqual(PrayerRequest.objects.filter(notified_at__isnull=True).count(), 1)
+        self.assertIn('...and 400 more', mail.outbox[0].body)
+        self.assertIn('50 prayer(s) to approve', mail.outbox[-1].subject)
+
+    def test_failed_send_reports_the_same_items_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PrayerRequest.objects.create(name='Maria', message='For my mother')
+        with override_settings(EMAIL_BACKEND='mainapp.tests.FailingEmailBackend'):
+            with self.assertLogs('mainapp.jobqueue', 'WARNING'):
+                self.job_queue.run_due('test-worker')  # Not due yet: nothing runs
+                Job.objects.update(run_at=timezone.now())
+                self.job_queue.run_due('test-worker')
+        self.assertIsNone(PrayerRequest.objects.get().notified_at)
+        self.assertEqual(Job.objects.get().attempts, 1)
+
+        self.assertEqual(self.run_digests(), 1)
+        self.assertIn('For my mother', mail.outbox[0].body)
+
+
+@override_settings(JOB_QUEUE=DATABASE_JOB_QUEUE)
+class RunWorkerCommandTests(TransactionTestCase):
+    def test_runs_due_jobs_in_burst_mode(self):
+        JOB_LOG.clear()
+        for i in range(6):
+            get_job_queue().enqueue(record_job, i)
+        get_job_queue().enqueue(urgent_job, 'skipped')
+        out = StringIO()
+        call_command('runworker', '--threads', '3', '--lane', 'default', '--burst', stdout=out)
+        self.assertIn('Ran 6 job(s)', out.getvalue())
+        self.assertEqual(sorted(JOB_LOG), list(range(6)))
+        self.assertEqual(list(Job.objects.values_list('lane', flat=True)), ['high'])
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    def test_every_route_has_a_scenario(self):
+        from mainapp.management.commands.benchmark import uncovered_routes
+
+        self.assertEqual(uncovered_routes(), [])
+
+    def test_runs_and_compares_with_saved_results(self):
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        call_command(
+            'benchmark', '--scale', 'tiny', '--concurrency', '2', '--rounds', '15', '--mix', 'busy',
+            '--output', output, stdout=StringIO(),
+        )
+        with open(output) as f:
+            result = json.load(f)
+        self.assertEqual(result['total']['errors'], 0)
+        self.assertEqual(result['meta']['rows']['prayers'], 100)
+        self.assertIsNotNone(result['routes']['home']['queries_max'])
+
+        slower = json.loads(json.dumps(result))
+        slower['routes']['home'].update(requests=50, p95_ms=500.0, queries_max=50)
+        result['routes']['home'].update(requests=50, p95_ms=5.0)
+        self.assertEqual(compare_results(result, result), [])
+        self.assertEqual(len(compare_results(result, slower)), 2)
+
+    def test_rate_limit_overhead_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_ratelimit', '--checks', '200', '--requests', '5', '--rounds', '2', stdout=out)
+        for store in ('local', 'cache', 'sqlite'):
+            self.assertRegex(out.getvalue(), rf'{store} +[\d.]+ us/check')
+
+
+class InstrumentationMiddlewareTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        self.instrumentation = {
+            'ENABLED': True, 'SAMPLE_RATE': 0, 'SLOW_REQUEST_MS': 10_000,
+            'PROFILE_DIR': self.profile_dir, 'DUPLICATE_QUERY_THRESHOLD': 5,
+        }
+
+    def test_removes_itself_when_disabled(self):
+        with override_settings(INSTRUMENTATION={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                InstrumentationMiddleware(lambda request: HttpResponse())
+
+    def test_times_views_queries_and_templates(self):
+        PrayerRequest.objects.create(name='John', message='Pray for healing', approved=True)
+        with override_settings(INSTRUMENTATION=self.instrumentation):
+            with self.assertLogs('mainapp.instrumentation', 'DEBUG') as logs:
+                response = Client().get(reverse('services'))
+        stats = response.wsgi_request.instrumentation
+        self.assertGreater(stats.query_count, 0)
+        self.assertGreater(stats.template_time, 0)
+        self.assertLess(stats.template_time + stats.db_time, stats.duration)
+        self.assertIn(f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} queries"', response['Server-Timing'])
+        self.assertIn('GET /services/ services 200', logs.output[0])
+
+    def test_warns_about_n_plus_one_queries(self):
+        def view(request):
+            for pk in range(6):
+                PrayerRequest.objects.filter(pk=pk).exists()
+            return HttpResponse()
+
+        with override_settings(INSTRUMENTATION=self.instrumentation):
+            middleware = InstrumentationMiddleware(view)
+        with self.assertLogs('mainapp.instrumentation', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertIn('possible N+1: 6x SELECT', logs.output[0])
+
+    def test_saves_profiles_of_slow_sampled_requests(self):
+        def slow_view(request):
+            time.sleep(0.02)
+            return HttpResponse()
+
+        self.instrumentation.update(SAMPLE_RATE=1, SLOW_REQUEST_MS=10)
+        with override_settings(INSTRUMENTATION=self.instrumentation):
+            middleware = InstrumentationMiddleware(slow_view)
+        with self.assertLogs('mainapp.instrumentation', 'WARNING'):
+            middleware(RequestFactory().get('/'))
+        names = sorted(os.listdir(self.profile_dir))
+        self.assertEqual([os.path.splitext(name)[1] for name in names], ['.folded', '.prof'])
+        with open(os.path.join(self.profile_dir, names[0])) as f:
+            stack, samples = f.readline().rsplit(' ', 1)
+        self.assertTrue(stack.endswith('slow_view (tests.py:{})'.format(slow_view.__code__.co_firstlineno)))
+        self.assertGreater(int(samples), 5)
+
+
+@override_settings(METRICS={'BACKEND': 'mainapp.metrics.LocalMetricsStore', 'TOKEN': 'scraper-secret'})
+class MetricsTests(TestCase):
+    def scrape(self, **extra):
+        response = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_requests_are_counted_and_timed_by_view(self):
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        lines = self.scrape()
+        self.assertIn('http_requests_total{view="home",method="GET",status="200"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{view="home",le="+Inf"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{view="home"} 2', lines)
+        self.assertIn('# TYPE http_request_db_seconds histogram', lines)
+
+    @override_settings(JOB_QUEUE=DATABASE_JOB_QUEUE)
+    def test_submissions_increments_and_queue_depth(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            prayer = PrayerRequest.objects.create(name='John', message='Pray for healing', approved=True)
+        self.client.post(reverse('increment_prayer', args=[prayer.pk]))
+        get_job_queue().enqueue(record_job, 'waiting')
+        lines = self.scrape()
+        self.assertIn('prayers_submitted_total{approved="true"} 1', lines)
+        self.assertIn('prayer_increments_total 1', lines)
+        self.assertIn('job_queue_depth 1', lines)
+
+    def test_only_local_staff_or_token_may_scrape(self):
+        outside = Client(REMOTE_ADDR='203.0.113.5')
+        self.assertEqual(outside.get(reverse('metrics')).status_code, 403)
+        # A local proxy forwarding someone else's request
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='203.0.113.5').status_code, 403)
+        response = outside.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scraper-secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_file_store_sums_processes_and_keeps_exited_counters(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        store = FileMetricsStore(directory=directory, flush_interval=60)
+        store.inc('jobs_total', {'jobs_total': 2})
+        dead_pid = next(pid for pid in range(4_000_000, 4_100_000) if not pid_alive(pid))
+        with open(store.path(dead_pid), 'w') as f:
+            json.dump({'counters': {'jobs_total': {'jobs_total': 3}}, 'gauges': {'busy': {'busy': 1}}}, f)
+
+        for _ in range(2):  # The exited process is archived once, not lost
+            collected = store.collect()
+            self.assertEqual(collected['counters'], {'jobs_total': {'jobs_total': 5}})
+            self.assertEqual(collected.get('gauges', {}), {})
+        self.assertFalse(os.path.exists(store.path(dead_pid)))
+
+
+    def test_file_store_flushes_the_last_changes_of_a_quiet_worker(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        store = FileMetricsStore(directory=directory, flush_interval=0.1)
+        store.inc('jobs_total', {'jobs_total': 1})  # Written at once
+        store.inc('jobs_total', {'jobs_total': 1})  # Within the interval: written by the timer
+        time.sleep(0.3)
+        with open(store.path()) as f:
+            self.assertEqual(json.load(f)['counters'], {'jobs_total': {'jobs_total': 2}})
+
+
+RATE_LIMITS = {
+    'BACKEND': 'mainapp.ratelimit.LocalRateLimitStore',
+    'RATES': {'prayer_submit': '2/h', 'prayer_increment': '1/m', 'delete': None},
+}
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        # Per test, so each one starts with full buckets
+        limits_override = override_settings(RATE_LIMITS=RATE_LIMITS)
+        limits_override.enable()
+        self.addCleanup(limits_override.disable)
+        self.prayer = PrayerRequest.objects.create(name='John', message='Pray for healing', approved=True)
+
+    def test_stores_refill_buckets(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        stores = [
+            LocalRateLimitStore(),
+            CacheRateLimitStore(),
+            SQLiteRateLimitStore(location=os.path.join(directory, 'ratelimit.sqlite3')),
+        ]
+        rate = Rate(*parse_rate('4/s'))
+        for store in stores:
+            self.assertEqual([store.consume('client', rate) for _ in range(4)], [0, 0, 0, 0])
+            self.assertAlmostEqual(store.consume('client', rate), 0.25, delta=0.05)
+            self.assertEqual(store.consume('other-client', rate), 0)
+        time.sleep(0.3)
+        for store in stores:
+            self.assertEqual(store.consume('client', rate), 0)
+            self.assertGreater(store.consume('client', rate), 0)
+
+    def test_form_posts_over_the_limit_get_429(self):
+        self.client.post(reverse('home'), {'name': 'Anna', 'message': 'Healing for my mother'})
+        self.client.post(reverse('services'), {'name': 'Anna', 'message': 'Peace in our parish'})  # Same bucket
+        response = self.client.post(reverse('home'), {'name': 'Anna', 'message': 'Work for my brother'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1800')
+        self.assertEqual(PrayerRequest.objects.count(), 3)
+        self.assertEqual(self.client.get(reverse('home')).status_code, 200)  # Reading is never limited
+
+    def test_ajax_endpoints_answer_429_as_json(self):
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        self.assertEqual(self.client.post(url).status_code, 200)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['retry_after'], 60)
+        self.assertEqual(Client(REMOTE_ADDR='203.0.113.5').post(url).status_code, 200)
+        # A rate of None lifts the limit
+        for _ in range(3):
+            other = PrayerRequest.objects.create(name='Mary', message='Peace', approved=True)
+            self.assertEqual(self.client.delete(reverse('delete_prayer', args=[other.pk])).status_code, 200)
+
+    async def test_async_views_share_the_limits(self):
+        factory = AsyncRequestFactory()
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        responses = [await async_views.increment_prayer_count(factory.post(url), self.prayer.pk) for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [200, 429])
+        self.assertEqual(responses[1]['Retry-After'], '60')
+
+    @override_settings(RATE_LIMITS={**RATE_LIMITS, 'PROXY_COUNT': 1})
+    def test_client_address_behind_a_proxy(self):
+        limiter = get_rate_limiter()
+        request = RequestFactory().post('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 198.51.100.7')
+        self.assertEqual(limiter.client_ip(request), '198.51.100.7')
+        request = RequestFactory().post('/', REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='2001:db8:1:2:3::9')
+        self.assertEqual(limiter.client_ip(request), '2001:db8:1:2::')
+
+    def test_key_by_user_or_session_splits_a_shared_address(self):
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        anna, ben = User.objects.create_user('anna'), User.objects.create_user('ben')
+        clients = [Client(), Client()]
+        clients[0].force_login(anna)
+        clients[1].force_login(ben)
+        # One address, so by default one bucket
+        self.assertEqual([client.post(url).status_code for client in clients], [200, 429])
+        with override_settings(RATE_LIMITS={**RATE_LIMITS, 'KEY': 'user'}):
+            self.assertEqual([client.post(url).status_code for client in clients], [200, 200])
+            self.assertEqual(clients[0].post(url).status_code, 429)
+            # Anonymous visitors still share the address's bucket
+            self.assertEqual([Client().post(url).status_code for _ in range(2)], [200, 429])
+
+        with override_settings(RATE_LIMITS={**RATE_LIMITS, 'KEY': 'session'}):
+            visitors = [Client(), Client()]
+            for visitor in visitors:
+                session = visitor.session
+                session['visited'] = True
+                session.save()
+            self.assertEqual([visitor.post(url).status_code for visitor in visitors], [200, 200])
+            # A made-up session cookie falls back to the address
+            forged = Client()
+            forged.cookies[settings.SESSION_COOKIE_NAME] = 'made-up-session-key-0123456789'
+            self.assertEqual([forged.post(url).status_code, Client().post(url).status_code], [200, 429])
+
+        with self.assertRaises(ImproperlyConfigured), override_settings(RATE_LIMITS={**RATE_LIMITS, 'KEY': 'cookie'}):
+            get_rate_limiter()
+
+
+class DuplicateSubmissionTests(TestCase):
+    message = 'Please pray for my mother, who is in the hospital with pneumonia and needs healing.'
+
+    def setUp(self):
+        # Many submissions from one address; the limits have their own tests
+        limits_override = override_settings(RATE_LIMITS={'ENABLED': False})
+        limits_override.enable()
+        self.addCleanup(limits_override.disable)
+
+    def submit(self, name='Anna', message=None, key=None):
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        if key:
+            headers['Idempotency-Key'] = key
+        return self.client.post(
+            reverse('submit_prayer_ajax'), {'name': name, 'message': message or self.message}, headers=headers,
+        )
+
+    def test_fingerprints_ignore_case_punctuation_and_small_edits(self):
+        self.assertEqual(normalize('  Pray for my Mother!\n Amén.'), 'pray for my mother amen')
+        edited = 'please pray for my mother who is in hospital with pneumonia and needs healing'
+        unrelated = 'Thank you Lord for the new job my brother found after a long search this year.'
+        self.assertLessEqual(distance(simhash(self.message), simhash(edited)), 10)
+        self.assertGreater(distance(simhash(self.message), simhash(unrelated)), 10)
+
+    def test_retry_with_the_same_key_returns_the_first_prayer(self):
+        first = self.submit(key='retry-key-0001').json()
+        again = self.submit(key='retry-key-0001').json()
+        self.assertEqual(again['prayer']['id'], first['prayer']['id'])
+        self.assertEqual((first['duplicate'], again['duplicate']), (False, True))
+        # The same key with other content is a new submission
+        other = self.submit(message='Pray for peace in our family this Christmas.', key='retry-key-0001').json()
+        self.assertNotEqual(other['prayer']['id'], first['prayer']['id'])
+        self.assertEqual(PrayerRequest.objects.count(), 2)
+
+    def test_near_duplicates_from_the_same_name_are_merged(self):
+        first = self.submit().json()['prayer']['id']
+        again = self.submit(name=' anna', message=self.message.upper().replace(',', '')).json()
+        self.assertEqual((again['prayer']['id'], again['duplicate']), (first, True))
+        self.assertFalse(self.submit(name='Maria').json()['duplicate'])
+        PrayerRequest.objects.filter(pk=first).update(submitted_at=timezone.now() - timedelta(days=2))
+        self.assertFalse(self.submit().json()['duplicate'])  # Outside the window
+        self.assertEqual(PrayerRequest.objects.count(), 3)
+
+    def test_edited_long_prayers_are_merged(self):
+        long_message = (
+            'Please pray for my mother, who has been in the hospital with pneumonia since Sunday '
+            'and needs healing, strength and peace for the whole family while we wait.'
+        )
+        first = self.submit(message=long_message).json()['prayer']['id']
+        again = self.submit(message=long_message.replace('since Sunday', 'since last Sunday')).json()
+        self.assertEqual((again['prayer']['id'], again['duplicate']), (first, True))
+
+    def test_short_prayers_naming_someone_else_are_kept(self):
+        pairs = [
+            ('Please pray for my father who is in hospital', 'Please pray for my sister who is in hospital'),
+            ('Pray for my son John, he has surgery tomorrow', 'Pray for my son Peter, he has surgery tomorrow'),
+            ('Healing for my grandmother after her fall', 'Healing for my grandfather after his fall'),
+        ]
+        for first, second in pairs:
+            self.assertFalse(self.submit(message=first).json()['duplicate'])
+            self.assertFalse(self.submit(message=second).json()['duplicate'])
+        self.assertEqual(PrayerRequest.objects.count(), 6)
+
+    @override_settings(DUPLICATE_PRAYERS={'POLICY': 'reject'})
+    def test_reject_policy(self):
+        self.submit()
+        self.assertEqual(self.submit().status_code, 409)
+        response = self.client.post(reverse('home'), {'name': 'Anna', 'message': self.message})
+        self.assertIn('already received this message', str(list(get_messages(response.wsgi_request))[0]))
+        self.assertEqual(PrayerRequest.objects.count(), 1)
+
+    def test_form_resubmission_with_its_key(self):
+        form = self.client.get(reverse('services')).context['form']
+        data = {'name': 'Anna', 'message': 'Pray for the choir', 'idempotency_key': form['idempotency_key'].value()}
+        for _ in range(2):
+            self.assertRedirects(self.client.post(reverse('services'), data), reverse('services'))
+        self.assertEqual(IdempotencyKey.objects.get().prayer, PrayerRequest.objects.get())
+
+    def test_candidates_come_from_the_name_index(self):
+        plan = PrayerRequest.objects.filter(name_key='anna', submitted_at__gte=timezone.now()).explain()
+        self.assertIn('prayer_name_recent', plan)
+        self.submit()
+        prayer = PrayerRequest(name='Anna', message=self.message)
+        prayer.update_fingerprints()
+        with self.assertNumQueries(1):
+            self.assertIsNotNone(find_duplicate(prayer))
+
+    def test_bulk_delete_removes_their_keys(self):
+        first = self.submit(key='delete-key-0001').json()['prayer']['id']
+        second = self.submit(name='Maria', key='delete-key-0002').json()['prayer']['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(bulk_moderate('delete', [first, second]), 2)
+        self.assertFalse(PrayerRequest.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_old_keys_are_pruned(self):
+        self.submit(key='old-key-0001')
+        self.submit(name='Maria', key='new-key-0001')
+        IdempotencyKey.objects.filter(key='old-key-0001').update(created_at=timezone.now() - timedelta(days=2))
+        prune_idempotency_keys()
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new-key-0001'])
+
+
+def make_image(name='photo.jpg', size=(1200, 800), format='JPEG'):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', size, (120, 60, 30)).save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class TempMediaRootMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+
+
+class AsyncAjaxViewTests(TempMediaRootMixin, TestCase):
+    """The ASGI versions of the AJAX endpoints answer like the sync ones."""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        self.prayer = PrayerRequest.objects.create(name='John', message='Pray for healing', approved=True)
+
+    async def test_submit_prayer(self):
+        request = self.factory.post(
+            reverse('submit_prayer_ajax'), {'name': 'Anna', 'message': 'Healing'},
+            headers={'X-Requested-With': 'XMLHttpRequest'},
+        )
+        response = await async_views.submit_prayer_ajax(request)
+        self.assertEqual(response.status_code, 200)
+        prayer = await PrayerRequest.objects.aget(pk=json.loads(response.content)['prayer']['id'])
+        self.assertTrue(prayer.approved)
+
+        request = self.factory.post(reverse('submit_prayer_ajax'), {'name': 'Anna'})
+        self.assertEqual((await async_views.submit_prayer_ajax(request)).status_code, 405)
+
+    async def test_increment_prayer_count(self):
+        url = reverse('increment_prayer', args=[self.prayer.pk])
+        await async_views.increment_prayer_count(self.factory.post(url), self.prayer.pk)
+        response = await async_views.increment_prayer_count(self.factory.post(url), self.prayer.pk)
+        self.assertEqual(json.loads(response.content), {'success': True, 'prayer_count': 2})
+
+        missing = await async_views.increment_prayer_count(self.factory.post(url), self.prayer.pk + 1)
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(PRAYER_COUNTER={
+        'BACKEND': 'mainapp.counters.BufferedPrayerCounter',
+        'OPTIONS': {'flush_interval': 60, 'max_pending': 1000},
+    })
+    async def test_buffered_increment(self):
+        counter = get_prayer_counter()
+        for _ in range(3):
+            count = await counter.aincrement(self.prayer.pk)
+        self.assertEqual(count, 3)
+        self.assertEqual(counter.pending(self.prayer.pk), 3)
+        await sync_to_async(counter.flush)()
+        await self.prayer.arefresh_from_db()
+        self.assertEqual(self.prayer.prayer_count, 3)
+
+    async def test_delete_prayer_and_media(self):
+        url = reverse('delete_prayer', args=[self.prayer.pk])
+        response = await async_views.delete_prayer(self.factory.delete(url), self.prayer.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await PrayerRequest.objects.filter(pk=self.prayer.pk).aexists())
+
+        media = await MediaFile.objects.acreate(file='uploads/missing.jpg', kind=MediaFile.KIND_IMAGE)
+        url = reverse('delete_gallery_media', args=[media.pk])
+        self.assertEqual((await async_views.delete_gallery_media(self.factory.post(url), media.pk)).status_code, 405)
+        response = await async_views.delete_gallery_media(self.factory.delete(url), media.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await MediaFile.objects.filter(pk=media.pk).aexists())
+
+
+@override_settings(MEDIA_VARIANT_WIDTHS=(320, 640), JOB_QUEUE={'EAGER': True})
+class MediaProcessingTests(TempMediaRootMixin, TestCase):
+    def test_variants_generated_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            media = MediaFile.objects.create(file=make_image())
+        media.refresh_from_db()
+        self.assertEqual(media.processing_status, MediaFile.PROCESSING_READY)
+        self.assertEqual([v['width'] for v in media.variants], [320, 320, 640, 640])
+        self.assertEqual({v['mime_type'] for v in media.variants}, {'image/webp', 'image/jpeg'})
+        for variant in media.variants:
+            self.assertTrue(media.file.storage.exists(variant['name']))
+        self.assertIn('_320w.webp 320w', media.webp_srcset())
+
+    def test_backfill_command(self):
+        media = MediaFile.objects.create(file=make_image())
+        call_command('generate_media_variants', workers=2, stdout=StringIO())
+        media.refresh_from_db()
+        self.assertEqual(len(media.variants), 4)
+
+    @override_settings(FFPROBE_BINARY='missing-ffprobe', FFMPEG_BINARY='missing-ffmpeg')
+    def test_video_without_decoder_degrades(self):
+        upload = SimpleUploadedFile('clip.mp4', b'\x00\x00\x00\x18ftypmp42', content_type='video/mp4')
+        with self.captureOnCommitCallbacks(execute=True):
+            media = MediaFile.objects.create(file=upload)
+        media.refresh_from_db()
+        self.assertEqual(media.processing_status, MediaFile.PROCESSING_UNAVAILABLE)
+        self.assertFalse(media.poster)
+        response = self.client.get(reverse('gallery'))
+        self.assertContains(response, 'gallery-video-placeholder')
+        self.assertNotContains(response, '<video class="gallery-video">')
+
+
+@override_settings(CHUNKED_UPLOAD_MAX_CHUNK_SIZE=1024)
+class ChunkedUploadTests(TempMediaRootMixin, TestCase):
+    payload = bytes(range(256)) * 10
+
+    def put_chunk(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('chunked_upload_detail', args=[upload_id]), data,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def test_resumable_upload(self):
+        response = self.client.post(
+            reverse('chunked_upload_create'),
+            {'filename': 'clip.mp4', 'size': len(self.payload), 'sha256': hashlib.sha256(self.payload).hexdigest()},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['id']
+
+        self.assertEqual(self.put_chunk(upload_id, 0, self.payload[:1000]).json()['offset'], 1000)
+        # A retried chunk at a stale offset is rejected with the real offset.
+        response = self.put_chunk(upload_id, 0, self.payload[:1000])
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '1000'))
+        # Oversized chunks are refused before anything is read.
+        self.assertEqual(self.put_chunk(upload_id, 1000, self.payload[1000:]).status_code, 413)
+
+        self.put_chunk(upload_id, 1000, self.payload[1000:2000])
+        progress = self.client.get(reverse('chunked_upload_detail', args=[upload_id])).json()
+        self.assertEqual((progress['offset'], progress['status']), (2000, 'uploading'))
+
+        self.put_chunk(upload_id, 2000, self.payload[2000:])
+        response = self.client.post(reverse('chunked_upload_complete', args=[upload_id]))
+        self.assertEqual(response.json()['status'], 'complete')
+        media = MediaFile.objects.get(pk=response.json()['media_id'])
+        with media.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.payload)
+
+    def test_checksum_mismatch_fails_upload(self):
+        upload_id = self.client.post(
+            reverse('chunked_upload_create'),
+            {'filename': 'photo.jpg', 'size': 4, 'sha256': '0' * 64},
+            content_type='application/json',
+        ).json()['id']
+        self.put_chunk(upload_id, 0, b'abcd')
+        response = self.client.post(reverse('chunked_upload_complete', args=[upload_id]))
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(MediaFile.objects.exists())
+
+
+    def test_overtaken_chunk_cannot_cut_off_counted_bytes(self):
+        upload = create_upload('clip.mp4', 10)
+        stalled = ChunkedUpload.objects.get(pk=upload.pk)
+        # The retry of the first chunk lands, then the second chunk
+        write_chunk(upload, 0, BytesIO(b'AAAAA'), 5)
+        write_chunk(upload, 5, BytesIO(b'BBBBB'), 5)
+        # The stalled original ends short, then a copy of it arrives in full
+        with self.assertRaisesMessage(UploadError, 'incomplete'):
+            write_chunk(stalled, 0, BytesIO(b'AAA'), 5)
+        with self.assertRaises(UploadError) as caught:
+            write_chunk(stalled, 0, BytesIO(b'aaaaa'), 5)
+        self.assertEqual((caught.exception.status, caught.exception.offset), (409, 10))
+        with finalize_upload(upload).file.open('rb') as fh:
+            self.assertEqual(fh.read(), b'AAAAABBBBB')
+
+    def test_finalize_rejects_a_part_file_of_the_wrong_size(self):
+        upload = create_upload('photo.jpg', 4)
+        write_chunk(upload, 0, BytesIO(b'abcd'), 4)
+        with open(part_path(upload), 'r+b') as fh:
+            fh.truncate(3)
+        with self.assertRaises(UploadError) as caught:
+            finalize_upload(upload)
+        self.assertEqual(caught.exception.status, 422)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ChunkedUpload.STATUS_FAILED)
+        self.assertFalse(MediaFile.objects.exists())
+
+class MediaMetadataTests(TempMediaRootMixin, TestCase):
+    def test_metadata_sniffed_from_content(self):
+        photo = MediaFile.objects.create(file=make_image('holiday.png', size=(40, 30), format='PNG'))
+        self.assertEqual((photo.kind, photo.mime_type), ('image', 'image/png'))
+        self.assertEqual((photo.width, photo.height), (40, 30))
+        with photo.file.open('rb') as fh:
+            data = fh.read()
+        self.assertEqual(photo.size_bytes, len(data))
+        self.assertEqual(photo.content_hash, hashlib.sha256(data).hexdigest())
+
+        # .webm used to be classified as an image by the template's ".mp4" check
+        clip = MediaFile.objects.create(file=SimpleUploadedFile('choir.webm', b'\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01webm'))
+        self.assertEqual((clip.kind, clip.mime_type), ('video', 'video/webm'))
+        self.assertTrue(clip.is_video())
+
+    def test_gallery_filters_by_kind_in_sql(self):
+        MediaFile.objects.create(file=make_image())
+        MediaFile.objects.create(file=SimpleUploadedFile('clip.mp4', b'\x00\x00\x00\x18ftypmp42'))
+        response = self.client.get(reverse('gallery_page'), {'kind': 'video'})
+        self.assertEqual(response.json()['count'], 1)
+        self.assertIn('data-type="video"', response.json()['html'])
+
+
+@override_settings(MEDIA_RELEASE_GRACE_SECONDS=0, JOB_QUEUE={'EAGER': True})
+class DeduplicatedStorageTests(TempMediaRootMixin, TestCase):
+    def test_identical_uploads_share_one_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = MediaFile.objects.create(file=make_image('a.jpg'))
+            second = MediaFile.objects.create(file=make_image('b.jpg'))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertTrue(first.file.name.startswith(f'cas/{first.content_hash[:2]}/'))
+        self.assertEqual(MediaBlob.objects.get(name=first.file.name).ref_count, 2)
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse('delete_gallery_media', args=[first.pk]))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(MediaBlob.objects.get(name=second.file.name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_gc_removes_unreferenced_files(self):
+        media = MediaFile.objects.create(file=make_image())
+        orphan = os.path.join(self.media_root, 'uploads', 'orphan.jpg')
+        os.makedirs(os.path.dirname(orphan))
+        with open(orphan, 'wb') as fh:
+            fh.write(b'stale')
+
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(media.file.path))
+
+
+class MediaServingTests(TempMediaRootMixin, TestCase):
+    payload = bytes(range(256)) * 4
+
+    def setUp(self):
+        super().setUp()
+        self.media = MediaFile.objects.create(file=SimpleUploadedFile('clip.mp4', self.payload))
+        self.url = self.media.file.url
+
+    def test_full_and_ranged_responses(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.payload)
+        self.assertEqual(response['ETag'], f'"{self.media.content_hash}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.payload)}')
+        self.assertEqual(b''.join(response.streaming_content), self.payload[100:200])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(response.streaming_content), self.payload[-10:])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=5000-'})
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.payload)}'))
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        # A stale If-Range gets the whole file instead of a mismatched slice
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SENDFILE={'BACKEND': 'x-accel-redirect', 'INTERNAL_URL': '/protected-media/'})
+    def test_offload_to_front_server(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.media.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_private_and_missing_paths_are_404(self):
+        for path in ('chunked/x.part', '../manage.py', 'cas/none.jpg'):
+            self.assertEqual(self.client.get(f'/media/{path}').status_code, 404)
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_static_page_served_from_cache(self):
+        first = self.client.get(reverse('history'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('history'))
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(cache_stats()['history'], {'hits': 1, 'misses': 1})
+
+    def test_prayer_list_invalidated_precisely(self):
+        prayer = PrayerRequest.objects.create(name='Anna', message='For the sick', approved=True)
+        self.assertContains(self.client.get(reverse('services')), 'For the sick')
+        self.client.get(reverse('services'))
+        self.assertEqual(cache_stats()['prayer_list'], {'hits': 1, 'misses': 1})
+
+        # Unapproved prayers can't appear in the list, so the cache is kept
+        PrayerRequest.objects.create(name='Ben', message='Pending', approved=False)
+        self.client.get(reverse('services'))
+        self.assertEqual(cache_stats()['prayer_list']['misses'], 1)
+
+        PrayerRequest.objects.create(name='Cara', message='For peace', approved=True)
+        self.assertContains(self.client.get(reverse('services')), 'For peace')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('increment_prayer', args=[prayer.pk]))
+        self.assertContains(self.client.get(reverse('services')), 'Pray (1)')
+
+        prayer.delete()
+        self.assertNotContains(self.client.get(reverse('services')), 'For the sick')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'mainapp.cache_backends.SQLiteCache', 'LOCATION': ':memory:'}})
+class SQLiteCacheTests(TestCase):
+    def test_basic_operations(self):
+        from django.core.cache import caches
+
+        backend = caches['default']
+        with tempfile.TemporaryDirectory() as directory:
+            backend.location = os.path.join(directory, 'cache.sqlite3')
+            backend.set('a', {'x': 1})
+            self.assertEqual(backend.get('a'), {'x': 1})
+            self.assertFalse(backend.add('a', 2))
+            self.assertTrue(backend.add('b', 2))
+            self.assertEqual(backend.incr('b', 3), 5)
+            backend.set('gone', 1, timeout=-1)
+            self.assertIsNone(backend.get('gone'))
+            self.assertEqual(backend.get_many(['a', 'b', 'gone']), {'a': {'x': 1}, 'b': 5})
+            self.assertTrue(backend.delete('a'))
+            with self.assertRaises(ValueError):
+                backend.incr('a')
+            backend._local.connection.close()
+
+
+class AssetBundleTests(TestCase):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.build_dir, ignore_errors=True)
+        build_override = override_settings(ASSET_BUILD_DIR=self.build_dir)
+        build_override.enable()
+        self.addCleanup(build_override.disable)
+
+    def test_templates_use_sources_until_built(self):
+        response = self.client.get(reverse('gallery'))
+        self.assertContains(response, '/static/mainapp/css/gallery.css')
+        self.assertNotContains(response, '<style>')
+
+        call_command('build_assets', stdout=StringIO())
+        manifest = assets.load_manifest()
+        response = self.client.get(reverse('gallery'))
+        self.assertContains(response, f"/static/bundles/{manifest['gallery.css']}")
+        self.assertContains(response, f"/static/bundles/{manifest['gallery.js']}")
+
+        path = os.path.join(self.build_dir, manifest['base.css'])
+        with open(path, 'rb') as fh, gzip.open(f'{path}.gz') as gz:
+            self.assertEqual(fh.read(), gz.read())
+        self.assertIn('url("../images/pally1.jpeg")', open(path).read())
+
+    def test_minifiers(self):
+        css = '/* c */ a { color: red ; }\nb{margin:0}\na{ color: red }\n.x::after { content: " { ; " }'
+        self.assertEqual(assets.dedupe_css(assets.minify_css(css)), 'b{margin:0}a{color:red}.x::after{content:" { ; "}')
+
+        js = (
+            "// comment\n"
+            "const url = 'http://example.com'; /* block */\n"
+            "    const t = `a // ${ {x: 1}.x } /* b */`;\n"
+            "const r = /\\/\\*[^/]*/g; const half = 4 / 2;\n"
+        )
+        self.assertEqual(assets.minify_js(js), (
+            "const url = 'http://example.com';\n"
+            "const t = `a // ${ {x: 1}.x } /* b */`;\n"
+            "const r = /\\/\\*[^/]*/g; const half = 4 / 2;"
+        ))
+
+
+class StaticImageTests(TestCase):
+    def setUp(self):
+        source_dir = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        for directory in (source_dir, self.static_root):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        os.makedirs(os.path.join(source_dir, 'images'))
+        with open(os.path.join(source_dir, 'images', 'hall.jpg'), 'wb') as fh:
+            fh.write(make_image(size=(800, 600)).read())
+
+        static_override = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=self.static_root,
+            STATICFILES_DIRS=[source_dir],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATIC_IMAGE_WIDTHS=(200, 400),
+        )
+        static_override.enable()
+        self.addCleanup(static_override.disable)
+
+    def render_picture(self):
+        return Template("{% load assets %}{% picture 'images/hall.jpg' alt='Hall' class='event-img' %}").render(Context())
+
+    def test_collectstatic_builds_responsive_images(self):
+        self.assertEqual(self.render_picture(), (
+            '<img src="/static/images/hall.jpg" alt="Hall" class="event-img" loading="lazy" decoding="async">'
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        entry = static_images.responsive_image('images/hall.jpg')
+        self.assertEqual((entry['width'], entry['height']), (800, 600))
+        self.assertEqual([s['width'] for s in entry['sources']['image/webp']], [200, 400])
+        for sources in entry['sources'].values():
+            for source in sources:
+                self.assertTrue(os.path.exists(os.path.join(self.static_root, source['name'])))
+
+        html = self.render_picture()
+        self.assertIn('<source type="image/webp" srcset="/static/images/hall_200w.webp 200w, /static/images/hall_400w.webp 400w"', html)
+        self.assertIn('srcset="/static/images/hall_200w.jpg 200w, /static/images/hall_400w.jpg 400w"', html)
+        self.assertIn('width="800" height="600"', html)
+
+        # A second run recognises its own output and doesn't recompress again
+        mtime = os.stat(os.path.join(self.static_root, 'images', 'hall_200w.webp')).st_mtime_ns
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertEqual(os.stat(os.path.join(self.static_root, 'images', 'hall_200w.webp')).st_mtime_ns, mtime)
+
+
+class SQLiteTuningTests(TransactionTestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        connection.close()
+        pragmas = current_pragmas(connection, ['journal_mode', 'synchronous', 'busy_timeout', 'temp_store'])
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000, 'temp_store': 2})
+
+    def test_rejects_unsafe_pragmas(self):
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'WAL; DROP TABLE mainapp_prayerrequest'})
+
+    @override_settings(PRAYER_COUNTER={'BACKEND': 'mainapp.counters.DirectPrayerCounter'})
+    def test_concurrent_submissions_and_increments(self):
+        prayer = PrayerRequest.objects.create(name='Mary', message='Pray for my family', approved=True)
+        statuses = []
+
+        addresses = iter(range(1, 7))
+
+        def write():
+            # Separate visitors, each within the rate limits
+            address = f'10.0.0.{next(addresses)}'
+            client = Client(REMOTE_ADDR=address)
+            for i in range(10):
+                statuses.append(client.post(
+                    reverse('submit_prayer_ajax'), {'name': f'Anna {address}', 'message': f'Request {i}'},
+                    headers={'X-Requested-With': 'XMLHttpRequest'},
+                ).status_code)
+                statuses.append(client.post(reverse('increment_prayer', args=[prayer.pk])).status_code)
+
+        self.assertEqual(run_in_threads(write, threads=6), [])
+        self.assertEqual(set(statuses), {200})
+        prayer.refresh_from_db()
+        self.assertEqual(prayer.prayer_count, 60)
+        self.assertEqual(PrayerRequest.objects.count(), 61)
+
+
+class ReadReplicaRoutingTests(TransactionTestCase):
+    """Primary and replica as two SQLite files, synced by ``sync_replicas``."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        # Registered after the test runner set up its databases, so it is
+        # left alone apart from being flushed between tests
+        connections.settings['replica'] = {
+            **connections.settings['default'], 'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        cls.databases = cls.databases | {'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        connections.settings.pop('replica')
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        routing = override_settings(DATABASE_ROUTING={'PRIMARY': 'default', 'REPLICAS': ['replica']})
+        routing.enable()
+        self.addCleanup(routing.disable)
+        self.first = PrayerRequest.objects.create(name='Mary', message='Pray for my family', approved=True)
+        call_command('sync_replicas', stdout=StringIO())
+
+    def visible(self, prayer):
+        return PrayerRequest.objects.filter(pk=prayer.pk).exists()
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        second = PrayerRequest.objects.create(name='Anna', message='Healing', approved=True)
+        self.assertEqual(second._state.db, 'default')
+        self.assertTrue(self.visible(self.first))
+        self.assertFalse(self.visible(second))  # not replicated yet
+        with use_primary():
+            self.assertTrue(self.visible(second))
+
+        call_command('sync_replicas', stdout=StringIO())
+        self.assertTrue(self.visible(second))
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        seen = {}
+
+        def view(request):
+            if request.method == 'POST':
+                seen['prayer'] = PrayerRequest.objects.create(name='Anna', message='Healing', approved=True)
+            return HttpResponse(self.visible(seen['prayer']))
+
+        middleware = ReadYourWritesMiddleware(view)
+        factory = RequestFactory()
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'True')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # The redirect after the POST still shows the new prayer
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        self.assertEqual(middleware(request).content, b'True')
+        # Other visitors read the replica
+        self.assertEqual(middleware(factory.get('/')).content, b'False')
+        self.assertFalse(is_pinned())
+
+
+class PrayerEventTests(TestCase):
+    def setUp(self):
+        # A fresh broker for every test
+        events_override = override_settings(
+            PRAYER_EVENTS={'OPTIONS': {'coalesce_interval': 60, 'backlog': 3}, 'KEEPALIVE': 1},
+        )
+        events_override.enable()
+        self.addCleanup(events_override.disable)
+        self.broker = get_broker()
+
+    def test_publish_and_replay(self):
+        with self.broker.subscribe() as subscription:
+            self.broker.publish('delete', {'id': 1})
+            self.assertEqual(subscription.get(timeout=1), Event(1, 'delete', {'id': 1}))
+        for i in range(2, 6):
+            self.broker.publish('delete', {'id': i})
+
+        with self.broker.subscribe(last_event_id=3) as subscription:
+            self.assertEqual([subscription.get(timeout=1).id for _ in range(2)], [4, 5])
+        # Older than the backlog: the browser has to start over
+        with self.broker.subscribe(last_event_id=1) as subscription:
+            self.assertEqual(subscription.get(timeout=1).type, RESET)
+
+    def test_cache_broker_shares_events_between_processes(self):
+        cache.clear()
+        publisher = CacheBroker(poll_interval=3600)
+        worker = CacheBroker(poll_interval=3600)  # stands in for another process
+        with worker.subscribe() as subscription:
+            publisher.publish('delete', {'id': 1})
+            publisher.publish('delete', {'id': 2})
+            self.assertEqual(worker.poll(0), 2)
+            self.assertEqual([subscription.get(timeout=1).id for _ in range(2)], [1, 2])
+
+    def test_cache_broker_waits_for_an_event_still_being_published(self):
+        cache.clear()
+        publisher = CacheBroker(poll_interval=3600)
+        worker = CacheBroker(poll_interval=3600, gap_timeout=3600)
+        with worker.subscribe() as subscription:
+            # A publisher has taken number 1 but not stored the event yet
+            cache.add(publisher.sequence_key, 0, timeout=None)
+            cache.incr(publisher.sequence_key)
+            publisher.publish('delete', {'id': 2})
+            self.assertEqual(worker.poll(0), 0)
+            self.assertIsNone(subscription.get(timeout=0.01))
+
+            cache.set(f'{publisher.key_prefix}:1', ('delete', {'id': 1}))
+            self.assertEqual(worker.poll(0), 2)
+            self.assertEqual([subscription.get(timeout=1).data['id'] for _ in range(2)], [1, 2])
+
+            # An event that never arrives is given up on after gap_timeout
+            cache.incr(publisher.sequence_key)
+            publisher.publish('delete', {'id': 4})
+            self.assertEqual(worker.poll(2), 2)
+            worker.gap_timeout = 0
+            self.assertEqual(worker.poll(2), 4)
+            self.assertEqual(subscription.get(timeout=1).data['id'], 4)
+
+    def test_prayer_changes_are_published_after_commit(self):
+        with self.broker.subscribe() as subscription:
+            with self.captureOnCommitCallbacks(execute=True):
+                prayer = PrayerRequest.objects.create(name='Anna', message='Healing', approved=True)
+            event = subscription.get(timeout=1)
+            self.assertEqual((event.type, event.data['id'], event.data['name']), ('prayer', prayer.pk, 'Anna'))
+
+            with self.captureOnCommitCallbacks(execute=True):
+                prayer.delete()
+            self.assertEqual(subscription.get(timeout=1).type, 'delete')
+
+            with self.captureOnCommitCallbacks(execute=True):
+                PrayerRequest.objects.create(name='Anna', message='Not yet approved')
+            self.assertIsNone(subscription.get(timeout=0.01))
+
+    @override_settings(PRAYER_COUNTER={'BACKEND': 'mainapp.counters.DirectPrayerCounter'})
+    def test_count_changes_are_coalesced(self):
+        prayer = PrayerRequest.objects.create(name='Anna', message='Healing', approved=True)
+        with self.broker.subscribe() as subscription:
+            for _ in range(5):
+                with self.captureOnCommitCallbacks(execute=True):
+                    get_prayer_counter().increment(prayer.pk)
+            self.assertIsNone(subscription.get(timeout=0.01))
+            self.assertEqual(self.broker.flush_counts(), 1)
+            event = subscription.get(timeout=1)
+            self.assertEqual((event.type, event.data), ('count', {'id': prayer.pk, 'prayer_count': 5}))
+            self.assertIsNone(subscription.get(timeout=0.01))
+
+    def test_event_stream_view(self):
+        response = self.client.get(reverse('prayer_events'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(next(iter(response.streaming_content)), b'retry: 3000\n\n')
+
+    def test_event_stream(self):
+        stream = stream_events(self.broker)
+        self.assertEqual(next(stream), 'retry: 3000\n\n')
+        self.broker.publish('delete', {'id': 7})
+        self.assertEqual(next(stream), 'id: 1\nevent: delete\ndata: {"id": 7}\n\n')
+        self.assertEqual(next(stream), ': keep-alive\n\n')
+        # What the server does when the browser goes away
+        stream.close()
+        self.assertFalse(self.broker.has_subscribers())
+
+    async def test_async_event_stream(self):
+        stream = astream_events(self.broker)
+        self.assertEqual(await anext(stream), 'retry: 3000\n\n')
+        self.broker.publish('count', {'id': 7, 'prayer_count': 2})
+        self.assertEqual(await anext(stream), 'id: 1\nevent: count\ndata: {"id": 7, "prayer_count": 2}\n\n')
+        await stream.aclose()
+        self.assertFalse(self.broker.has_subscribers())
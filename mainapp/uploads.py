@@ -0,0 +1,217 @@
+"""
+Chunked, resumable uploads.
+
+A client creates an upload session with the file's name, size and
+(optionally) SHA-256, then PUTs the bytes in order, each request carrying
+the offset it starts at. The request body is copied to disk in fixed-size
+blocks, so memory use doesn't depend on the file or chunk size. If the
+connection drops the client asks for the current offset and carries on
+from there. Once every byte has arrived the file is checked and moved (not
+copied) into a ``MediaFile``.
+
+A chunk is first read into a file of its own and only then, under a lock
+on the upload's ``.part`` file, written at the offset stored at that
+moment. A stalled request that is overtaken by its retry therefore can't
+overwrite or cut off bytes the upload already counts, and a slow client
+never holds the lock.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+
+from mainapp.models import ChunkedUpload, MediaFile
+
+# Size of the blocks copied from the request stream to disk
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A chunk or finalize request that can't be applied; carries an HTTP status."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class AssembledUpload(File):
+    """
+    A finished ``.part`` file handed to storage.
+
+    Exposing ``temporary_file_path()`` lets ``FileSystemStorage`` move the
+    file into place instead of streaming a copy of it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_dir():
+    return os.path.join(settings.MEDIA_ROOT, getattr(settings, 'CHUNKED_UPLOAD_DIR', 'chunked'))
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+@contextmanager
+def locked_part(upload):
+    """The ``.part`` file opened for writing, locked against other writers"""
+    with open(part_path(upload), 'r+b') as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield fh
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 ** 3)
+
+
+def max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 ** 2)
+
+
+def describe_upload(upload):
+    """JSON-friendly progress report for an upload session."""
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'progress': upload.progress,
+        'status': upload.status,
+        'media_id': upload.media_id,
+    }
+
+
+def create_upload(filename, size, sha256=''):
+    """Validate and start a new upload session with an empty ``.part`` file."""
+    filename = os.path.basename(filename or '').strip()
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in MediaFile.IMAGE_EXTENSIONS + MediaFile.VIDEO_EXTENSIONS:
+        raise UploadError('Only image and video files can be uploaded.')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('A positive file size is required.')
+    if size > max_upload_size():
+        raise UploadError('File is too large.', status=413)
+    sha256 = (sha256 or '').lower()
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise UploadError('sha256 must be a hex digest.')
+
+    upload = ChunkedUpload.objects.create(filename=filename, size=size, sha256=sha256)
+    os.makedirs(upload_dir(), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, chunk_sha256=''):
+    """
+    Copy ``length`` bytes from ``stream`` into the upload at ``offset``.
+
+    The stored offset only moves forward if the chunk arrived in full,
+    matched its optional checksum and nobody else advanced the upload in
+    the meantime; otherwise the same chunk can simply be sent again.
+    """
+    if upload.status != ChunkedUpload.STATUS_UPLOADING:
+        raise UploadError('Upload is no longer accepting data.', status=409, offset=upload.offset)
+    if offset != upload.offset:
+        raise UploadError('Offset does not match the upload.', status=409, offset=upload.offset)
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError('Chunk is empty or too large.', status=413, offset=upload.offset)
+    if offset + length > upload.size:
+        raise UploadError('Chunk runs past the declared file size.', offset=upload.offset)
+
+    digest = hashlib.sha256()
+    written = 0
+    with tempfile.TemporaryFile(dir=upload_dir()) as chunk:
+        while written < length:
+            block = stream.read(min(COPY_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            chunk.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if written != length:
+            raise UploadError('Chunk was incomplete.', offset=upload.offset)
+        if chunk_sha256 and digest.hexdigest() != chunk_sha256.lower():
+            raise UploadError('Chunk checksum mismatch.', status=422, offset=upload.offset)
+
+        new_offset = offset + written
+        with locked_part(upload) as fh:
+            # Only the offset stored now counts: a retry may have overtaken us
+            upload.refresh_from_db(fields=['offset', 'status'])
+            if upload.status != ChunkedUpload.STATUS_UPLOADING or upload.offset != offset:
+                raise UploadError('Upload was modified concurrently.', status=409, offset=upload.offset)
+            chunk.seek(0)
+            fh.seek(offset)
+            shutil.copyfileobj(chunk, fh, COPY_BLOCK_SIZE)
+            fh.truncate(new_offset)
+            fh.flush()
+            ChunkedUpload.objects.filter(pk=upload.pk).update(offset=new_offset)
+    upload.offset = new_offset
+    return upload
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fail_upload(upload):
+    ChunkedUpload.objects.filter(pk=upload.pk).update(status=ChunkedUpload.STATUS_FAILED)
+    upload.status = ChunkedUpload.STATUS_FAILED
+    os.remove(part_path(upload))
+
+
+def finalize_upload(upload):
+    """Verify the assembled file and turn it into a ``MediaFile``."""
+    if upload.status == ChunkedUpload.STATUS_COMPLETE:
+        return upload.media
+    if upload.offset != upload.size:
+        raise UploadError('Upload is not complete yet.', status=409, offset=upload.offset)
+
+    # Claim the upload first so a repeated "complete" request can't create
+    # a second MediaFile from the same bytes.
+    claimed = ChunkedUpload.objects.filter(
+        pk=upload.pk, status=ChunkedUpload.STATUS_UPLOADING, offset=upload.size
+    ).update(status=ChunkedUpload.STATUS_COMPLETE)
+    if not claimed:
+        upload.refresh_from_db()
+        if upload.status == ChunkedUpload.STATUS_COMPLETE:
+            return upload.media
+        raise UploadError('Upload can no longer be completed.', status=409, offset=upload.offset)
+
+    path = part_path(upload)
+    if os.path.getsize(path) != upload.size:
+        fail_upload(upload)
+        raise UploadError('The assembled file has the wrong size; the upload must be restarted.', status=422)
+    if upload.sha256 and file_sha256(path) != upload.sha256:
+        fail_upload(upload)
+        raise UploadError('Checksum mismatch; the upload must be restarted.', status=422)
+
+    media = MediaFile()
+    try:
+        with open(path, 'rb') as fh:
+            media.file.save(upload.filename, AssembledUpload(fh, name=path), save=True)
+    except Exception:
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status=ChunkedUpload.STATUS_UPLOADING)
+        raise
+    if os.path.exists(path):
+        os.remove(path)
+
+    upload.media = media
+    upload.status = ChunkedUpload.STATUS_COMPLETE
+    upload.save(update_fields=['media', 'status', 'updated_at'])
+    return media
@@ -1,21 +1,40 @@
 # urls.py
+from django.conf import settings
 from django.urls import path
-from mainapp import views
+from mainapp import api, async_views, views
+
+# Native async AJAX endpoints under ASGI (see mainapp.async_views)
+ajax_views = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('home/', views.home, name='home'),
     path('services/', views.services, name='services'),
     path('gallery/', views.gallery, name='gallery'),
+    path('gallery/page/', views.gallery_page, name='gallery_page'),
     path('administration/', views.administration, name='administration'),
     path('contact/', views.contact_view, name='contact'),  # Using contact_view function
     path('history/', views.history, name='history'),
     path('events/', views.events, name='events'),
     path('manage-prayers/', views.manage_prayers, name='manage_prayers'),
+    path('prayers/search/', views.prayer_search, name='prayer_search'),
     
     # AJAX endpoints
-    path('delete-prayer/<int:prayer_id>/', views.delete_prayer, name='delete_prayer'),
-    path('increment-prayer/<int:prayer_id>/', views.increment_prayer_count, name='increment_prayer'),
-    path('delete-gallery-media/<int:media_id>/', views.delete_gallery_media, name='delete_gallery_media'),
-    path('submit-prayer-ajax/', views.submit_prayer_ajax, name='submit_prayer_ajax'),
+    path('delete-prayer/<int:prayer_id>/', ajax_views.delete_prayer, name='delete_prayer'),
+    path('increment-prayer/<int:prayer_id>/', ajax_views.increment_prayer_count, name='increment_prayer'),
+    path('delete-gallery-media/<int:media_id>/', ajax_views.delete_gallery_media, name='delete_gallery_media'),
+    path('submit-prayer-ajax/', ajax_views.submit_prayer_ajax, name='submit_prayer_ajax'),
+    path('prayers/events/', ajax_views.prayer_events, name='prayer_events'),
+    
+    # Read-only JSON API
+    path('api/prayers/', api.prayer_list, name='api_prayer_list'),
+    path('api/prayers/<int:pk>/', api.prayer_detail, name='api_prayer_detail'),
+    
+    # Prometheus scrapes
+    path('metrics', views.metrics_view, name='metrics'),
+    
+    # Chunked, resumable media uploads
+    path('uploads/', views.chunked_upload_create, name='chunked_upload_create'),
+    path('uploads/<uuid:upload_id>/', views.chunked_upload_detail, name='chunked_upload_detail'),
+    path('uploads/<uuid:upload_id>/complete/', views.chunked_upload_complete, name='chunked_upload_complete'),
 ]
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Video metadata and poster frames via ffprobe/ffmpeg.
+
+Both tools are optional. When they are missing, ``decoder_available()``
+returns False and callers mark the video as unprocessed instead of failing.
+"""
+import json
+import shutil
+import subprocess
+
+from django.conf import settings
+
+
+class VideoProcessingError(Exception):
+    pass
+
+
+def _binary(setting, default):
+    return shutil.which(getattr(settings, setting, default))
+
+
+def decoder_available():
+    return bool(_binary('FFPROBE_BINARY', 'ffprobe') and _binary('FFMPEG_BINARY', 'ffmpeg'))
+
+
+def _run(args, timeout):
+    try:
+        result = subprocess.run(args, capture_output=True, timeout=timeout, check=False)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise VideoProcessingError(str(e)) from e
+    if result.returncode != 0:
+        raise VideoProcessingError(result.stderr.decode(errors='replace').strip()[-500:])
+    return result.stdout
+
+
+def probe_video(path, timeout=30):
+    """Return ``{'duration', 'width', 'height'}`` for the first video stream."""
+    output = _run([
+        _binary('FFPROBE_BINARY', 'ffprobe'), '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height:format=duration',
+        '-of', 'json', str(path),
+    ], timeout)
+    try:
+        data = json.loads(output)
+        stream = data['streams'][0]
+        duration = float(data.get('format', {}).get('duration') or 0) or None
+        return {'duration': duration, 'width': int(stream['width']), 'height': int(stream['height'])}
+    except (ValueError, KeyError, IndexError) as e:
+        raise VideoProcessingError('No video stream found.') from e
+
+
+def extract_poster(path, at_seconds=1.0, max_width=1280, timeout=60):
+    """Return a JPEG of the frame at ``at_seconds``, scaled down to ``max_width``."""
+    return _run([
+        _binary('FFMPEG_BINARY', 'ffmpeg'), '-v', 'error',
+        '-ss', f'{at_seconds:.2f}', '-i', str(path),
+        '-frames:v', '1',
+        '-vf', f"scale='min({max_width},iw)':-2",
+        '-f', 'image2', '-c:v', 'mjpeg', '-q:v', '4',
+        'pipe:1',
+    ], timeout)
@@ -1,28 +1,51 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from mainapp.forms import MediaUploadForm, PrayerRequestForm, ContactForm
-from mainapp.models import MediaFile, PrayerRequest, ContactMessage
+from mainapp.models import ChunkedUpload, MediaFile, PrayerRequest, ContactMessage
+from mainapp.caching import cache_page_as
+from mainapp.counters import get_prayer_counter
+from mainapp import media_serving, metrics, moderation
+from mainapp.events import get_broker, last_event_id, stream_events
+from mainapp.pagination import InvalidCursor, paginate_keyset
+from mainapp.ratelimit import rate_limit
+from mainapp.search import get_search_backend
+from mainapp.submissions import CREATED, DuplicatePrayer, request_key, submit_prayer
+from mainapp.uploads import (
+    UploadError, create_upload, describe_upload, finalize_upload, max_upload_size, write_chunk,
+)
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
-import os
+from django.views.decorators.http import require_GET, require_POST
+import json
+import logging
 
+logger = logging.getLogger(__name__)
 
+# Sort key for gallery pages; backed by the (uploaded_at, id) index
+GALLERY_KEYSET = ('uploaded_at', 'id')
+
+PRAYER_SEARCH_LIMIT = 20
+
+
+@rate_limit('prayer_submit')
 def home(request):
-    # Get approved prayers for display
-    prayers = PrayerRequest.objects.filter(approved=True).order_by('-submitted_at')[:10]
-    
     if request.method == "POST":
         form = PrayerRequestForm(request.POST)
         if form.is_valid():
             try:
-                prayer = form.save(commit=False)
-                prayer.approved = True  # Auto-approve for home page
-                prayer.save()
+                # Auto-approve for home page
+                submit_prayer(form.cleaned_data['name'], form.cleaned_data['message'], True, request_key(request))
                 messages.success(request, 'Your sacred message has been submitted successfully!')
                 return redirect('home')
+            except DuplicatePrayer:
+                messages.info(request, 'We have already received this message from you.')
+                return redirect('home')
             except Exception as e:
                 messages.error(request, 'An error occurred while submitting your message. Please try again.')
         else:
@@ -30,12 +53,8 @@ def home(request):
     else:
         form = PrayerRequestForm()  # Create empty form for GET requests
     
-    # Debug: Print to console to verify form is being created
-    print(f"Form object: {form}")
-    print(f"Form fields: {form.fields if form else 'No form'}")
-    
+    # The prayer list itself is rendered by {% prayer_list %} from the cache
     context = {
-        'prayers': prayers,
         'form': form,
     }
     
@@ -44,28 +63,30 @@ def home(request):
 
 @require_POST
 @csrf_exempt
+@rate_limit('prayer_increment', as_json=True)
 def increment_prayer_count(request, prayer_id):
     """
     Increment prayer count for a specific prayer request
     """
     try:
-        prayer = get_object_or_404(PrayerRequest, id=prayer_id)
-        prayer.increment_prayer_count()
+        prayer_count = get_prayer_counter().increment(prayer_id)
+        metrics.PRAYERS_PRAYED.inc()
         
         return JsonResponse({
             'success': True,
-            'prayer_count': prayer.prayer_count
+            'prayer_count': prayer_count
         })
         
     except PrayerRequest.DoesNotExist:
         return JsonResponse({'error': 'Prayer request not found'}, status=404)
-    except Exception as e:
-        print(f"Error incrementing prayer count: {e}")
+    except Exception:
+        logger.exception('Failed to increment prayer %s', prayer_id)
         return JsonResponse({'error': 'Failed to increment prayer count'}, status=500)
 
 
 @require_http_methods(["DELETE"])
 @csrf_exempt
+@rate_limit('delete', methods=['DELETE'], as_json=True)
 def delete_prayer(request, prayer_id):
     """
     Delete a prayer request
@@ -82,25 +103,28 @@ def delete_prayer(request, prayer_id):
         
     except PrayerRequest.DoesNotExist:
         return JsonResponse({'error': 'Prayer request not found'}, status=404)
-    except Exception as e:
-        print(f"Error deleting prayer: {e}")
+    except Exception:
+        logger.exception('Failed to delete prayer %s', prayer_id)
         return JsonResponse({'error': 'Failed to delete prayer request'}, status=500)
 
 
+@cache_page_as('index')
 def index(request):
     return render(request, 'mainapp/index.html')
 
 
+@cache_page_as('administration')
 def administration(request):
     return render(request, 'mainapp/administration.html')
 
 
+@rate_limit('contact')
 def contact_view(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
         if form.is_valid():
-            # Save the message to the database
-            contact_message = form.save()
+            # Save the message; the parish office hears of it in the next digest
+            form.save()
             
             # Show success message
             messages.success(request, '✠ Blessed be your message! Our parish family will respond to you with Christian love and care. Peace be with you. ✠')
@@ -113,6 +137,7 @@ def contact_view(request):
     return render(request, 'mainapp/contact.html', {'form': form})
 
 
+@rate_limit('upload')
 def gallery(request):
     if request.method == 'POST':
         form = MediaUploadForm(request.POST, request.FILES)
@@ -123,13 +148,143 @@ def gallery(request):
         else:
             messages.error(request, 'Error uploading media. Please try again.')
     
-    media_files = MediaFile.objects.all().order_by('-uploaded_at')
+    # Only the first page is rendered; the rest is fetched by gallery_page
+    kind = gallery_kind(request)
+    page = paginate_keyset(gallery_queryset(kind), GALLERY_KEYSET, page_size=gallery_page_size())
     form = MediaUploadForm()
     
-    return render(request, 'mainapp/gallery.html', {'form': form, 'media_files': media_files})
+    return render(request, 'mainapp/gallery.html', {
+        'form': form,
+        'media_files': page.items,
+        'next_cursor': page.next_cursor,
+        'kind': kind,
+        'chunk_size': getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 4 * 1024 ** 2),
+        'max_upload_size': max_upload_size(),
+    })
+
+
+@require_GET
+def gallery_page(request):
+    """
+    Return the next page of gallery items for infinite scroll
+    """
+    try:
+        page = paginate_keyset(
+            gallery_queryset(gallery_kind(request)),
+            GALLERY_KEYSET,
+            cursor=request.GET.get('cursor'),
+            page_size=gallery_page_size(request.GET.get('limit')),
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    html = render_to_string('mainapp/partials/gallery_items.html', {'media_files': page.items}, request=request)
+    return JsonResponse({
+        'html': html,
+        'count': len(page.items),
+        'next_cursor': page.next_cursor,
+    })
+
+
+def gallery_kind(request):
+    """?kind=image|video, or None for everything"""
+    kind = request.GET.get('kind')
+    return kind if kind in (MediaFile.KIND_IMAGE, MediaFile.KIND_VIDEO) else None
+
+
+def gallery_queryset(kind=None):
+    """Gallery rows, filtered in SQL on the indexed kind column"""
+    queryset = MediaFile.objects.all()
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    return queryset
+
+
+def gallery_page_size(requested=None):
+    """Page size from ?limit=, clamped to GALLERY_MAX_PAGE_SIZE"""
+    default = getattr(settings, 'GALLERY_PAGE_SIZE', 24)
+    try:
+        size = int(requested) if requested else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, getattr(settings, 'GALLERY_MAX_PAGE_SIZE', 60)))
+
+
+@require_POST
+@rate_limit('upload', as_json=True)
+def chunked_upload_create(request):
+    """
+    Start a resumable upload: {"filename": ..., "size": ..., "sha256": optional}
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    
+    try:
+        upload = create_upload(data.get('filename'), data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    
+    return upload_response(upload, status=201)
+
+
+@require_http_methods(["GET", "HEAD", "PUT"])
+def chunked_upload_detail(request, upload_id):
+    """
+    GET reports progress; PUT appends the request body at the Upload-Offset header
+    """
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id)
+    
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required'}, status=400)
+        
+        try:
+            write_chunk(upload, offset, request, length, request.headers.get('X-Chunk-SHA256', ''))
+        except UploadError as e:
+            return upload_response(upload, status=e.status, error=str(e))
+    
+    return upload_response(upload)
+
+
+@require_POST
+def chunked_upload_complete(request, upload_id):
+    """
+    Verify the checksum and turn the finished upload into a gallery MediaFile
+    """
+    upload = get_object_or_404(ChunkedUpload, pk=upload_id)
+    try:
+        finalize_upload(upload)
+    except UploadError as e:
+        return upload_response(upload, status=e.status, error=str(e))
+    
+    return upload_response(upload)
+
+
+def upload_response(upload, status=200, error=None):
+    data = describe_upload(upload)
+    if error:
+        data['error'] = error
+    response = JsonResponse(data, status=status)
+    response['Upload-Offset'] = str(upload.offset)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """
+    Media files with Range, ETag and conditional GET support
+    """
+    return media_serving.serve(request, path)
 
 
 @require_http_methods(["DELETE"])
+@rate_limit('delete', methods=['DELETE'], as_json=True)
 def delete_gallery_media(request, media_id):
     """
     Delete a gallery media item
@@ -137,14 +292,8 @@ def delete_gallery_media(request, media_id):
     try:
         media = get_object_or_404(MediaFile, id=media_id)
         
-        # Delete the physical file
-        if media.file and hasattr(media.file, 'path') and os.path.isfile(media.file.path):
-            try:
-                os.remove(media.file.path)
-            except OSError:
-                pass
-        
-        # Delete the database record
+        # The stored file is shared between identical uploads; it is removed
+        # by the post_delete signal once nothing references it any more.
         media.delete()
         
         return JsonResponse({
@@ -158,15 +307,16 @@ def delete_gallery_media(request, media_id):
         return JsonResponse({'error': 'Failed to delete media'}, status=500)
 
 
+@rate_limit('prayer_submit')
 def services(request):
-    prayers = PrayerRequest.objects.filter(approved=True).order_by('-submitted_at')[:10]
-    
     if request.method == "POST":
         form = PrayerRequestForm(request.POST)
         if form.is_valid():
-            prayer = form.save(commit=False)
-            prayer.approved = True
-            prayer.save()
+            try:
+                submit_prayer(form.cleaned_data['name'], form.cleaned_data['message'], True, request_key(request))
+            except DuplicatePrayer:
+                messages.info(request, 'We have already received this prayer request from you.')
+                return redirect('services')
             messages.success(request, 'Your prayer request has been submitted successfully!')
             return redirect('services')
         else:
@@ -174,49 +324,63 @@ def services(request):
     else:
         form = PrayerRequestForm()
         
-    return render(request, 'mainapp/services.html', {'form': form, 'prayers': prayers})
+    return render(request, 'mainapp/services.html', {'form': form})
 
 
+@cache_page_as('history')
 def history(request):
     return render(request, 'mainapp/history.html')
 
 
+@cache_page_as('events')
 def events(request):
     return render(request, 'mainapp/events.html')
 
 
+@staff_member_required
 def manage_prayers(request):
-    prayers = PrayerRequest.objects.all().order_by('-submitted_at')
-        
+    """
+    Moderation queue: keyset pages of prayers by status, with bulk actions
+    """
     if request.method == "POST":
-        prayer_id = request.POST.get("prayer_id")
         action = request.POST.get("action")
+        ids = moderation.parse_ids(request.POST.getlist("ids"))
         
-        if prayer_id and action:
-            try:
-                prayer = PrayerRequest.objects.get(id=prayer_id)
-                
-                if action == "approve":
-                    prayer.approved = True
-                    prayer.save()
-                    messages.success(request, f'Prayer request from {prayer.name} has been approved.')
-                elif action == "delete":
-                    prayer.delete()
-                    messages.success(request, 'Prayer request has been deleted.')
-                elif action == "unapprove":
-                    prayer.approved = False
-                    prayer.save()
-                    messages.success(request, f'Prayer request from {prayer.name} has been unapproved.')
-                
-            except PrayerRequest.DoesNotExist:
-                messages.error(request, 'Prayer request not found.')
+        try:
+            changed = moderation.bulk_moderate(action, ids)
+        except moderation.ModerationError as e:
+            messages.error(request, str(e))
+        else:
+            if ids:
+                messages.success(request, f'{changed} prayer request(s) {action}d.')
+            else:
+                messages.error(request, 'Select at least one prayer request.')
         
-        return redirect("manage_prayers")
+        # Back to the same filter and page
+        return redirect(request.get_full_path())
+    
+    status = moderation.moderation_status(request.GET.get('status'))
+    try:
+        page = paginate_keyset(
+            moderation.moderation_queryset(status),
+            moderation.MODERATION_KEYSET,
+            cursor=request.GET.get('cursor'),
+            page_size=moderation.moderation_page_size(request.GET.get('limit')),
+        )
+    except InvalidCursor:
+        return redirect(f"{reverse('manage_prayers')}?status={status}")
     
-    return render(request, "admin/manage_prayers.html", {"prayers": prayers})
+    return render(request, "mainapp/admin/manage_prayers.html", {
+        "prayers": page.items,
+        "next_cursor": page.next_cursor,
+        "status": status,
+        "statuses": moderation.STATUSES,
+        "is_first_page": not request.GET.get('cursor'),
+    })
 
 
 @csrf_exempt
+@rate_limit('prayer_submit', as_json=True)
 def submit_prayer_ajax(request):
     """
     AJAX endpoint for submitting prayer requests
@@ -227,11 +391,7 @@ def submit_prayer_ajax(request):
         
         if name and message:
             try:
-                prayer = PrayerRequest.objects.create(
-                    name=name,
-                    message=message,
-                    approved=True
-                )
+                prayer, outcome = submit_prayer(name, message, approved=True, key=request_key(request))
                 
                 return JsonResponse({
                     'success': True,
@@ -241,8 +401,15 @@ def submit_prayer_ajax(request):
                         'name': prayer.name,
                         'message': prayer.message,
                         'submitted_at': prayer.submitted_at.strftime("%b %d, %Y")
-                    }
+                    },
+                    # Already on the prayer wall: a retry or the same prayer again
+                    'duplicate': outcome != CREATED,
                 })
+            except DuplicatePrayer:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'This prayer request has already been submitted.'
+                }, status=409)
             except Exception as e:
                 return JsonResponse({
                     'success': False,
@@ -257,4 +424,45 @@ def submit_prayer_ajax(request):
     return JsonResponse({
         'success': False,
         'message': 'Invalid request method.'
-    }, status=405)
\ No newline at end of file
+    }, status=405)
+
+
+@require_GET
+def prayer_search(request):
+    """
+    Ranked full-text search over approved prayers, with highlighted snippets
+    """
+    query = request.GET.get('q', '').strip()
+    hits = []
+    if query:
+        hits = get_search_backend().search(
+            PrayerRequest.objects.filter(approved=True), query, limit=PRAYER_SEARCH_LIMIT
+        )
+    
+    return render(request, 'mainapp/prayer_search.html', {'query': query, 'hits': hits})
+
+
+@require_GET
+def prayer_events(request):
+    """
+    Server-Sent Events stream of prayer-wall changes
+    """
+    stream = stream_events(get_broker(), last_event_id(request))
+    return event_stream_response(stream)
+
+
+def event_stream_response(stream):
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: pass events through as they come
+    return response
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus metrics of every worker process
+    """
+    if not metrics.scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)